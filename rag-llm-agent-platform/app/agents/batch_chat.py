@@ -0,0 +1,255 @@
+"""
+批量对话任务（离线 RAG 工作负载）
+
+问题按 batch_size 分组：每组一次 Embedding 请求、一次批量向量检索（search_many），
+再以 llm_concurrency 为上限并发调用 LLM。相邻两组流水线执行：当前组等待 LLM 时
+下一组已在做向量化和检索。结果按完成顺序追加，可在任务运行期间以 JSONL 流式读取。
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BatchChatJob:
+    """单个批量对话任务：进度、结果与吞吐统计"""
+    
+    def __init__(self, questions: List[Dict], top_k: int):
+        self.id = uuid.uuid4().hex
+        self.questions = questions
+        self.top_k = top_k
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.results: List[Dict] = []
+        self.failed = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.embedding_requests = 0
+        self.search_queries = 0
+        self.llm_calls = 0
+        # 各阶段累计耗时（LLM 为并发调用耗时之和）
+        self.stage_seconds = {"embedding": 0.0, "search": 0.0, "rerank": 0.0, "llm": 0.0}
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+    
+    def record(self, result: Dict):
+        """追加一条结果并唤醒正在读取结果流的客户端"""
+        self.results.append(result)
+        if result.get("error"):
+            self.failed += 1
+        self._notify()
+    
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+    
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+    
+    async def iter_results(self) -> AsyncIterator[Dict]:
+        """按完成顺序输出结果，任务未结束时等待新结果"""
+        index = 0
+        while True:
+            while index < len(self.results):
+                yield self.results[index]
+                index += 1
+            if self.finished:
+                return
+            await self._updated.wait()
+    
+    def report(self) -> Dict:
+        """任务状态与吞吐报告"""
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        completed = len(self.results)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "total": len(self.questions),
+            "completed": completed,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "questions_per_sec": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "embedding_requests": self.embedding_requests,
+            "search_queries": self.search_queries,
+            "llm_calls": self.llm_calls,
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()}
+        }
+
+
+class BatchChatRunner:
+    """批量对话任务的提交、执行与保留"""
+    
+    def __init__(
+        self,
+        agent,
+        batch_size: int = 64,
+        llm_concurrency: int = 16,
+        max_jobs: int = 100
+    ):
+        """
+        Args:
+            agent: RAGAgent（使用其 retriever / vector_store / context_builder / LLM 调用）
+            batch_size: 每次 Embedding 请求与批量检索的问题数
+            llm_concurrency: 单个任务内并发的 LLM 调用数
+            max_jobs: 内存中保留的任务数，超出时淘汰最早结束的任务
+        """
+        self.agent = agent
+        self.batch_size = batch_size
+        self.llm_concurrency = llm_concurrency
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, BatchChatJob]" = OrderedDict()
+    
+    def submit(self, questions: List[Dict], top_k: Optional[int] = None) -> BatchChatJob:
+        """
+        创建任务并在后台开始执行
+        
+        Args:
+            questions: 问题列表：{"id": ..., "message": ...}
+            top_k: 每个问题检索的文档数，默认 settings.TOP_K_RESULTS
+            
+        Returns:
+            新建的任务
+        """
+        job = BatchChatJob(questions, top_k or settings.TOP_K_RESULTS)
+        self._jobs[job.id] = job
+        self._evict()
+        job._task = asyncio.ensure_future(self._run(job))
+        logger.info(f"批量对话任务已提交: job_id={job.id}, questions={len(questions)}")
+        return job
+    
+    def get(self, job_id: str) -> Optional[BatchChatJob]:
+        return self._jobs.get(job_id)
+    
+    async def close(self):
+        """取消仍在运行的任务"""
+        tasks = [job._task for job in self._jobs.values() if job._task and not job._task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _evict(self):
+        """超出保留数量时淘汰最早结束的任务（运行中的任务不淘汰）"""
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+    
+    async def _run(self, job: BatchChatJob):
+        job.status = "running"
+        job.started_at = time.time()
+        semaphore = asyncio.Semaphore(self.llm_concurrency)
+        # 最多两组同时在途：一组等待 LLM，另一组做向量化与检索；
+        # 一组完成后才出队，失败时该组其余问题与后续组一并取消
+        in_flight: Deque[List[asyncio.Task]] = deque()
+        try:
+            for offset in range(0, len(job.questions), self.batch_size):
+                group = job.questions[offset:offset + self.batch_size]
+                docs = await self._retrieve_group(job, group)
+                while len(in_flight) >= 2:
+                    await asyncio.gather(*in_flight[0])
+                    in_flight.popleft()
+                in_flight.append([
+                    asyncio.create_task(self._answer(job, question, question_docs, semaphore))
+                    for question, question_docs in zip(group, docs)
+                ])
+            while in_flight:
+                await asyncio.gather(*in_flight[0])
+                in_flight.popleft()
+        except asyncio.CancelledError:
+            await _cancel_pending(in_flight)
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            # 已排队的组不再继续调用 LLM、向已结束的任务写入结果
+            await _cancel_pending(in_flight)
+            logger.error(f"批量对话任务失败: job_id={job.id}, 错误: {str(e)}", exc_info=True)
+            job.finish("failed", str(e))
+            return
+        
+        job.finish("completed")
+        logger.info(f"批量对话任务完成: {job.report()}")
+    
+    async def _retrieve_group(self, job: BatchChatJob, group: List[Dict]) -> List[Optional[List[Dict]]]:
+        """
+        一组问题：一次 Embedding 请求 + 一次批量检索
+        
+        Returns:
+            与 group 顺序一致的检索结果；本组失败时为 None（问题逐条记为失败）
+        """
+        try:
+            start = time.perf_counter()
+            embeddings = await self.agent.retriever.embed_texts([question["message"] for question in group])
+            job.stage_seconds["embedding"] += time.perf_counter() - start
+            job.embedding_requests += 1
+            
+            start = time.perf_counter()
+            # 启用重排序时多取候选，回答前逐题重排
+            top_k = max(job.top_k, self.agent.reranker.candidates) if self.agent.reranker else job.top_k
+            docs = await self.agent.vector_store.search_many(embeddings, top_k=top_k)
+            job.stage_seconds["search"] += time.perf_counter() - start
+            job.search_queries += 1
+            return docs
+        except Exception as e:
+            logger.error(f"批量检索失败: job_id={job.id}, size={len(group)}, 错误: {str(e)}")
+            for question in group:
+                job.record({"id": question["id"], "message": question["message"], "error": f"检索失败: {str(e)}"})
+            return [None] * len(group)
+    
+    async def _answer(
+        self,
+        job: BatchChatJob,
+        question: Dict,
+        docs: Optional[List[Dict]],
+        semaphore: asyncio.Semaphore
+    ):
+        if docs is None:
+            return
+        if self.agent.reranker:
+            start = time.perf_counter()
+            docs = await self.agent.reranker.rerank(question["message"], docs, top_n=job.top_k)
+            job.stage_seconds["rerank"] += time.perf_counter() - start
+        built = self.agent.context_builder.build(docs)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response, _ = await self.agent._generate(question["message"], built.text)
+            except Exception as e:
+                job.record({"id": question["id"], "message": question["message"], "error": str(e)})
+                return
+            finally:
+                job.stage_seconds["llm"] += time.perf_counter() - start
+                job.llm_calls += 1
+        
+        job.record({
+            "id": question["id"],
+            "message": question["message"],
+            "response": response["content"],
+            "sources": [doc.get("source") for doc in built.documents],
+            "context_tokens": built.tokens
+        })
+
+
+async def _cancel_pending(in_flight: Deque[List[asyncio.Task]]):
+    """取消仍在途的各组回答并等待其结束"""
+    tasks = [task for group in in_flight for task in group]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    in_flight.clear()
@@ -0,0 +1,192 @@
+"""
+会话历史存储
+
+- 每个会话一个有界缓冲区：最多 max_turns 条消息、总计 max_chars 个字符，超出时丢弃最早的消息，
+  因此单个空闲会话占用的内存有固定上限
+- 会话之间按最近访问做 LRU 淘汰（max_conversations），空闲超过 ttl 的会话被清理
+- 可选 Postgres 持久化（conversation_messages 表）：内存未命中时从数据库加载最近的消息
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.llm.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# (role, content, token 数)
+Turn = Tuple[str, str, int]
+
+
+class Conversation:
+    """单个会话的消息缓冲区"""
+    
+    __slots__ = ("turns", "chars", "last_access")
+    
+    def __init__(self, now: float):
+        self.turns: List[Turn] = []
+        self.chars = 0
+        self.last_access = now
+    
+    def append(self, turn: Turn, max_turns: int, max_chars: int):
+        """追加一条消息，超出条数或字符上限时丢弃最早的消息"""
+        self.turns.append(turn)
+        self.chars += len(turn[1])
+        while self.turns and (len(self.turns) > max_turns or self.chars > max_chars):
+            _, content, _ = self.turns.pop(0)
+            self.chars -= len(content)
+
+
+class ConversationStore:
+    """会话历史存储（内存 LRU + 可选 Postgres 持久化）"""
+    
+    def __init__(
+        self,
+        max_conversations: int = 100000,
+        max_turns: int = 20,
+        max_chars: int = 4000,
+        ttl: float = 3600,
+        vector_store=None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            max_conversations: 内存中保留的最大会话数
+            max_turns: 每个会话保留的最大消息数（用户 + 助手）
+            max_chars: 每个会话保留的最大字符数，单条消息超出时截断
+            ttl: 会话空闲超过该时间（秒）后从内存中清理
+            vector_store: 提供连接池的 VectorStore，传入时启用 Postgres 持久化
+            clock: 时钟函数（便于测试）
+        """
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.vector_store = vector_store
+        self._clock = clock
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.evictions = 0
+        self.loads = 0
+    
+    async def get_history(self, conversation_id: str) -> List[Dict]:
+        """
+        获取会话历史
+        
+        Args:
+            conversation_id: 会话ID
+            
+        Returns:
+            按时间顺序排列的消息列表：{"role", "content", "tokens"}
+        """
+        conversation = await self._get(conversation_id)
+        if conversation is None:
+            return []
+        return [
+            {"role": role, "content": content, "tokens": tokens}
+            for role, content, tokens in conversation.turns
+        ]
+    
+    async def append(self, conversation_id: str, user_message: str, assistant_message: str):
+        """
+        记录一轮对话
+        
+        Args:
+            conversation_id: 会话ID
+            user_message: 用户消息
+            assistant_message: 助手回复
+        """
+        conversation = await self._get(conversation_id)
+        if conversation is None:
+            conversation = self._put(conversation_id, Conversation(self._clock()))
+        
+        for role, content in (("user", user_message), ("assistant", assistant_message)):
+            content = content[:self.max_chars]
+            conversation.append((role, content, count_tokens(content)), self.max_turns, self.max_chars)
+        
+        if self.vector_store:
+            try:
+                await self._persist(conversation_id, user_message, assistant_message)
+            except Exception as e:
+                logger.warning(f"会话历史持久化失败: conversation_id={conversation_id}, 错误: {str(e)}")
+    
+    async def _get(self, conversation_id: str) -> Optional[Conversation]:
+        now = self._clock()
+        self._expire(now)
+        
+        conversation = self._conversations.get(conversation_id)
+        if conversation is not None:
+            conversation.last_access = now
+            self._conversations.move_to_end(conversation_id)
+            return conversation
+        
+        if not self.vector_store:
+            return None
+        
+        # 内存未命中（新会话、已淘汰或其他实例上的会话）时从数据库加载
+        try:
+            rows = await self._load(conversation_id)
+        except Exception as e:
+            logger.warning(f"会话历史加载失败: conversation_id={conversation_id}, 错误: {str(e)}")
+            return None
+        self.loads += 1
+        
+        conversation = Conversation(now)
+        for role, content in rows:
+            content = content[:self.max_chars]
+            conversation.append((role, content, count_tokens(content)), self.max_turns, self.max_chars)
+        return self._put(conversation_id, conversation)
+    
+    def _put(self, conversation_id: str, conversation: Conversation) -> Conversation:
+        self._conversations[conversation_id] = conversation
+        self._conversations.move_to_end(conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self.evictions += 1
+        return conversation
+    
+    def _expire(self, now: float):
+        """清理空闲超时的会话（按访问顺序排列，只需检查队首）"""
+        while self._conversations:
+            conversation_id, conversation = next(iter(self._conversations.items()))
+            if conversation.last_access + self.ttl > now:
+                break
+            del self._conversations[conversation_id]
+            self.evictions += 1
+    
+    async def _load(self, conversation_id: str) -> List[Tuple[str, str]]:
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT role, content FROM (
+                    SELECT id, role, content FROM conversation_messages
+                    WHERE conversation_id = $1
+                    ORDER BY id DESC
+                    LIMIT $2
+                ) recent
+                ORDER BY id
+                """,
+                conversation_id,
+                self.max_turns
+            )
+        return [(row["role"], row["content"]) for row in rows]
+    
+    async def _persist(self, conversation_id: str, user_message: str, assistant_message: str):
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            await conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, role, content) VALUES ($1, $2, $3)",
+                [
+                    (conversation_id, "user", user_message),
+                    (conversation_id, "assistant", assistant_message)
+                ]
+            )
+    
+    def stats(self) -> Dict:
+        """存储统计"""
+        return {
+            "conversations": len(self._conversations),
+            "evictions": self.evictions,
+            "loads": self.loads
+        }
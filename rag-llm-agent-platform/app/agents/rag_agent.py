@@ -2,12 +2,21 @@
 RAG Agent 实现
 结合检索增强生成和 Function Calling
 """
+import asyncio
+import json
 import logging
-from typing import Optional, Dict, AsyncGenerator
+import time
+from typing import Optional, Dict, AsyncGenerator, List, Tuple
 import uuid
 
+from app.agents.batch_chat import BatchChatRunner
+from app.agents.conversation_store import ConversationStore
+from app.core.concurrency import AdaptiveLimiter
 from app.rag.vector_store import VectorStore
 from app.rag.retriever import Retriever
+from app.rag.reranker import CrossEncoderScorer, LexicalScorer, Reranker
+from app.rag.context_builder import BuiltContext, ContextBuilder
+from app.rag.response_cache import CachedResponse, SemanticResponseCache
 from app.tools.tool_manager import ToolManager
 from app.llm.llm_client import LLMClient
 from app.core.config import settings
@@ -21,14 +30,126 @@ class RAGAgent:
     def __init__(self):
         self.vector_store = VectorStore()
         self.retriever = Retriever(self.vector_store)
+        self.reranker = _make_reranker() if settings.RERANK_ENABLED else None
         self.tool_manager = ToolManager()
         self.llm_client = LLMClient()
+        self.context_builder = ContextBuilder(
+            max_tokens=settings.CONTEXT_MAX_TOKENS,
+            per_doc_tokens=settings.CONTEXT_DOC_MAX_TOKENS,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD
+        )
+        self.conversation_store = ConversationStore(
+            max_conversations=settings.CONVERSATION_MAX_ACTIVE,
+            max_turns=settings.CONVERSATION_MAX_TURNS,
+            max_chars=settings.CONVERSATION_MAX_CHARS,
+            ttl=settings.CONVERSATION_TTL,
+            vector_store=self.vector_store if settings.CONVERSATION_PERSIST else None
+        )
+        self.response_cache = None
+        if settings.RESPONSE_CACHE_ENABLED:
+            self.response_cache = SemanticResponseCache(
+                threshold=settings.RESPONSE_CACHE_THRESHOLD,
+                ttl=settings.RESPONSE_CACHE_TTL,
+                max_size=settings.RESPONSE_CACHE_SIZE
+            )
+        # 自适应并发限制：/chat 按总耗时、流式接口按首字延迟调整上限
+        self.chat_limiter = None
+        self.stream_limiter = None
+        if settings.CONCURRENCY_LIMIT_ENABLED:
+            self.chat_limiter = _make_limiter("chat", settings.CHAT_LATENCY_TARGET_MS)
+            self.stream_limiter = _make_limiter("chat_stream", settings.STREAM_TTFT_TARGET_MS)
+        self.batch_runner = BatchChatRunner(
+            self,
+            batch_size=settings.BATCH_CHAT_SIZE,
+            llm_concurrency=settings.BATCH_LLM_CONCURRENCY,
+            max_jobs=settings.BATCH_MAX_JOBS
+        )
+        self._readiness: Optional[Dict] = None
+        self._readiness_checked_at = 0.0
+        self._readiness_lock = asyncio.Lock()
+    
+    async def startup(self):
+        """预热共享资源（连接池中的连接全部建立并完成一次往返、本地 Embedding 模型加载），应用启动时调用一次"""
+        await asyncio.gather(self.vector_store.warmup(), self.retriever.warmup())
+    
+    async def readiness(self) -> Dict:
+        """
+        就绪检查：数据库连接池可用、Embedding / LLM 客户端已初始化
+        
+        结果缓存 READINESS_CACHE_SECONDS 秒，并发的探测请求共用一次检查
+        
+        Returns:
+            {"ready": bool, "checks": {检查项: "ok" / 错误信息}}
+        """
+        if self._readiness_fresh():
+            return self._readiness
+        
+        async with self._readiness_lock:
+            if self._readiness_fresh():
+                return self._readiness
+            
+            checks = {}
+            try:
+                await asyncio.wait_for(self.vector_store.ping(), timeout=settings.READINESS_TIMEOUT)
+                checks["database"] = "ok"
+            except asyncio.TimeoutError:
+                checks["database"] = f"timeout after {settings.READINESS_TIMEOUT}s"
+            except Exception as e:
+                checks["database"] = f"error: {str(e)}"
+            
+            checks["embedding"] = "ok" if self.retriever.embedding_provider.is_ready() else "not ready"
+            llm_ready = self.llm_client.bedrock_client is not None or self.llm_client.openai_client is not None
+            checks["llm"] = "ok" if llm_ready else "not configured"
+            
+            self._readiness = {
+                "ready": all(status == "ok" for status in checks.values()),
+                "checks": checks
+            }
+            self._readiness_checked_at = time.monotonic()
+            if not self._readiness["ready"]:
+                logger.warning(f"就绪检查未通过: {checks}")
+            return self._readiness
+    
+    def _readiness_fresh(self) -> bool:
+        return (
+            self._readiness is not None
+            and time.monotonic() - self._readiness_checked_at < settings.READINESS_CACHE_SECONDS
+        )
+    
+    async def close(self):
+        """释放共享资源，应用关闭时调用"""
+        await self.batch_runner.close()
+        await self.vector_store.close()
+        await self.retriever.close()
+        if self.reranker:
+            await self.reranker.close()
+        await self.llm_client.close()
+    
+    def stats(self) -> Dict:
+        """各级缓存 / 批处理 / 并发限制统计"""
+        stats = {"conversations": self.conversation_store.stats()}
+        if self.chat_limiter:
+            stats["chat_limiter"] = self.chat_limiter.stats()
+        if self.stream_limiter:
+            stats["stream_limiter"] = self.stream_limiter.stats()
+        if self.response_cache:
+            stats["response_cache"] = self.response_cache.stats()
+        if self.retriever.embedding_cache:
+            stats["embedding_cache"] = self.retriever.embedding_cache.stats()
+        if self.retriever.embedding_batcher:
+            stats["embedding_batcher"] = self.retriever.embedding_batcher.stats()
+        if self.vector_store.memory_index:
+            stats["memory_index"] = self.vector_store.memory_index.stats()
+        if self.reranker:
+            stats["reranker"] = self.reranker.stats()
+        return stats
     
     async def chat(
         self,
         message: str,
         conversation_id: Optional[str] = None,
-        stream: bool = False
+        stream: bool = False,
+        search_options: Optional[Dict] = None
     ) -> Dict:
         """
         处理聊天请求
@@ -37,117 +158,348 @@ class RAGAgent:
             message: 用户消息
             conversation_id: 会话ID
             stream: 是否流式输出
+            search_options: 请求级检索参数（mode / ef_search / probes / filters）
             
         Returns:
-            包含响应和会话ID的字典
+            包含响应、会话ID、来源和上下文 token 数（context_tokens）的字典
+            
+        Raises:
+            OverloadedError: 超出并发容量（排队已满或排队超时）
         """
-        if not conversation_id:
+        if not self.chat_limiter:
+            return await self._chat(message, conversation_id, stream, search_options)
+        async with self.chat_limiter.slot():
+            return await self._chat(message, conversation_id, stream, search_options)
+    
+    async def _chat(
+        self,
+        message: str,
+        conversation_id: Optional[str],
+        stream: bool,
+        search_options: Optional[Dict]
+    ) -> Dict:
+        history = []
+        if conversation_id:
+            history = await self.conversation_store.get_history(conversation_id)
+        else:
             conversation_id = str(uuid.uuid4())
         
-        # 1. 检索相关文档
-        relevant_docs = await self.retriever.retrieve(message, top_k=settings.TOP_K_RESULTS)
-        logger.info(f"检索到 {len(relevant_docs)} 个相关文档")
-        
-        # 2. 构建上下文
-        context = self._build_context(relevant_docs)
+        # 0. 语义回答缓存（有会话历史时回答依赖上下文，不走缓存）
+        query_embedding, cached = await self._lookup_cache(message, search_options, history)
+        if cached:
+            await self.conversation_store.append(conversation_id, message, cached.response)
+            return {
+                "response": cached.response,
+                "conversation_id": conversation_id,
+                "sources": cached.sources,
+                "context_tokens": 0
+            }
         
-        # 3. 获取可用工具
-        available_tools = self.tool_manager.get_available_tools()
+        # 1. 检索相关文档（启用重排序时多取候选再重排）
+        relevant_docs = await self._retrieve(message, search_options, query_embedding)
+        logger.info(f"检索到 {len(relevant_docs)} 个相关文档")
         
-        # 4. 调用 LLM（带 Function Calling）
-        response = await self.llm_client.chat(
-            message=message,
-            context=context,
-            tools=available_tools,
-            conversation_id=conversation_id,
-            stream=stream
-        )
+        # 2. 构建上下文（按 token 预算截断、去重）
+        built = self._build_context(relevant_docs)
+        context = built.text
         
-        # 5. 处理工具调用（如果有）
-        if response.get("tool_calls"):
-            tool_results = await self._execute_tools(response["tool_calls"])
-            # 再次调用 LLM，传入工具执行结果
-            response = await self.llm_client.chat(
-                message=message,
-                context=context,
-                tool_results=tool_results,
-                conversation_id=conversation_id,
-                stream=stream
-            )
+        # 3. 调用 LLM（带 Function Calling），需要时执行工具后再次调用
+        response, used_tools = await self._generate(message, context, conversation_id, history, stream)
         
+        sources = [doc.get("source") for doc in built.documents]
+        self._store_cache(query_embedding, search_options, response["content"], sources, used_tools or bool(history))
+        await self.conversation_store.append(conversation_id, message, response["content"] or "")
         return {
             "response": response["content"],
             "conversation_id": conversation_id,
-            "sources": [doc.get("source") for doc in relevant_docs]
+            "sources": sources,
+            "context_tokens": built.tokens
         }
     
     async def chat_stream(
         self,
         message: str,
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        search_options: Optional[Dict] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         流式聊天处理
         
         Yields:
-            包含内容块的字典
+            包含内容块的字典；最后一块 done=True，附带上下文 token 数 context_tokens
+            
+        Raises:
+            OverloadedError: 超出并发容量，在产生第一块之前抛出
         """
-        if not conversation_id:
+        if not self.stream_limiter:
+            async for chunk in self._chat_stream(message, conversation_id, search_options):
+                yield chunk
+            return
+        
+        async with self.stream_limiter.slot() as slot:
+            async for chunk in self._chat_stream(message, conversation_id, search_options):
+                if chunk["content"]:
+                    slot.mark()
+                yield chunk
+    
+    async def _chat_stream(
+        self,
+        message: str,
+        conversation_id: Optional[str],
+        search_options: Optional[Dict]
+    ) -> AsyncGenerator[Dict, None]:
+        history = []
+        if conversation_id:
+            history = await self.conversation_store.get_history(conversation_id)
+        else:
             conversation_id = str(uuid.uuid4())
         
+        query_embedding, cached = await self._lookup_cache(message, search_options, history)
+        if cached:
+            await self.conversation_store.append(conversation_id, message, cached.response)
+            yield {"content": cached.response, "conversation_id": conversation_id, "done": False}
+            yield {"content": "", "conversation_id": conversation_id, "done": True, "context_tokens": 0}
+            return
+        
         # 检索相关文档
-        relevant_docs = await self.retriever.retrieve(message, top_k=settings.TOP_K_RESULTS)
-        context = self._build_context(relevant_docs)
-        available_tools = self.tool_manager.get_available_tools()
+        relevant_docs = await self._retrieve(message, search_options, query_embedding)
+        built = self._build_context(relevant_docs)
+        context = built.text
+        schema_set = self.tool_manager.get_schema_set(message)
+        logger.debug(f"工具子集: tools={len(schema_set.schemas)}, schema version={schema_set.version}")
         
-        # 流式调用 LLM
+        # 流式调用 LLM：工具调用的参数一完整就开始执行，结果回填后继续流式输出
+        parts = []
+        completed = used_tools = False
+        tool_semaphore = asyncio.Semaphore(settings.TOOL_MAX_CONCURRENCY)
         async for chunk in self.llm_client.chat_stream(
             message=message,
             context=context,
-            tools=available_tools,
-            conversation_id=conversation_id
+            tools=schema_set.schemas,
+            conversation_id=conversation_id,
+            history=history,
+            tool_executor=lambda tool_call: self._execute_tool(tool_call, tool_semaphore)
         ):
-            yield {
+            parts.append(chunk.get("content", ""))
+            used_tools = used_tools or bool(chunk.get("tool_calls"))
+            completed = chunk.get("done", False)
+            output = {
                 "content": chunk.get("content", ""),
                 "conversation_id": conversation_id,
-                "done": chunk.get("done", False)
+                "done": completed
             }
+            if completed:
+                output["context_tokens"] = built.tokens
+            yield output
+        
+        # 只记录 / 缓存完整生成的回答
+        if completed:
+            sources = [doc.get("source") for doc in built.documents]
+            self._store_cache(query_embedding, search_options, "".join(parts), sources, used_tools or bool(history))
+            await self.conversation_store.append(conversation_id, message, "".join(parts))
+    
+    async def _retrieve(
+        self,
+        message: str,
+        search_options: Optional[Dict],
+        query_embedding: Optional[List[float]]
+    ) -> List[Dict]:
+        """
+        检索 TOP_K_RESULTS 篇文档；启用重排序时先取 RERANK_CANDIDATES 篇候选，重排后保留最相关的 TOP_K_RESULTS 篇
+        
+        Args:
+            message: 用户消息
+            search_options: 请求级检索参数
+            query_embedding: 已计算好的查询向量
+            
+        Returns:
+            相关文档列表
+        """
+        if not self.reranker:
+            return await self.retriever.retrieve(
+                message,
+                top_k=settings.TOP_K_RESULTS,
+                search_options=search_options,
+                query_embedding=query_embedding
+            )
+        
+        candidates = await self.retriever.retrieve(
+            message,
+            top_k=self.reranker.candidates,
+            search_options=search_options,
+            query_embedding=query_embedding
+        )
+        return await self.reranker.rerank(message, candidates)
+    
+    async def _lookup_cache(
+        self,
+        message: str,
+        search_options: Optional[Dict],
+        history: Optional[List[Dict]] = None
+    ) -> Tuple[Optional[List[float]], Optional[CachedResponse]]:
+        """
+        查询语义回答缓存
+        
+        Returns:
+            (查询向量, 命中的缓存回答)；未启用缓存或存在会话历史时均为 None，
+            向量化失败时交由检索阶段重试
+        """
+        if not self.response_cache or history:
+            return None, None
+        try:
+            query_embedding = await self.retriever.embed_query(message)
+        except Exception as e:
+            logger.warning(f"语义缓存查询向量化失败: {str(e)}")
+            return None, None
+        
+        cached = self.response_cache.get(
+            query_embedding,
+            scope=_cache_scope(search_options),
+            generation=self.vector_store.generation
+        )
+        if cached:
+            logger.info(f"语义缓存命中: similarity={cached.similarity:.3f}")
+        return query_embedding, cached
+    
+    def _store_cache(
+        self,
+        query_embedding: Optional[List[float]],
+        search_options: Optional[Dict],
+        response: str,
+        sources: list,
+        bypass: bool
+    ):
+        """写入语义回答缓存；依赖工具调用（实时数据）或会话历史的回答不缓存"""
+        if not self.response_cache or query_embedding is None or not response:
+            return
+        if bypass:
+            self.response_cache.record_bypass()
+            return
+        self.response_cache.set(
+            query_embedding,
+            response,
+            sources,
+            scope=_cache_scope(search_options),
+            generation=self.vector_store.generation
+        )
     
-    def _build_context(self, docs: list) -> str:
-        """构建上下文"""
-        if not docs:
-            return ""
+    async def _generate(
+        self,
+        message: str,
+        context: str,
+        conversation_id: Optional[str] = None,
+        history: Optional[List[Dict]] = None,
+        stream: bool = False
+    ) -> Tuple[Dict, bool]:
+        """
+        调用 LLM 生成回答，模型请求工具时执行工具并带结果再次调用
         
-        context_parts = ["相关文档内容："]
-        for i, doc in enumerate(docs, 1):
-            context_parts.append(f"\n[{i}] {doc.get('content', '')}")
-            if doc.get('source'):
-                context_parts.append(f"来源: {doc['source']}")
+        Returns:
+            (LLM 响应, 是否调用了工具)
+        """
+        # 获取与意图相关的可用工具
+        schema_set = self.tool_manager.get_schema_set(message)
+        logger.debug(f"工具子集: tools={len(schema_set.schemas)}, schema version={schema_set.version}")
+        
+        response = await self.llm_client.chat(
+            message=message,
+            context=context,
+            tools=schema_set.schemas,
+            conversation_id=conversation_id,
+            stream=stream,
+            history=history
+        )
         
-        return "\n".join(context_parts)
+        used_tools = bool(response.get("tool_calls"))
+        if used_tools:
+            tool_results = await self._execute_tools(response["tool_calls"])
+            # 再次调用 LLM，传入工具执行结果
+            response = await self.llm_client.chat(
+                message=message,
+                context=context,
+                tool_results=tool_results,
+                conversation_id=conversation_id,
+                stream=stream,
+                history=history
+            )
+        return response, used_tools
+    
+    def _build_context(self, docs: list) -> BuiltContext:
+        """构建上下文（token 预算内，截断过长文档并跳过重叠分块）"""
+        built = self.context_builder.build(docs)
+        logger.info(
+            f"上下文组装完成: documents={len(built.documents)}/{len(docs)}, tokens={built.tokens}, "
+            f"truncated={built.truncated}, duplicates={built.duplicates}"
+        )
+        return built
     
     async def _execute_tools(self, tool_calls: list) -> list:
-        """执行工具调用"""
-        results = []
-        for tool_call in tool_calls:
-            tool_name = tool_call.get("name")
-            tool_args = tool_call.get("arguments", {})
-            
+        """
+        执行工具调用
+        
+        相互独立的调用并发执行（并发数受 TOOL_MAX_CONCURRENCY 限制），结果顺序与
+        tool_calls 一致；写操作的按实体串行和单工具超时由 ToolManager 负责
+        """
+        semaphore = asyncio.Semaphore(settings.TOOL_MAX_CONCURRENCY)
+        return list(await asyncio.gather(*(self._execute_tool(tool_call, semaphore) for tool_call in tool_calls)))
+    
+    async def _execute_tool(self, tool_call: Dict, semaphore: asyncio.Semaphore) -> Dict:
+        """执行单个工具调用，失败 / 超时以结果返回而不抛出"""
+        tool_name = tool_call.get("name")
+        tool_args = tool_call.get("arguments", {})
+        
+        async with semaphore:
             try:
                 result = await self.tool_manager.execute_tool(tool_name, tool_args)
-                results.append({
+                logger.info(f"工具调用成功: {tool_name}")
+                return {
                     "tool_name": tool_name,
                     "result": result,
                     "success": True
-                })
-                logger.info(f"工具调用成功: {tool_name}")
+                }
+            except asyncio.TimeoutError:
+                logger.error(f"工具调用超时: {tool_name}")
+                return {
+                    "tool_name": tool_name,
+                    "result": "执行失败: 工具调用超时",
+                    "success": False
+                }
             except Exception as e:
                 logger.error(f"工具调用失败: {tool_name}, 错误: {str(e)}")
-                results.append({
+                return {
                     "tool_name": tool_name,
                     "result": f"执行失败: {str(e)}",
                     "success": False
-                })
-        
-        return results
+                }
+
+
+def _make_limiter(name: str, latency_target_ms: float) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name,
+        latency_target=latency_target_ms / 1000,
+        initial_limit=settings.CONCURRENCY_INITIAL_LIMIT,
+        min_limit=settings.CONCURRENCY_MIN_LIMIT,
+        max_limit=settings.CONCURRENCY_MAX_LIMIT,
+        queue_size=settings.CONCURRENCY_QUEUE_SIZE,
+        queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT
+    )
+
+
+def _make_reranker() -> Reranker:
+    """按配置创建重排序阶段：配置了 RERANK_MODEL 时使用本地交叉编码器，否则使用词法重叠打分"""
+    if settings.RERANK_MODEL:
+        scorer = CrossEncoderScorer(settings.RERANK_MODEL, batch_size=settings.RERANK_BATCH_SIZE)
+    else:
+        scorer = LexicalScorer()
+    return Reranker(
+        scorer,
+        top_n=settings.TOP_K_RESULTS,
+        candidates=settings.RERANK_CANDIDATES,
+        budget_ms=settings.RERANK_BUDGET_MS,
+        cache_size=settings.RERANK_CACHE_SIZE
+    )
+
 
+def _cache_scope(search_options: Optional[Dict]) -> str:
+    """检索参数不同的请求互不命中（如不同的过滤条件）"""
+    return json.dumps(search_options or {}, sort_keys=True, default=str)
@@ -1,24 +1,52 @@
 """
 对话接口
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.websockets import WebSocketState
+from pydantic import BaseModel, Field
+from typing import Any, Awaitable, Callable, Dict, Literal, Optional
+from contextlib import aclosing, suppress
+from datetime import datetime
+import asyncio
 import json
 import logging
+import math
 
 from app.agents.rag_agent import RAGAgent
+from app.api.deps import get_agent
+from app.api.ndjson import iter_ndjson
+from app.api.stream_writer import CoalescingFrameWriter, SlowConsumerError, send_frame
+from app.core import metrics
+from app.core.concurrency import OverloadedError
 from app.core.config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+class SearchFilters(BaseModel):
+    """检索过滤条件"""
+    contains: Optional[Dict[str, Any]] = Field(None, description="元数据 JSONB 包含条件")
+    equals: Optional[Dict[str, Any]] = Field(None, description="元数据键值相等条件")
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+
+class SearchOptions(BaseModel):
+    """向量检索参数（请求级，覆盖全局配置）"""
+    mode: Optional[Literal["vector", "hybrid"]] = Field(None, description="检索模式：向量 / 向量 + 全文混合")
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="HNSW 查询候选集大小")
+    probes: Optional[int] = Field(None, ge=1, le=1000, description="IVFFlat 探测列表数")
+    filters: Optional[SearchFilters] = None
+
+
 class ChatRequest(BaseModel):
     """聊天请求模型"""
     message: str
     conversation_id: Optional[str] = None
     stream: bool = False
+    search_options: Optional[SearchOptions] = None
 
 
 class ChatResponse(BaseModel):
@@ -26,81 +54,251 @@ class ChatResponse(BaseModel):
     response: str
     conversation_id: str
     sources: Optional[list] = None
+    context_tokens: Optional[int] = Field(None, description="提示词中 RAG 上下文的 token 数")
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, agent: RAGAgent = Depends(get_agent)):
     """
     非流式聊天接口
     """
     try:
-        agent = RAGAgent()
         result = await agent.chat(
             message=request.message,
             conversation_id=request.conversation_id,
-            stream=False
+            stream=False,
+            search_options=request.search_options.model_dump(exclude_none=True) if request.search_options else None
         )
         
         return ChatResponse(
             response=result["response"],
             conversation_id=result["conversation_id"],
-            sources=result.get("sources")
+            sources=result.get("sources"),
+            context_tokens=result.get("context_tokens")
+        )
+    except OverloadedError as e:
+        # 快速失败，由客户端 / 网关按 Retry-After 重试，而不是在服务端排队直至超时
+        logger.warning(f"聊天请求被拒绝（过载）: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
     except Exception as e:
         logger.error(f"聊天处理错误: {str(e)}", exc_info=True)
         raise
 
 
+def _parse_question(line: bytes, line_no: int) -> Dict:
+    try:
+        question = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"第 {line_no} 行格式错误: {str(e)}") from e
+    if not isinstance(question, dict) or not question.get("message"):
+        raise ValueError(f"第 {line_no} 行格式错误: 每行必须是包含 message 字段的 JSON 对象")
+    return {"id": question.get("id"), "message": question["message"]}
+
+
+@router.post("/chat:batch", status_code=202)
+async def submit_batch_chat(
+    request: Request,
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="每个问题检索的文档数"),
+    agent: RAGAgent = Depends(get_agent)
+):
+    """
+    提交批量对话任务（JSONL 上传）
+    
+    每行一个问题：{"id": "q1", "message": "..."}，id 缺省时使用行序号（从 0 开始）。问题按
+    BATCH_CHAT_SIZE 分组批量向量化与检索，LLM 调用并发数受 BATCH_LLM_CONCURRENCY 限制。
+    通过 GET /chat:batch/{job_id} 轮询进度与吞吐报告，GET /chat:batch/{job_id}/results
+    以 JSONL 流式获取结果（任务运行中即可读取，按完成顺序输出）。
+    """
+    questions = []
+    try:
+        async for question in iter_ndjson(request, _parse_question):
+            if len(questions) >= settings.BATCH_MAX_QUESTIONS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"单个任务最多 {settings.BATCH_MAX_QUESTIONS} 个问题"
+                )
+            if question["id"] is None:
+                question["id"] = len(questions)
+            questions.append(question)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not questions:
+        raise HTTPException(status_code=400, detail="请求体中没有问题")
+    
+    job = agent.batch_runner.submit(questions, top_k=top_k)
+    return JSONResponse(status_code=202, content=job.report())
+
+
+@router.get("/chat:batch/{job_id}")
+async def get_batch_chat(job_id: str, agent: RAGAgent = Depends(get_agent)):
+    """
+    查询批量对话任务进度与吞吐报告
+    """
+    return _get_job(agent, job_id).report()
+
+
+@router.get("/chat:batch/{job_id}/results")
+async def stream_batch_chat_results(job_id: str, agent: RAGAgent = Depends(get_agent)):
+    """
+    以 JSONL 流式输出批量对话结果，任务未完成时持续输出直至结束
+    """
+    job = _get_job(agent, job_id)
+    
+    async def lines():
+        async for result in job.iter_results():
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _get_job(agent: RAGAgent, job_id: str):
+    job = agent.batch_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"批量任务不存在: {job_id}")
+    return job
+
+
 @router.websocket("/ws/chat")
-async def websocket_chat(websocket: WebSocket):
+async def websocket_chat(websocket: WebSocket, agent: RAGAgent = Depends(get_agent)):
     """
     WebSocket 流式聊天接口
     实现首字响应时间 ≤ 1s 的流式输出
+    
+    接收与处理分离：接收端把消息放入本连接的待处理队列，队列中已有
+    WS_MAX_QUEUED_MESSAGES 条消息时新消息直接返回错误帧，单个连接无法无限堆积请求；
+    接收端的错误帧、合并写入器的内容帧与控制帧共用一把发送锁，不会交错写入；
+    任何一帧发送超过 WS_SEND_TIMEOUT 视为慢消费者，不再发送任何内容，以 1008 关闭连接
     """
     await websocket.accept()
-    agent = RAGAgent()
+    metrics.WS_ACTIVE_CONNECTIONS.inc()
+    send_lock = asyncio.Lock()
+    slow_consumer = False
+    
+    async def send_json(payload: Dict):
+        nonlocal slow_consumer
+        if slow_consumer:
+            raise SlowConsumerError("连接已因发送超时停止发送")
+        async with send_lock:
+            try:
+                await send_frame(websocket, payload, settings.WS_SEND_TIMEOUT)
+            except SlowConsumerError:
+                slow_consumer = True
+                raise
+    
+    queue: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.create_task(_receive_messages(websocket, queue, send_json))
     conversation_id = None
     
     try:
         while True:
-            # 接收消息
-            data = await websocket.receive_text()
+            data = await queue.get()
+            if data is None:
+                break
             message_data = json.loads(data)
             message = message_data.get("message", "")
             conversation_id = message_data.get("conversation_id", conversation_id)
+            search_options = SearchOptions(**message_data.get("search_options") or {})
             
             if not message:
-                await websocket.send_json({
+                await send_json({
                     "error": "消息不能为空"
                 })
                 continue
             
-            # 流式处理
-            async for chunk in agent.chat_stream(
-                message=message,
-                conversation_id=conversation_id
-            ):
-                await websocket.send_json({
-                    "type": "chunk",
-                    "content": chunk.get("content", ""),
-                    "conversation_id": chunk.get("conversation_id"),
-                    "done": chunk.get("done", False)
+            # 流式处理：内容块经合并写入器按时间/字节阈值合并成帧
+            writer = CoalescingFrameWriter(websocket, send_lock=send_lock)
+            context_tokens = None
+            try:
+                # aclosing：发送失败（如客户端断开）时立即关闭生成器，释放并发限流槽位
+                async with aclosing(agent.chat_stream(
+                    message=message,
+                    conversation_id=conversation_id,
+                    search_options=search_options.model_dump(exclude_none=True)
+                )) as stream:
+                    async for chunk in stream:
+                        conversation_id = chunk.get("conversation_id") or conversation_id
+                        context_tokens = chunk.get("context_tokens", context_tokens)
+                        await writer.write(chunk.get("content", ""), conversation_id)
+                await writer.close()
+            except OverloadedError as e:
+                # 过载只拒绝本条消息，连接保持可用
+                logger.warning(f"WebSocket 消息被拒绝（过载）: {str(e)}")
+                await send_json({
+                    "type": "error",
+                    "code": 503,
+                    "message": str(e),
+                    "retry_after": e.retry_after
                 })
+                continue
+            finally:
+                # chat_stream 抛出异常时也不留下待执行的定时刷新
+                writer.cancel()
+            logger.debug(f"流式输出帧统计: {writer.stats()}")
             
             # 发送完成信号
-            await websocket.send_json({
+            await send_json({
                 "type": "done",
-                "conversation_id": conversation_id
+                "conversation_id": conversation_id,
+                "context_tokens": context_tokens
             })
             
     except WebSocketDisconnect:
         logger.info("WebSocket 连接断开")
+    except SlowConsumerError as e:
+        # 超时的帧可能只写出一部分，不再发送错误帧
+        slow_consumer = True
+        logger.warning(f"WebSocket 慢消费者，断开连接: {str(e)}")
     except Exception as e:
         logger.error(f"WebSocket 处理错误: {str(e)}", exc_info=True)
-        await websocket.send_json({
-            "type": "error",
-            "message": str(e)
-        })
+        try:
+            await send_json({
+                "type": "error",
+                "message": str(e)
+            })
+        except SlowConsumerError:
+            pass
     finally:
-        await websocket.close()
+        reader.cancel()
+        with suppress(asyncio.CancelledError):
+            await reader
+        metrics.WS_ACTIVE_CONNECTIONS.dec()
+        # 客户端已断开时不再发送关闭帧（否则抛出 RuntimeError 掩盖原始异常）；
+        # 关闭帧同样可能阻塞在慢客户端上，限时等待
+        if websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await asyncio.wait_for(
+                    websocket.close(code=1008 if slow_consumer else 1000),
+                    timeout=settings.WS_SEND_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning("WebSocket 关闭超时")
+            except RuntimeError as e:
+                logger.debug(f"WebSocket 已关闭: {str(e)}")
 
+
+async def _receive_messages(websocket: WebSocket, queue: asyncio.Queue, send_json: Callable[[Dict], Awaitable]):
+    """接收客户端消息放入待处理队列，队列已满时经 send_json（持有连接发送锁）回复错误帧；连接断开时放入 None"""
+    try:
+        while True:
+            data = await websocket.receive_text()
+            if queue.qsize() >= settings.WS_MAX_QUEUED_MESSAGES:
+                metrics.WS_MESSAGES_DROPPED.inc()
+                await send_json({
+                    "type": "error",
+                    "code": 429,
+                    "message": f"待处理消息过多（上限 {settings.WS_MAX_QUEUED_MESSAGES}），请等待当前回答完成"
+                })
+                continue
+            queue.put_nowait(data)
+    except (WebSocketDisconnect, SlowConsumerError):
+        pass
+    except RuntimeError as e:
+        # 连接已关闭后继续读取
+        logger.debug(f"WebSocket 接收结束: {str(e)}")
+    finally:
+        queue.put_nowait(None)
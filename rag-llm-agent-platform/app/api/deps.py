@@ -0,0 +1,19 @@
+"""
+路由依赖注入
+"""
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+
+from app.agents.rag_agent import RAGAgent
+
+
+def get_agent(connection: HTTPConnection) -> RAGAgent:
+    """
+    获取应用级共享的 RAGAgent
+
+    Agent 在应用启动时创建（见 app.main.lifespan），HTTP 与 WebSocket 路由共用
+    """
+    agent = getattr(connection.app.state, "agent", None)
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent 尚未初始化")
+    return agent
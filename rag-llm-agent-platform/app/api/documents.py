@@ -0,0 +1,97 @@
+"""
+文档批量导入接口
+"""
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List, Optional
+import json
+import logging
+
+from app.agents.rag_agent import RAGAgent
+from app.api.deps import get_agent
+from app.api.ndjson import iter_ndjson
+from app.core.config import settings
+from app.rag.vector_store import BulkInsertError
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _parse_document(line: bytes) -> Dict:
+    doc = json.loads(line)
+    if not isinstance(doc, dict) or not doc.get("content"):
+        raise ValueError("每行必须是包含 content 字段的 JSON 对象")
+    return doc
+
+
+@router.post("/documents:bulk")
+async def bulk_ingest(
+    request: Request,
+    batch_size: Optional[int] = Query(None, ge=1, le=10000, description="每批行数"),
+    resume_from_batch: int = Query(0, ge=0, description="从第几批开始写入（失败续传）"),
+    agent: RAGAgent = Depends(get_agent)
+):
+    """
+    NDJSON 批量导入文档
+    
+    每行一个文档：{"content": "...", "metadata": {...}, "embedding": [...]}，
+    embedding 缺省时按批调用 Embedding 接口生成。每批一个事务，写入失败时返回 500 与
+    resume_from_batch，用相同请求体带上该参数重试即可从最后提交的批次之后续传；
+    某行不是合法的文档 JSON 时返回 400，指明行号与所在批次（之前的批次已提交）。
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    records = 0
+    bad_line = bad_record = None
+    
+    def parse(line: bytes, line_no: int) -> Dict:
+        # 行号按物理行（含空行）报告，批次按文档序号（空行不计）计算
+        nonlocal records, bad_line, bad_record
+        try:
+            doc = _parse_document(line)
+        except ValueError:
+            bad_line, bad_record = line_no, records
+            raise
+        records += 1
+        return doc
+    
+    async def fill_embeddings(batch: List[Dict]) -> List[Dict]:
+        missing = [doc for doc in batch if not doc.get("embedding")]
+        if missing:
+            embeddings = await agent.retriever.embed_texts([doc["content"] for doc in missing])
+            for doc, embedding in zip(missing, embeddings):
+                doc["embedding"] = embedding
+        return batch
+    
+    try:
+        stats = await agent.vector_store.insert_many(
+            iter_ndjson(request, parse),
+            batch_size=batch_size,
+            start_batch=resume_from_batch,
+            prepare_batch=fill_embeddings
+        )
+    except BulkInsertError as e:
+        if bad_line is not None and isinstance(e.cause, ValueError):
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "invalid",
+                    "error": f"第 {bad_line} 行格式错误: {str(e)}",
+                    "error_type": type(e.cause).__name__,
+                    "line": bad_line,
+                    "batch": bad_record // batch_size,
+                    "resume_from_batch": e.stats["next_batch"],
+                    **e.stats
+                }
+            )
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "failed",
+                "error": str(e),
+                "error_type": type(e.cause).__name__ if e.cause else None,
+                "resume_from_batch": e.stats["next_batch"],
+                **e.stats
+            }
+        )
+    
+    return {"status": "completed", **stats}
@@ -1,9 +1,13 @@
 """
 健康检查接口
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
 from datetime import datetime
 
+from app.agents.rag_agent import RAGAgent
+from app.api.deps import get_agent
+
 router = APIRouter()
 
 
@@ -18,11 +22,28 @@ async def health_check():
 
 
 @router.get("/ready")
-async def readiness_check():
-    """就绪检查端点"""
-    # 可以添加数据库连接检查等
+async def readiness_check(agent: RAGAgent = Depends(get_agent)):
+    """
+    就绪检查端点
+    
+    数据库连接池可用且 Embedding / LLM 客户端已初始化时返回 200，否则返回 503，
+    Kubernetes 据此决定是否向 Pod 转发流量
+    """
+    result = await agent.readiness()
+    return JSONResponse(
+        status_code=200 if result["ready"] else 503,
+        content={
+            "status": "ready" if result["ready"] else "not_ready",
+            "checks": result["checks"],
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+
+@router.get("/stats")
+async def runtime_stats(agent: RAGAgent = Depends(get_agent)):
+    """缓存命中率等运行时统计"""
     return {
-        "status": "ready",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        **agent.stats()
     }
-
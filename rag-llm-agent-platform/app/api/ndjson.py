@@ -0,0 +1,34 @@
+"""
+NDJSON 请求体解析
+"""
+from typing import AsyncIterator, Callable, Dict
+
+from fastapi import Request
+
+
+async def iter_ndjson(request: Request, parse: Callable[[bytes, int], Dict]) -> AsyncIterator[Dict]:
+    """
+    流式解析 NDJSON 请求体，不整体读入内存
+    
+    每个非空行连同其物理行号（从 1 开始，空行也计数）交给 parse 解析校验；
+    新到的数据块只扫描一次，长行跨多个数据块时不会反复复制和扫描已缓冲的部分
+    """
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in request.stream():
+        scan_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", max(start, scan_from))
+            if end < 0:
+                break
+            line_no += 1
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if line.strip():
+                yield parse(line, line_no)
+        if start:
+            del buffer[:start]
+    if buffer.strip():
+        yield parse(bytes(buffer), line_no + 1)
@@ -0,0 +1,157 @@
+"""
+WebSocket 帧合并写入器
+
+流式内容按时间窗口（N 毫秒）或累计字节数（M 字节）合并成一个 JSON 帧发送，
+先到者触发；首个内容块立即发送，不影响首字响应时间。
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SlowConsumerError(asyncio.TimeoutError):
+    """单帧发送超时：该帧可能只写出一部分，连接上不能再发送任何内容，应直接关闭"""
+
+
+async def send_frame(websocket: WebSocket, payload: Dict, timeout: float):
+    """
+    带超时发送一个 JSON 帧
+    
+    Raises:
+        SlowConsumerError: 发送超过 timeout 秒
+    """
+    try:
+        await asyncio.wait_for(websocket.send_json(payload), timeout=timeout)
+    except asyncio.TimeoutError as e:
+        raise SlowConsumerError(f"发送超时（{timeout}s），客户端消费过慢") from e
+
+
+class CoalescingFrameWriter:
+    """
+    WebSocket 帧合并写入器（单连接单条回复）
+    
+    背压策略：达到字节阈值时生产方同步等待发送完成（包括排在前面的定时刷新），
+    从而把慢客户端的压力传导给上游流；单帧发送超过 send_timeout 视为慢消费者，
+    抛出 SlowConsumerError（asyncio.TimeoutError 的子类），调用方不应再发送任何帧，直接关闭连接；定时刷新中的发送失败保存下来，
+    在下一次 write() / close() 时抛出
+    """
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        flush_interval_ms: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        send_timeout: Optional[float] = None,
+        send_lock: Optional[asyncio.Lock] = None
+    ):
+        """
+        Args:
+            websocket: WebSocket 连接
+            flush_interval_ms: 合并时间窗口，默认 settings.WS_FLUSH_INTERVAL_MS
+            max_bytes: 合并字节阈值，默认 settings.WS_FLUSH_MAX_BYTES
+            send_timeout: 单帧发送超时，默认 settings.WS_SEND_TIMEOUT
+            send_lock: 连接级发送锁；同一连接上还有其他发送方（如错误帧）时传入同一把锁
+        """
+        self.websocket = websocket
+        self.flush_interval = (flush_interval_ms if flush_interval_ms is not None else settings.WS_FLUSH_INTERVAL_MS) / 1000
+        self.max_bytes = max_bytes or settings.WS_FLUSH_MAX_BYTES
+        self.send_timeout = send_timeout or settings.WS_SEND_TIMEOUT
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._conversation_id: Optional[str] = None
+        self._first_sent = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+        self._send_lock = send_lock or asyncio.Lock()
+        self.chunks_received = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+    
+    async def write(self, content: str, conversation_id: Optional[str] = None):
+        """写入一个内容块"""
+        self._raise_error()
+        if conversation_id:
+            self._conversation_id = conversation_id
+        if not content:
+            return
+        
+        self.chunks_received += 1
+        self._buffer.append(content)
+        self._buffered_bytes += len(content.encode("utf-8"))
+        
+        if not self._first_sent or self._buffered_bytes >= self.max_bytes:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # 后台任务的异常无人读取，留到下一次 write() / close() 抛给调用方
+            self._error = e
+    
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+    
+    async def flush(self):
+        """立即发送缓冲区中的内容"""
+        if not self._buffer:
+            return
+        
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+        self._first_sent = True
+        
+        async with self._send_lock:
+            await send_frame(
+                self.websocket,
+                {
+                    "type": "chunk",
+                    "content": content,
+                    "conversation_id": self._conversation_id,
+                    "done": False
+                },
+                self.send_timeout
+            )
+        size = len(content.encode("utf-8"))
+        self.frames_sent += 1
+        self.bytes_sent += size
+        metrics.WS_FRAMES_SENT.inc()
+        metrics.WS_BYTES_SENT.inc(size)
+    
+    async def close(self):
+        """取消定时刷新并发送剩余内容，返回前确保所有帧已发出"""
+        self.cancel()
+        self._raise_error()
+        await self.flush()
+        # 等待进行中的定时刷新完成，保证后续控制帧不会插到内容帧之前
+        async with self._send_lock:
+            pass
+        self._raise_error()
+    
+    def cancel(self):
+        """取消尚未执行的定时刷新（不发送缓冲内容），用于异常退出时清理"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+    
+    def stats(self) -> Dict:
+        """写入统计"""
+        return {
+            "chunks_received": self.chunks_received,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent
+        }
@@ -0,0 +1,189 @@
+"""
+自适应并发限制（AIMD）
+
+根据观测到的延迟动态调整允许的并发请求数：
+- 延迟不超过目标值时加性增长：每完成约 limit 个请求，limit + 1
+- 延迟超过目标值或上游超时时乘性减小：limit * backoff（每个冷却期最多一次）
+超出 limit 的请求进入有界等待队列，队列已满或等待超时立即拒绝（OverloadedError），
+由接口层返回 503，避免协程在连接池 / LLM 限流前无限堆积直至整体超时。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """超出并发容量，请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    """一次获得的执行许可，可在首个输出时提前记录延迟（流式接口记录首字延迟）"""
+
+    __slots__ = ("start", "latency", "_clock")
+
+    def __init__(self, clock: Callable[[], float]):
+        self._clock = clock
+        self.start = clock()
+        self.latency: Optional[float] = None
+
+    def mark(self):
+        """记录延迟（只记录第一次）"""
+        if self.latency is None:
+            self.latency = self._clock() - self.start
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器"""
+
+    def __init__(
+        self,
+        name: str,
+        latency_target: float,
+        initial_limit: int = 32,
+        min_limit: int = 4,
+        max_limit: int = 256,
+        backoff: float = 0.9,
+        queue_size: int = 32,
+        queue_timeout: float = 1.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            name: 限制器名称（用于指标标签）
+            latency_target: 目标延迟（秒），超过视为拥塞
+            initial_limit: 初始并发上限
+            min_limit: 并发上限的下界
+            max_limit: 并发上限的上界
+            backoff: 拥塞时的乘性减小系数
+            queue_size: 达到上限后允许排队的请求数
+            queue_timeout: 排队的最长等待时间（秒）
+            clock: 时钟函数（便于测试）
+        """
+        self.name = name
+        self.latency_target = latency_target
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.rejected = 0
+        self._limit_gauge = metrics.CONCURRENCY_LIMIT.labels(name=name)
+        self._in_flight_gauge = metrics.CONCURRENCY_IN_FLIGHT.labels(name=name)
+        self._limit_gauge.set(self.limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        """
+        获取执行许可，退出时按延迟调整并发上限
+
+        Raises:
+            OverloadedError: 队列已满或排队超时
+        """
+        await self._acquire()
+        slot = Slot(self._clock)
+        congested = False
+        try:
+            yield slot
+        except asyncio.TimeoutError:
+            # 上游超时是最直接的过载信号
+            congested = True
+            raise
+        finally:
+            slot.mark()
+            self._release(slot.latency, congested)
+
+    async def _acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self._enter()
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            self._reject("queue_full")
+            raise OverloadedError(f"{self.name} 并发已满（limit={int(self.limit)}）", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时与唤醒同时发生：许可已经转交给当前请求
+                return
+            self._remove_waiter(waiter)
+            self._reject("queue_timeout")
+            raise OverloadedError(f"{self.name} 排队超时（{self.queue_timeout}s）", self._retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(None, False)
+            else:
+                self._remove_waiter(waiter)
+            raise
+
+    def _enter(self):
+        self.in_flight += 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def _release(self, latency: Optional[float], congested: bool):
+        self.in_flight -= 1
+        self._in_flight_gauge.set(self.in_flight)
+
+        if latency is not None:
+            self._update_limit(latency, congested)
+
+        # 按新的上限唤醒排队请求，许可直接转交
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._enter()
+                waiter.set_result(None)
+
+    def _update_limit(self, latency: float, congested: bool):
+        now = self._clock()
+        if congested or latency > self.latency_target:
+            # 冷却期内只减一次，避免同一波拥塞的多个样本连续减小
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                logger.info(f"并发上限下调: {self.name} limit={self.limit:.1f}, latency={latency * 1000:.0f}ms")
+        elif self.in_flight + 1 >= int(self.limit) / 2:
+            # 只有真正用到一半以上容量时才增长，空闲时不虚增
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._limit_gauge.set(self.limit)
+
+    def _remove_waiter(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        metrics.CONCURRENCY_REJECTED.labels(name=self.name, reason=reason).inc()
+
+    def _retry_after(self) -> float:
+        return max(1.0, self.latency_target)
+
+    def stats(self) -> Dict:
+        """限制器状态"""
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected
+        }
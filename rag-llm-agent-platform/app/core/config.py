@@ -12,16 +12,32 @@ class Settings(BaseSettings):
     APP_NAME: str = "RAG LLM Agent Platform"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
+    READINESS_CACHE_SECONDS: float = 2.0  # 就绪检查结果缓存时间
+    READINESS_TIMEOUT: float = 2.0  # 就绪检查中数据库探测的超时
     
     # CORS 配置
     ALLOWED_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8080"]
     
     # LLM 配置
     OPENAI_API_KEY: str = ""
+    OPENAI_BASE_URL: str = ""  # 为空时使用官方地址，可指向兼容 OpenAI 协议的服务
     AWS_ACCESS_KEY_ID: str = ""
     AWS_SECRET_ACCESS_KEY: str = ""
     AWS_REGION: str = "us-east-1"
     BEDROCK_MODEL_ID: str = "anthropic.claude-v2"
+    BEDROCK_MAX_CONCURRENCY: int = 16
+    BEDROCK_TIMEOUT: float = 60.0
+    
+    # HTTP 连接池配置（OpenAI 兼容客户端共享，见 app/core/http_client.py）
+    HTTP_MAX_CONNECTIONS: int = 100  # 连接总数上限（HTTP/2 下每个连接可多路复用）
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 100  # 保留的空闲连接数
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保留时间（秒）
+    HTTP2_ENABLED: bool = True  # 需安装 h2（httpx[http2]），未安装时使用 HTTP/1.1
+    HTTP_TIMEOUT: float = 600.0  # 读写 / 等待连接超时（秒）
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # 建连超时（秒）
+    HTTP_MAX_RETRIES: int = 2  # 连接失败与 429 / 502 / 503 / 504 的重试次数，0 表示不重试
+    HTTP_RETRY_BACKOFF: float = 0.2  # 首次重试的退避上限（秒），之后每次翻倍，全抖动
+    HTTP_RETRY_MAX_BACKOFF: float = 8.0  # 单次等待上限（秒），Retry-After 超过该值时不再重试
     
     # 向量数据库配置
     POSTGRES_HOST: str = "localhost"
@@ -31,12 +47,101 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = "postgres"
     
     # RAG 配置
-    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"  # "local:" 前缀为本地 CPU 推理，如 local:BAAI/bge-small-zh-v1.5
+    EMBEDDING_LOCAL_BACKEND: str = "torch"  # torch / onnx
+    EMBEDDING_LOCAL_WORKERS: int = 1
     VECTOR_DIMENSION: int = 1536
     TOP_K_RESULTS: int = 5
+    INGEST_BATCH_SIZE: int = 500
+    CONTEXT_MAX_TOKENS: int = 2000  # RAG 上下文总 token 预算
+    CONTEXT_DOC_MAX_TOKENS: int = 500  # 单篇文档 token 上限，超出截断
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8  # 重叠分块去重的相似度阈值
+    
+    # 向量索引配置
+    VECTOR_INDEX_METHOD: str = "ivfflat"  # ivfflat / hnsw
+    HNSW_EF_SEARCH: int = 0  # 0 表示使用 pgvector 默认值
+    IVFFLAT_PROBES: int = 0
+    VECTOR_ITERATIVE_SCAN: str = ""  # 过滤检索时的迭代扫描（pgvector 0.8+，版本过低时自动不启用）：relaxed_order / strict_order，为空不启用
+    FILTER_OVERFETCH_FACTOR: int = 10  # 未启用迭代扫描时，过滤检索的候选集放大倍数
+    FILTER_MAX_PROBES: int = 100  # 放大后的 ivfflat.probes 上限（hnsw.ef_search 固定不超过 pgvector 上限 1000）
+    RETRIEVAL_MODE: str = "vector"  # vector / hybrid（向量 + 全文 RRF 融合）
+    HYBRID_VECTOR_WEIGHT: float = 1.0
+    HYBRID_TEXT_WEIGHT: float = 1.0
+    HYBRID_CANDIDATES: int = 50  # 混合检索每一路的候选数
+    RRF_K: int = 60
+    
+    # 内存向量索引配置（热点集合在进程内检索，无过滤条件时不访问数据库）
+    MEMORY_INDEX_ENABLED: bool = False
+    MEMORY_INDEX_NLIST: int = 0  # 粗聚类中心数，0 表示 sqrt(行数)
+    MEMORY_INDEX_NPROBE: int = 16
+    MEMORY_INDEX_PQ_M: int = 0  # 每个向量的 PQ 编码字节数，0 表示 维度/16
+    MEMORY_INDEX_RERANK_FACTOR: int = 40  # 近似打分取 top_k * 该值个候选精确重排
+    MEMORY_INDEX_TRAIN_MIN: int = 10000  # 行数不足时精确扫描，不训练 IVF-PQ
+    MEMORY_INDEX_RETRAIN_GROWTH: float = 1.0  # 自上次训练后行数增长该比例时重新训练，0 表示不重新训练
+    MEMORY_INDEX_LOAD_BATCH: int = 5000
+    MEMORY_INDEX_WORKERS: int = 4
+    
+    # 重排序配置
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = ""  # CrossEncoder 模型名或路径（如 BAAI/bge-reranker-base），为空使用词法重叠打分
+    RERANK_CANDIDATES: int = 50  # 向量检索取回的候选数，重排序后保留 TOP_K_RESULTS 篇
+    RERANK_BUDGET_MS: float = 300.0  # 打分延迟预算，超出时跳过重排序
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_CACHE_SIZE: int = 50000
+    
+    # Embedding 缓存配置
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_TTL: int = 86400
+    EMBEDDING_CACHE_SQLITE_PATH: str = ""  # 为空时仅使用进程内 LRU
+    EMBEDDING_CACHE_SQLITE_MAX_ROWS: int = 200000  # 持久层最大行数（1536 维约 6KB/行），0 表示不限
+    
+    # 会话历史配置
+    CONVERSATION_MAX_ACTIVE: int = 100000  # 内存中保留的最大会话数（LRU）
+    CONVERSATION_MAX_TURNS: int = 20  # 每个会话保留的最大消息数
+    CONVERSATION_MAX_CHARS: int = 4000  # 每个会话保留的最大字符数
+    CONVERSATION_TTL: int = 3600  # 空闲会话的内存保留时间（秒）
+    CONVERSATION_PERSIST: bool = False  # 是否持久化到 conversation_messages 表
+    HISTORY_TOKEN_BUDGET: int = 1000  # 提示词中会话历史的 token 预算
+    
+    # 语义回答缓存配置
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_THRESHOLD: float = 0.95  # 命中所需的最小余弦相似度
+    RESPONSE_CACHE_TTL: int = 3600
+    RESPONSE_CACHE_SIZE: int = 5000
+    
+    # Embedding 微批配置
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # 并发限制配置（AIMD 自适应）
+    CONCURRENCY_LIMIT_ENABLED: bool = True
+    CONCURRENCY_INITIAL_LIMIT: int = 32
+    CONCURRENCY_MIN_LIMIT: int = 4
+    CONCURRENCY_MAX_LIMIT: int = 256
+    CONCURRENCY_QUEUE_SIZE: int = 32  # 达到上限后允许排队的请求数
+    CONCURRENCY_QUEUE_TIMEOUT: float = 1.0  # 排队最长等待（秒），超时返回 503
+    CHAT_LATENCY_TARGET_MS: float = 8000.0  # /chat 总耗时目标
+    STREAM_TTFT_TARGET_MS: float = 1500.0  # 流式接口首字延迟目标
+    
+    # 批量对话配置（/chat:batch）
+    BATCH_CHAT_SIZE: int = 64  # 每次 Embedding 请求 / 批量检索的问题数
+    BATCH_LLM_CONCURRENCY: int = 16  # 单个任务内并发的 LLM 调用数
+    BATCH_MAX_QUESTIONS: int = 10000
+    BATCH_MAX_JOBS: int = 100  # 内存中保留的任务数
+    
+    # Function Calling 配置
+    TOOL_MAX_CONCURRENCY: int = 8
+    TOOL_TIMEOUT: float = 10.0
+    TOOL_STREAM_MAX_ROUNDS: int = 3  # 流式输出中工具调用的最大轮数
     
     # WebSocket 配置
     WEBSOCKET_TIMEOUT: int = 300
+    WS_FLUSH_INTERVAL_MS: float = 25.0
+    WS_FLUSH_MAX_BYTES: int = 1024
+    WS_SEND_TIMEOUT: float = 10.0
+    WS_MAX_QUEUED_MESSAGES: int = 4  # 单连接待处理消息上限，超出的消息直接返回错误
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,227 @@
+"""
+OpenAI 兼容客户端共享的 HTTP 传输层
+
+Retriever（Embedding）与 LLMClient（Chat）的 AsyncOpenAI 都经 create_openai_client 创建，共用一个传输：
+- 共享连接池：同一上游的请求复用同一批连接，总数受 HTTP_MAX_CONNECTIONS 限制
+- keep-alive：空闲连接保留 HTTP_KEEPALIVE_EXPIRY 秒（SDK 默认 5 秒），突发流量的间隙不必重新建连
+- HTTP/2：安装 h2 后启用，单连接多路复用；上游不支持时经 ALPN 协商回退到 HTTP/1.1
+- 重试：连接失败与 429 / 502 / 503 / 504 在传输层重试，指数退避加全抖动，
+  响应带 Retry-After 时按其等待；此时关闭 SDK 自身的重试，避免两层重试次数相乘
+"""
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+from openai import AsyncOpenAI
+
+try:
+    # openai 新版本基于 httpx2（httpcore2 连接池），旧版本基于 httpx，传输层与 SDK 使用同一个库
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+_shared_transport: Optional[httpx.AsyncBaseTransport] = None
+_shared_refs = 0
+
+
+def http2_available() -> bool:
+    """是否安装了 HTTP/2 所需的 h2"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_retry_after(headers: httpx.Headers, now: Optional[float] = None) -> Optional[float]:
+    """
+    解析响应要求的等待秒数
+    
+    Args:
+        headers: 响应头，支持 retry-after-ms（OpenAI 扩展）与 Retry-After（秒数或 HTTP 日期）
+        now: 当前时间戳（便于测试），为空时取 time.time()
+    
+    Returns:
+        等待秒数，没有或无法解析时返回 None
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    
+    retry_after = headers.get("retry-after", "").strip()
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """在内层传输之上重试连接失败与限流 / 网关错误"""
+    
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_backoff: float = 8.0,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+        rng: Callable[[], float] = random.random
+    ):
+        """
+        Args:
+            transport: 实际发送请求的传输
+            max_retries: 最大重试次数
+            backoff: 首次重试的退避上限（秒），之后每次翻倍
+            max_backoff: 单次等待上限（秒）；Retry-After 超过该值时不再重试，直接返回响应
+            sleep: 等待函数（便于测试）
+            rng: [0, 1) 随机数（便于测试）
+        """
+        self._transport = transport
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        self._rng = rng
+    
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """
+        第 attempt 次（从 0 开始）重试前的等待秒数
+        
+        Args:
+            attempt: 已重试次数
+            response: 触发重试的响应，连接失败时为空
+            
+        Returns:
+            等待秒数；Retry-After 超过 max_backoff 时返回 None
+        """
+        if response is not None:
+            retry_after = parse_retry_after(response.headers)
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_backoff else None
+        # 全抖动：并发请求同时失败时错开重试时间
+        return self._rng() * min(self.max_backoff, self.backoff * 2 ** attempt)
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # 流式请求体无法重放，只在连接阶段失败时重试
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        attempt = 0
+        while True:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                reason = "connect"
+                logger.debug(f"连接 {request.url.host} 失败，{delay:.2f}s 后重试: {str(e)}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries or not replayable:
+                    return response
+                delay = self.retry_delay(attempt, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+                reason = str(response.status_code)
+                logger.debug(f"{request.url.path} 返回 {response.status_code}，{delay:.2f}s 后重试")
+            
+            metrics.HTTP_RETRIES.labels(reason=reason).inc()
+            await self._sleep(delay)
+            attempt += 1
+    
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _TransportLease(httpx.AsyncBaseTransport):
+    """共享传输的一个引用：关闭时引用数减一，最后一个引用关闭后才关闭连接池"""
+    
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self._closed = False
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+    
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        await _release(self._transport)
+
+
+def create_transport() -> httpx.AsyncBaseTransport:
+    """按 HTTP_* 配置创建连接池传输（HTTP_MAX_RETRIES > 0 时外加重试）"""
+    http2 = settings.HTTP2_ENABLED and http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        logger.info("未安装 h2，OpenAI 客户端使用 HTTP/1.1（pip install 'httpx[http2]' 启用 HTTP/2）")
+    
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    if settings.HTTP_MAX_RETRIES <= 0:
+        return transport
+    return RetryTransport(
+        transport,
+        max_retries=settings.HTTP_MAX_RETRIES,
+        backoff=settings.HTTP_RETRY_BACKOFF,
+        max_backoff=settings.HTTP_RETRY_MAX_BACKOFF
+    )
+
+
+def shared_transport() -> httpx.AsyncBaseTransport:
+    """取得进程内共享传输的一个引用（首次调用时创建）"""
+    global _shared_transport, _shared_refs
+    if _shared_transport is None:
+        _shared_transport = create_transport()
+    _shared_refs += 1
+    return _TransportLease(_shared_transport)
+
+
+async def _release(transport: httpx.AsyncBaseTransport):
+    global _shared_transport, _shared_refs
+    if transport is not _shared_transport:
+        return
+    _shared_refs -= 1
+    if _shared_refs <= 0:
+        _shared_transport = None
+        _shared_refs = 0
+        await transport.aclose()
+
+
+def create_openai_client() -> AsyncOpenAI:
+    """创建使用共享传输的 AsyncOpenAI 客户端（重试由传输层负责）"""
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL or None,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            transport=shared_transport(),
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True
+        )
+    )
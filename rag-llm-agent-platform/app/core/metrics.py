@@ -0,0 +1,153 @@
+"""
+Prometheus 指标
+
+热路径上每次观测只做一次 perf_counter 差值和 Histogram.observe（约 1-2 微秒）；
+标签固定的子指标在导入时预先取出，避免每次调用 .labels() 的查找与加锁开销。
+连接池占用通过回调在抓取时计算，不在请求路径上更新。
+"""
+from typing import Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# 覆盖 1ms 到 60s，兼顾向量检索（毫秒级）与 LLM 生成（秒级）
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+EMBEDDING_LATENCY = Histogram(
+    "rag_embedding_seconds",
+    "Embedding 接口调用耗时",
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size",
+    "单次 Embedding 请求的文本条数",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+VECTOR_SEARCH_LATENCY = Histogram(
+    "rag_vector_search_seconds",
+    "向量检索耗时（memory 为进程内索引）",
+    ["mode"],
+    buckets=LATENCY_BUCKETS
+)
+VECTOR_SEARCH_VECTOR = VECTOR_SEARCH_LATENCY.labels(mode="vector")
+VECTOR_SEARCH_HYBRID = VECTOR_SEARCH_LATENCY.labels(mode="hybrid")
+VECTOR_SEARCH_BATCH = VECTOR_SEARCH_LATENCY.labels(mode="batch")
+VECTOR_SEARCH_MEMORY = VECTOR_SEARCH_LATENCY.labels(mode="memory")
+
+MEMORY_INDEX_ROWS = Gauge(
+    "rag_memory_index_rows",
+    "内存向量索引中的行数"
+)
+
+RERANK_LATENCY = Histogram(
+    "rag_rerank_seconds",
+    "重排序耗时",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+RERANK_RERANKED = RERANK_LATENCY.labels(outcome="reranked")
+RERANK_SKIPPED = RERANK_LATENCY.labels(outcome="skipped")
+
+LLM_TTFT = Histogram(
+    "rag_llm_ttft_seconds",
+    "LLM 流式输出首字延迟",
+    ["provider"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_LATENCY = Histogram(
+    "rag_llm_seconds",
+    "LLM 调用总耗时",
+    ["provider", "mode"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_PROVIDERS = ("openai", "bedrock")
+LLM_TTFT_BY_PROVIDER = {provider: LLM_TTFT.labels(provider=provider) for provider in LLM_PROVIDERS}
+LLM_COMPLETE_BY_PROVIDER = {provider: LLM_LATENCY.labels(provider=provider, mode="complete") for provider in LLM_PROVIDERS}
+LLM_STREAM_BY_PROVIDER = {provider: LLM_LATENCY.labels(provider=provider, mode="stream") for provider in LLM_PROVIDERS}
+
+TOOL_LATENCY = Histogram(
+    "rag_tool_seconds",
+    "工具执行耗时",
+    ["tool", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+DB_POOL_IN_USE = Gauge(
+    "rag_db_pool_in_use",
+    "向量数据库连接池中正在使用的连接数"
+)
+DB_POOL_SIZE = Gauge(
+    "rag_db_pool_size",
+    "向量数据库连接池当前连接数"
+)
+
+WS_ACTIVE_CONNECTIONS = Gauge(
+    "rag_ws_active_connections",
+    "活跃的 WebSocket 连接数"
+)
+WS_FRAMES_SENT = Counter(
+    "rag_ws_frames_sent_total",
+    "WebSocket 发送的内容帧数"
+)
+WS_BYTES_SENT = Counter(
+    "rag_ws_bytes_sent_total",
+    "WebSocket 发送的内容字节数"
+)
+WS_MESSAGES_DROPPED = Counter(
+    "rag_ws_messages_dropped_total",
+    "单连接消息队列已满而被拒绝的 WebSocket 消息数"
+)
+
+CONCURRENCY_LIMIT = Gauge(
+    "rag_concurrency_limit",
+    "自适应并发上限",
+    ["name"]
+)
+CONCURRENCY_IN_FLIGHT = Gauge(
+    "rag_concurrency_in_flight",
+    "正在执行的请求数",
+    ["name"]
+)
+CONCURRENCY_REJECTED = Counter(
+    "rag_concurrency_rejected_total",
+    "超出并发容量被拒绝的请求数",
+    ["name", "reason"]
+)
+
+HTTP_RETRIES = Counter(
+    "rag_http_retries_total",
+    "OpenAI 兼容客户端在传输层的重试次数",
+    ["reason"]
+)
+
+_tool_children: Dict[Tuple[str, str], Histogram] = {}
+
+
+def observe_tool(tool_name: str, status: str, seconds: float):
+    """记录工具执行耗时（子指标按 (tool, status) 缓存）"""
+    child = _tool_children.get((tool_name, status))
+    if child is None:
+        child = _tool_children.setdefault((tool_name, status), TOOL_LATENCY.labels(tool=tool_name, status=status))
+    child.observe(seconds)
+
+
+def register_pool(vector_store):
+    """连接池指标在抓取时从 VectorStore.connection_pool 读取"""
+    def pool_size() -> float:
+        pool = vector_store.connection_pool
+        return pool.get_size() if pool else 0
+
+    def pool_in_use() -> float:
+        pool = vector_store.connection_pool
+        return pool.get_size() - pool.get_idle_size() if pool else 0
+
+    DB_POOL_SIZE.set_function(pool_size)
+    DB_POOL_IN_USE.set_function(pool_in_use)
+
+
+def render() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标"""
+    return generate_latest(), CONTENT_TYPE_LATEST
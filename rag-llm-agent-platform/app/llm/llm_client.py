@@ -1,16 +1,28 @@
 """
 LLM 客户端（支持 Amazon Bedrock 和 OpenAI）
 """
+import asyncio
+import json
 import logging
-from typing import Optional, List, Dict, AsyncGenerator
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, List, Dict, AsyncGenerator, Awaitable, Callable
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from openai import AsyncOpenAI
 
+from app.core import metrics
 from app.core.config import settings
+from app.core.http_client import create_openai_client
+from app.llm.tokens import count_tokens, window_by_tokens
 
 logger = logging.getLogger(__name__)
 
+# 执行单个工具调用 {"id", "name", "arguments"}，返回 {"tool_name", "result", "success"}
+ToolExecutor = Callable[[Dict], Awaitable[Dict]]
+
 
 class LLMClient:
     """LLM 客户端"""
@@ -19,6 +31,13 @@ class LLMClient:
         self.bedrock_client = None
         self.openai_client = None
         
+        # boto3 为同步 SDK，调用放到有界线程池中执行，避免阻塞事件循环
+        self._bedrock_executor = ThreadPoolExecutor(
+            max_workers=settings.BEDROCK_MAX_CONCURRENCY,
+            thread_name_prefix="bedrock"
+        )
+        self._bedrock_semaphore = asyncio.Semaphore(settings.BEDROCK_MAX_CONCURRENCY)
+        
         # 初始化 Bedrock 客户端
         if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
             try:
@@ -26,7 +45,11 @@ class LLMClient:
                     'bedrock-runtime',
                     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=settings.AWS_REGION
+                    region_name=settings.AWS_REGION,
+                    config=Config(
+                        read_timeout=settings.BEDROCK_TIMEOUT,
+                        max_pool_connections=settings.BEDROCK_MAX_CONCURRENCY
+                    )
                 )
                 logger.info("Bedrock 客户端初始化成功")
             except Exception as e:
@@ -34,9 +57,15 @@ class LLMClient:
         
         # 初始化 OpenAI 客户端
         if settings.OPENAI_API_KEY:
-            self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            self.openai_client = create_openai_client()
             logger.info("OpenAI 客户端初始化成功")
     
+    async def close(self):
+        """关闭 LLM 客户端"""
+        if self.openai_client:
+            await self.openai_client.close()
+        self._bedrock_executor.shutdown(wait=False)
+    
     async def chat(
         self,
         message: str,
@@ -44,7 +73,8 @@ class LLMClient:
         tools: Optional[List[Dict]] = None,
         tool_results: Optional[List[Dict]] = None,
         conversation_id: Optional[str] = None,
-        stream: bool = False
+        stream: bool = False,
+        history: Optional[List[Dict]] = None
     ) -> Dict:
         """
         调用 LLM 进行对话
@@ -56,86 +86,231 @@ class LLMClient:
             tool_results: 工具执行结果
             conversation_id: 会话ID
             stream: 是否流式输出
+            history: 会话历史（按时间顺序），按 HISTORY_TOKEN_BUDGET 截取最近的部分
             
         Returns:
             LLM 响应
         """
         # 构建提示词
-        prompt = self._build_prompt(message, context)
+        prompt = self._build_prompt(message, context, history, tool_results)
         
         # 优先使用 Bedrock
+        start = time.perf_counter()
         if self.bedrock_client:
-            return await self._chat_with_bedrock(prompt, tools, tool_results)
+            provider = "bedrock"
+            response = await self._chat_with_bedrock(prompt, tools, tool_results)
         elif self.openai_client:
-            return await self._chat_with_openai(prompt, tools, tool_results, stream)
+            provider = "openai"
+            response = await self._chat_with_openai(prompt, tools, tool_results, stream)
         else:
             raise ValueError("未配置 LLM 客户端")
+        metrics.LLM_COMPLETE_BY_PROVIDER[provider].observe(time.perf_counter() - start)
+        return response
     
     async def chat_stream(
         self,
         message: str,
         context: str = "",
         tools: Optional[List[Dict]] = None,
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        history: Optional[List[Dict]] = None,
+        tool_executor: Optional[ToolExecutor] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         流式对话
         
+        Args:
+            tool_executor: 工具执行函数；提供时模型可在流式输出中调用工具（仅 OpenAI），
+                执行结果回填后继续流式生成
+            
         Yields:
-            内容块
+            内容块；最后一块 done=True，附带首字延迟 ttft_ms、总耗时 total_ms 和已执行的工具调用 tool_calls
         """
-        prompt = self._build_prompt(message, context)
+        prompt = self._build_prompt(message, context, history)
         
         if self.openai_client:
-            async for chunk in self._chat_stream_openai(prompt, tools):
-                yield chunk
+            provider = "openai"
+            source = self._chat_stream_openai(prompt, tools, tool_executor)
+        elif self.bedrock_client:
+            provider = "bedrock"
+            source = self._chat_stream_bedrock(prompt)
         else:
-            # Bedrock 流式输出实现
-            response = await self._chat_with_bedrock(prompt, tools)
-            # 模拟流式输出
-            for char in response["content"]:
-                yield {"content": char, "done": False}
-            yield {"content": "", "done": True}
-    
-    def _build_prompt(self, message: str, context: str) -> str:
-        """构建提示词"""
+            raise ValueError("未配置 LLM 客户端")
+        
+        start = time.perf_counter()
+        ttft_ms = None
+        async for chunk in source:
+            if chunk.get("done"):
+                elapsed = time.perf_counter() - start
+                metrics.LLM_STREAM_BY_PROVIDER[provider].observe(elapsed)
+                total_ms = round(elapsed * 1000, 1)
+                logger.info(f"流式输出完成: ttft={ttft_ms}ms, total={total_ms}ms")
+                yield {**chunk, "ttft_ms": ttft_ms, "total_ms": total_ms}
+                continue
+            if ttft_ms is None and chunk.get("content"):
+                ttft = time.perf_counter() - start
+                metrics.LLM_TTFT_BY_PROVIDER[provider].observe(ttft)
+                ttft_ms = round(ttft * 1000, 1)
+            yield chunk
+    
+    def _build_prompt(
+        self,
+        message: str,
+        context: str,
+        history: Optional[List[Dict]] = None,
+        tool_results: Optional[List[Dict]] = None
+    ) -> str:
+        """构建提示词（会话历史按 token 预算保留最近的若干条，附带工具执行结果）"""
         parts = []
         
         if context:
             parts.append(f"上下文信息：\n{context}\n")
         
+        if history:
+            token_counts = [turn.get("tokens") or count_tokens(turn["content"]) for turn in history]
+            kept = window_by_tokens(token_counts, settings.HISTORY_TOKEN_BUDGET)
+            if kept:
+                lines = [
+                    f"{'用户' if turn['role'] == 'user' else '助手'}：{turn['content']}"
+                    for turn in history[-kept:]
+                ]
+                parts.append("对话历史：\n" + "\n".join(lines) + "\n")
+        
         parts.append(f"用户问题：{message}\n")
+        
+        if tool_results:
+            lines = [f"- {result['tool_name']}：{_tool_output(result)}" for result in tool_results]
+            parts.append("工具执行结果：\n" + "\n".join(lines) + "\n")
+        
         parts.append("请基于上下文信息回答用户问题，如果上下文不包含相关信息，请说明。")
         
         return "\n".join(parts)
     
+    async def _run_bedrock(self, func, *args, **kwargs):
+        """
+        在线程池中执行 Bedrock 同步调用
+        
+        并发数受 BEDROCK_MAX_CONCURRENCY 限制（超出的请求在事件循环侧排队），
+        单次调用超过 BEDROCK_TIMEOUT 秒抛出 asyncio.TimeoutError
+        """
+        future = await self._submit_bedrock(partial(func, *args, **kwargs))
+        # shield：超时只放弃等待，不取消 future，槽位仍由线程结束时的回调释放
+        return await asyncio.wait_for(asyncio.shield(future), timeout=settings.BEDROCK_TIMEOUT)
+    
+    async def _submit_bedrock(self, func) -> asyncio.Future:
+        """
+        占用一个并发槽位并把调用提交到线程池
+        
+        槽位在工作线程真正结束时（future 完成回调）释放，而不是在等待方退出时：
+        超时 / 取消后仍阻塞在 boto3 中的调用继续计入 BEDROCK_MAX_CONCURRENCY
+        
+        Returns:
+            工作线程的 future
+        """
+        await self._bedrock_semaphore.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._bedrock_executor, func)
+        except BaseException:
+            self._bedrock_semaphore.release()
+            raise
+        future.add_done_callback(self._release_bedrock_slot)
+        return future
+    
+    def _release_bedrock_slot(self, future: asyncio.Future):
+        self._bedrock_semaphore.release()
+        if not future.cancelled() and future.exception() is not None:
+            # 等待方已超时退出时，异常无人读取
+            logger.debug(f"Bedrock 调用结束（等待方可能已超时）: {str(future.exception())}")
+    
+    def _invoke_bedrock_sync(self, body: str) -> Dict:
+        """同步调用 Bedrock 并读取响应体（在工作线程中执行）"""
+        response = self.bedrock_client.invoke_model(
+            modelId=settings.BEDROCK_MODEL_ID,
+            body=body
+        )
+        return json.loads(response['body'].read())
+    
     async def _chat_with_bedrock(self, prompt: str, tools: Optional[List], tool_results: Optional[List]) -> Dict:
         """使用 Bedrock 调用"""
         try:
-            import json
             body = json.dumps({
                 "prompt": prompt,
                 "max_tokens_to_sample": 4096,
                 "temperature": 0.7
             })
             
-            response = self.bedrock_client.invoke_model(
-                modelId=settings.BEDROCK_MODEL_ID,
-                body=body
-            )
-            
             # 解析响应
-            response_body = json.loads(response['body'].read())
+            response_body = await self._run_bedrock(self._invoke_bedrock_sync, body)
             result = response_body.get('completion', '')
             
             return {
                 "content": result,
                 "tool_calls": None
             }
+        except asyncio.TimeoutError:
+            logger.error(f"Bedrock 调用超时: timeout={settings.BEDROCK_TIMEOUT}s")
+            raise
         except Exception as e:
             logger.error(f"Bedrock 调用失败: {str(e)}")
             raise
     
+    async def _chat_stream_bedrock(self, prompt: str) -> AsyncGenerator[Dict, None]:
+        """
+        Bedrock 流式输出（invoke_model_with_response_stream）
+        
+        事件流在工作线程中同步读取，每个事件解析出的文本片段通过队列交回事件循环，
+        按模型返回的 token 片段原样输出
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        end_of_stream = object()
+        body = json.dumps({
+            "prompt": prompt,
+            "max_tokens_to_sample": 4096,
+            "temperature": 0.7
+        })
+        
+        def read_stream():
+            try:
+                response = self.bedrock_client.invoke_model_with_response_stream(
+                    modelId=settings.BEDROCK_MODEL_ID,
+                    body=body
+                )
+                event_stream = response["body"]
+                for event in event_stream:
+                    if stopped.is_set():
+                        # 消费方已退出（如 WebSocket 断开），提前关闭事件流
+                        close = getattr(event_stream, "close", None)
+                        if close:
+                            close()
+                        break
+                    chunk = event.get("chunk")
+                    if chunk:
+                        text = json.loads(chunk["bytes"]).get("completion", "")
+                        if text:
+                            loop.call_soon_threadsafe(queue.put_nowait, text)
+                loop.call_soon_threadsafe(queue.put_nowait, end_of_stream)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        
+        # 槽位在读取线程结束时释放（消费方提前退出后线程可能仍阻塞在下一个事件上）
+        await self._submit_bedrock(read_stream)
+        try:
+            while True:
+                # 超时按相邻两个片段的间隔计算
+                item = await asyncio.wait_for(queue.get(), timeout=settings.BEDROCK_TIMEOUT)
+                if item is end_of_stream:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"Bedrock 流式调用失败: {str(item)}")
+                    raise item
+                yield {"content": item, "done": False}
+        finally:
+            stopped.set()
+        
+        yield {"content": "", "done": True}
+    
     async def _chat_with_openai(self, prompt: str, tools: Optional[List], tool_results: Optional[List], stream: bool) -> Dict:
         """使用 OpenAI 调用"""
         messages = [{"role": "user", "content": prompt}]
@@ -143,8 +318,8 @@ class LLMClient:
         response = await self.openai_client.chat.completions.create(
             model="gpt-4",
             messages=messages,
-            tools=tools,
-            stream=stream
+            stream=stream,
+            **_tools_param(tools)
         )
         
         if stream:
@@ -154,28 +329,155 @@ class LLMClient:
                     content += chunk.choices[0].delta.content
             return {"content": content, "tool_calls": None}
         else:
+            tool_calls = response.choices[0].message.tool_calls
             return {
                 "content": response.choices[0].message.content,
-                "tool_calls": response.choices[0].message.tool_calls
+                "tool_calls": [
+                    {"id": call.id, "name": call.function.name, "arguments": _parse_arguments(call.function.arguments)}
+                    for call in tool_calls
+                ] if tool_calls else None
             }
     
-    async def _chat_stream_openai(self, prompt: str, tools: Optional[List]) -> AsyncGenerator[Dict, None]:
-        """OpenAI 流式输出"""
-        messages = [{"role": "user", "content": prompt}]
+    async def _chat_stream_openai(
+        self,
+        prompt: str,
+        tools: Optional[List],
+        tool_executor: Optional[ToolExecutor] = None
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        OpenAI 流式输出（支持工具调用）
         
-        stream = await self.openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            tools=tools,
-            stream=True
-        )
+        流式的 tool_calls 增量按 index 累积，某个调用的参数完整（下一个调用开始或本轮结束）后立即
+        交给 tool_executor 执行，与后续的流式输出并行；本轮结束后带上 assistant 消息（本轮已输出的
+        内容与 tool_calls）及 tool 结果消息继续流式生成。最多 TOOL_STREAM_MAX_ROUNDS 轮工具调用，最后一轮不再提供工具。
+        未提供 tool_executor 时不向模型提供工具。
+        """
+        messages = [{"role": "user", "content": prompt}]
+        executed: List[Dict] = []
         
-        async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield {
-                    "content": chunk.choices[0].delta.content,
-                    "done": False
-                }
+        for round_index in range(settings.TOOL_STREAM_MAX_ROUNDS + 1):
+            offer_tools = tool_executor is not None and round_index < settings.TOOL_STREAM_MAX_ROUNDS
+            stream = await self.openai_client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                stream=True,
+                **_tools_param(tools if offer_tools else None)
+            )
+            
+            calls = _StreamedToolCalls(tool_executor)
+            content: List[str] = []
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content.append(delta.content)
+                        yield {
+                            "content": delta.content,
+                            "done": False
+                        }
+                    if delta.tool_calls and offer_tools:
+                        calls.feed(delta.tool_calls)
+                
+                if not calls.pending:
+                    break
+                results = await calls.finish()
+            finally:
+                # 消费方提前退出（如 WebSocket 断开）时取消仍在执行的工具
+                calls.cancel()
+            
+            logger.info(f"流式工具调用完成: round={round_index + 1}, tools={[result['tool_name'] for result in results]}")
+            executed.extend(results)
+            messages.append({
+                "role": "assistant",
+                "content": "".join(content) or None,
+                "tool_calls": calls.message_tool_calls()
+            })
+            messages.extend(
+                {"role": "tool", "tool_call_id": call["id"], "content": _tool_output(result)}
+                for call, result in zip(calls.ordered(), results)
+            )
         
-        yield {"content": "", "done": True}
+        yield {"content": "", "done": True, "tool_calls": executed or None}
+
+
+class _StreamedToolCalls:
+    """一轮流式输出中的工具调用：按 index 累积增量，参数完整的调用立即开始执行"""
+    
+    def __init__(self, executor: Optional[ToolExecutor]):
+        self.executor = executor
+        self._calls: Dict[int, Dict] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+    
+    @property
+    def pending(self) -> bool:
+        return bool(self._calls)
+    
+    def feed(self, deltas):
+        """累积一个 chunk 中的 tool_calls 增量"""
+        for delta in deltas:
+            # 模型按 index 顺序逐个输出调用，新 index 出现说明之前的调用参数已完整
+            for index in self._calls:
+                if index < delta.index and index not in self._tasks:
+                    self._start(index)
+            call = self._calls.setdefault(delta.index, {"id": "", "name": "", "arguments": ""})
+            if delta.id:
+                call["id"] = delta.id
+            if delta.function:
+                call["name"] += delta.function.name or ""
+                call["arguments"] += delta.function.arguments or ""
+    
+    async def finish(self) -> List[Dict]:
+        """启动剩余的调用，按 index 顺序返回全部结果"""
+        for index in self._calls:
+            if index not in self._tasks:
+                self._start(index)
+        return list(await asyncio.gather(*(self._tasks[index] for index in sorted(self._calls))))
+    
+    def ordered(self) -> List[Dict]:
+        return [self._calls[index] for index in sorted(self._calls)]
+    
+    def message_tool_calls(self) -> List[Dict]:
+        """回填给模型的 assistant tool_calls"""
+        return [
+            {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for call in self.ordered()
+        ]
+    
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+    
+    def _start(self, index: int):
+        call = self._calls[index]
+        self._tasks[index] = asyncio.create_task(self._run(call))
+        logger.info(f"流式工具调用参数已完整，开始执行: {call['name']}")
+    
+    async def _run(self, call: Dict) -> Dict:
+        try:
+            arguments = json.loads(call["arguments"] or "{}")
+        except ValueError:
+            return {"tool_name": call["name"], "result": "执行失败: 参数不是合法的 JSON", "success": False}
+        return await self.executor({"id": call["id"], "name": call["name"], "arguments": arguments})
+
+
+def _tools_param(tools: Optional[List]) -> Dict:
+    """没有可用工具时不传 tools 参数（OpenAI 不接受空列表）"""
+    return {"tools": list(tools)} if tools else {}
+
+
+def _parse_arguments(arguments: Optional[str]) -> Dict:
+    try:
+        return json.loads(arguments or "{}")
+    except ValueError:
+        logger.warning(f"工具调用参数不是合法的 JSON: {arguments!r}")
+        return {}
+
 
+def _tool_output(result: Dict) -> str:
+    """工具结果序列化为模型可读的文本"""
+    output = result.get("result")
+    if isinstance(output, str):
+        return output
+    return json.dumps(output, ensure_ascii=False, default=str)
@@ -0,0 +1,119 @@
+"""
+Token 计数
+
+安装 tiktoken 时按模型分词器精确计数；否则使用估算：
+CJK 字符按 1 token/字，其余字符按 4 字符/token。
+"""
+import logging
+import math
+from functools import lru_cache
+from typing import List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4"
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 分词表需要联网下载，离线环境下退回估算
+        logger.warning(f"tiktoken 分词器加载失败，使用估算计数: {str(e)}")
+        return None
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+        or 0xAC00 <= code <= 0xD7AF
+        or 0x3040 <= code <= 0x30FF
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数（不依赖分词器）"""
+    cjk = sum(1 for char in text if _is_cjk(char))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    计算文本的 token 数
+    
+    Args:
+        text: 文本
+        model: 模型名，默认 gpt-4
+        
+    Returns:
+        token 数
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model or DEFAULT_MODEL)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    截断文本到不超过 max_tokens 个 token
+    
+    Args:
+        text: 文本
+        max_tokens: token 上限
+        model: 模型名，默认 gpt-4
+        
+    Returns:
+        截断后的文本（未超出时原样返回）
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model or DEFAULT_MODEL)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    
+    # 估算模式：与 estimate_tokens 使用相同的计费规则
+    used = 0.0
+    for i, char in enumerate(text):
+        used += 1 if _is_cjk(char) else 0.25
+        if math.ceil(used) > max_tokens:
+            return text[:i]
+    return text
+
+
+def window_by_tokens(token_counts: List[int], budget: int) -> int:
+    """
+    从最新一条往前累加，返回预算内可保留的条数
+    
+    Args:
+        token_counts: 按时间顺序排列的每条 token 数
+        budget: token 预算
+        
+    Returns:
+        可保留的最新条数
+    """
+    used = 0
+    kept = 0
+    for tokens in reversed(token_counts):
+        if used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+    return kept
@@ -1,18 +1,53 @@
 """
 RAG + LLM Agent 平台主入口
 """
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import chat, health, docs
+from app.agents.rag_agent import RAGAgent
+from app.api import chat, documents, health
+from app.core import metrics
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：进程内共享一个 RAGAgent
+
+    启动时创建 Agent 并预热向量数据库连接池，所有路由通过依赖注入复用同一实例
+    （Embedding / LLM 客户端、连接池、工具注册表），关闭时统一释放连接池
+    """
+    agent = RAGAgent()
+    try:
+        await agent.startup()
+    except Exception as e:
+        # 数据库暂不可用时仍然启动，后续请求会懒加载重连
+        logger.warning(f"Agent 预热失败: {str(e)}")
+    app.state.agent = agent
+    metrics.register_pool(agent.vector_store)
+    logger.info("共享 RAGAgent 初始化完成")
+
+    try:
+        yield
+    finally:
+        app.state.agent = None
+        await agent.close()
+        logger.info("共享 RAGAgent 已关闭")
+
+
 app = FastAPI(
     title="RAG LLM Agent Platform",
     description="基于 RAG 和 Function Calling 的企业级 AI Agent 平台",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan
 )
 
 # CORS 配置
@@ -27,6 +62,10 @@ app.add_middleware(
 # 注册路由
 app.include_router(health.router, prefix="/api/v1", tags=["健康检查"])
 app.include_router(chat.router, prefix="/api/v1", tags=["对话"])
+app.include_router(documents.router, prefix="/api/v1", tags=["文档"])
+
+# 自定义 OpenAPI 文档（docs 模块依赖 app 实例，需在 app 创建后导入）
+from app.api import docs  # noqa: E402,F401
 
 
 @app.get("/")
@@ -37,7 +76,13 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 指标抓取端点"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
-
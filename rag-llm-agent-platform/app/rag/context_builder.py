@@ -0,0 +1,131 @@
+"""
+RAG 上下文组装
+
+按检索排序依次放入文档，控制提示词大小：
+- 单篇文档超过 per_doc_tokens 时截断
+- 与已选文档高度重叠的分块（包含关系或 n-gram Jaccard 相似度超过阈值）跳过
+- 总 token 数不超过 max_tokens，最后一篇按剩余预算截断
+各片段收集到列表中最后一次 join，避免反复拼接字符串。
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List
+
+from app.llm.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+HEADER = "相关文档内容："
+SHINGLE_SIZE = 8
+# 剩余预算不足时不再放入被截得过短的文档
+MIN_DOC_TOKENS = 32
+
+
+@dataclass
+class BuiltContext:
+    """组装结果"""
+    text: str = ""
+    tokens: int = 0
+    documents: List[Dict] = field(default_factory=list)
+    truncated: int = 0
+    duplicates: int = 0
+
+
+class ContextBuilder:
+    """按 token 预算组装 RAG 上下文"""
+    
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        per_doc_tokens: int = 500,
+        dedup_threshold: float = 0.8
+    ):
+        """
+        Args:
+            max_tokens: 上下文总 token 预算
+            per_doc_tokens: 单篇文档 token 上限
+            dedup_threshold: 判定为重叠分块的 Jaccard 相似度阈值
+        """
+        self.max_tokens = max_tokens
+        self.per_doc_tokens = per_doc_tokens
+        self.dedup_threshold = dedup_threshold
+    
+    def build(self, docs: List[Dict]) -> BuiltContext:
+        """
+        组装上下文
+        
+        Args:
+            docs: 检索结果（按相关度排序），包含 content / source
+        
+        Returns:
+            组装结果：文本、token 数、实际使用的文档
+        """
+        result = BuiltContext()
+        if not docs:
+            return result
+        
+        parts = [HEADER]
+        used = count_tokens(HEADER)
+        seen: List[FrozenSet[str]] = []
+        seen_texts: List[str] = []
+        
+        for doc in docs:
+            content = (doc.get("content") or "").strip()
+            if not content:
+                continue
+            
+            normalized = " ".join(content.split())
+            shingles = _shingles(normalized)
+            if self._is_duplicate(normalized, shingles, seen_texts, seen):
+                result.duplicates += 1
+                continue
+            
+            index = len(result.documents) + 1
+            source_line = f"来源: {doc['source']}" if doc.get("source") else ""
+            overhead = count_tokens(f"\n[{index}] ") + (count_tokens(source_line) + 1 if source_line else 0)
+            budget = min(self.per_doc_tokens, self.max_tokens - used - overhead)
+            if budget < MIN_DOC_TOKENS:
+                break
+            
+            doc_tokens = count_tokens(content)
+            if doc_tokens > budget:
+                content = truncate_to_tokens(content, budget)
+                doc_tokens = count_tokens(content)
+                result.truncated += 1
+            
+            parts.append(f"\n[{index}] {content}")
+            if source_line:
+                parts.append(source_line)
+            used += doc_tokens + overhead
+            result.documents.append(doc)
+            seen.append(shingles)
+            seen_texts.append(normalized)
+        
+        if not result.documents:
+            return result
+        
+        result.text = "\n".join(parts)
+        result.tokens = count_tokens(result.text)
+        return result
+    
+    def _is_duplicate(
+        self,
+        normalized: str,
+        shingles: FrozenSet[str],
+        seen_texts: List[str],
+        seen: List[FrozenSet[str]]
+    ) -> bool:
+        for text, other in zip(seen_texts, seen):
+            if normalized in text or text in normalized:
+                return True
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= self.dedup_threshold:
+                return True
+        return False
+
+
+def _shingles(text: str) -> FrozenSet[str]:
+    """字符 n-gram 集合（对中英文都适用）"""
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([text])
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
@@ -0,0 +1,171 @@
+"""
+documents 表变更通知（LISTEN/NOTIFY）
+
+documents 表上的语句级触发器在每条 INSERT / COPY / UPDATE / DELETE / TRUNCATE 之后向
+NOTIFY_CHANNEL 发一次通知，负载格式：
+- 插入："最小ID,最大ID"（兼容最初只有插入通知的版本）
+- 更新 / 删除："update:ID,ID,..." / "delete:ID,ID,..."，单条语句影响超过 _MAX_NOTIFY_IDS 行时为 "update:*" / "delete:*"
+- 清空表："truncate:*"
+
+通知只在事务提交后送达，多个工作进程各自监听：内存向量索引据此增量同步，
+语义回答缓存据此失效（VectorStore.generation，其他进程写入的文档也能使本进程的缓存失效）。
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "documents_inserted"
+
+# pg_notify 负载上限 8000 字节，超出的 ID 列表改为 "*"（监听方整体重建）
+_MAX_NOTIFY_IDS = 500
+
+NOTIFY_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION notify_documents_inserted() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM inserted) THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', (SELECT min(id) || ',' || max(id) FROM inserted));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION notify_documents_changed() RETURNS trigger AS $$
+    DECLARE
+        ids TEXT;
+    BEGIN
+        SELECT CASE WHEN count(*) > {_MAX_NOTIFY_IDS} THEN '*' ELSE string_agg(id::text, ',') END
+        INTO ids FROM changed;
+        IF ids IS NOT NULL THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', lower(TG_OP) || ':' || ids);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION notify_documents_truncated() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', 'truncate:*');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+NOTIFY_TRIGGER_SQL = """
+    CREATE OR REPLACE TRIGGER documents_inserted_notify
+    AFTER INSERT ON documents
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_inserted();
+    
+    CREATE OR REPLACE TRIGGER documents_updated_notify
+    AFTER UPDATE ON documents
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_changed();
+    
+    CREATE OR REPLACE TRIGGER documents_deleted_notify
+    AFTER DELETE ON documents
+    REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_changed();
+    
+    CREATE OR REPLACE TRIGGER documents_truncated_notify
+    AFTER TRUNCATE ON documents
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_truncated()
+"""
+
+
+@dataclass
+class DocumentChange:
+    """一次变更通知：insert 为 ID 范围 (low, high]，update / delete 为 ID 列表，reset 表示需要整体重建"""
+    op: str
+    low: int = 0
+    high: int = 0
+    ids: List[int] = field(default_factory=list)
+
+
+def parse_change(payload: str) -> Optional[DocumentChange]:
+    """
+    解析通知负载
+    
+    Args:
+        payload: 通知负载
+    
+    Returns:
+        变更；无法解析时返回 None
+    """
+    op, sep, rest = payload.partition(":")
+    try:
+        if not sep:
+            low, high = (int(value) for value in payload.split(","))
+            return DocumentChange("insert", low=low - 1, high=high)
+        if op == "truncate" or (op in ("update", "delete") and rest == "*"):
+            return DocumentChange("reset")
+        if op in ("update", "delete"):
+            return DocumentChange(op, ids=[int(value) for value in rest.split(",")])
+    except ValueError:
+        pass
+    logger.warning(f"忽略无法解析的通知: {payload!r}")
+    return None
+
+
+class DocumentChangeListener:
+    """
+    只用于感知变更的 LISTEN 连接（未启用内存向量索引时使用，内存索引副本自带同一通知）
+    
+    每条可解析的通知以及每次（重新）连接后调用 on_change：断开期间的变更无从得知，按已变更处理
+    """
+    
+    def __init__(self, connect: Callable, on_change: Callable[[], None], retry_seconds: float = 5.0):
+        """
+        Args:
+            connect: 建立独立数据库连接的协程函数（LISTEN 需要独占连接）
+            on_change: 文档变更回调
+            retry_seconds: 连接断开后的重连间隔
+        """
+        self._connect = connect
+        self.on_change = on_change
+        self.retry_seconds = retry_seconds
+        self.listening = False
+        self.notifications = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """在后台开始监听（已启动时无操作）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.listening = False
+    
+    async def _run(self):
+        while True:
+            lost = asyncio.Event()
+            conn = None
+            try:
+                conn = await self._connect()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                self.listening = True
+                self.on_change()
+                await lost.wait()
+                logger.warning("文档变更通知连接已断开")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"文档变更通知监听失败: {str(e)}")
+            finally:
+                self.listening = False
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.retry_seconds)
+    
+    def _on_notify(self, conn, pid, channel, payload):
+        if parse_change(payload) is None:
+            return
+        self.notifications += 1
+        self.on_change()
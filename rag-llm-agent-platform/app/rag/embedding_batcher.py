@@ -0,0 +1,97 @@
+"""
+Embedding 微批处理
+
+并发会话各自发起的单条 Embedding 请求，在很短的时间窗口内（或攒满 N 条）
+合并为一次 embeddings.create(input=[...]) 调用，再把结果分发回各个等待方。
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Embedding 微批处理器"""
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Args:
+            embed_batch: 批量向量化函数，返回与输入顺序一致的向量列表
+            max_batch_size: 单批最大条数，攒满立即发送
+            max_wait_ms: 首条请求进入后的最长等待时间
+        """
+        self._embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """提交单条文本，等待所在批次完成后返回其向量"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """发送当前批次"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, pending: List[Tuple[str, asyncio.Future]]):
+        # 同一批内的重复文本只请求一次
+        texts = list(dict.fromkeys(text for text, _ in pending))
+        self.batches += 1
+
+        try:
+            embeddings = await self._embed_batch(texts)
+        except Exception as e:
+            logger.error(f"Embedding 批量请求失败: size={len(texts)}, 错误: {str(e)}")
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text: Dict[str, List[float]] = dict(zip(texts, embeddings))
+        for text, future in pending:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    async def close(self):
+        """发送剩余请求并等待进行中的批次完成"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """批处理统计"""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0
+        }
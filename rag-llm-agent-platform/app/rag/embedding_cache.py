@@ -0,0 +1,217 @@
+"""
+Embedding 缓存（进程内 LRU + 可选 SQLite 持久层）
+
+缓存键为 (模型名, 归一化文本)，相同问题不再重复调用 Embedding 接口。
+向量以 float32 数组保存，1536 维约 6KB/条。
+"""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """归一化查询文本：NFKC、折叠空白、忽略大小写"""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+class SQLiteEmbeddingStore:
+    """SQLite 持久层，进程重启后仍可命中；过期行不返回，每 prune_every 次写入清理过期行并裁剪到 max_rows"""
+    
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 0,
+        max_rows: int = 0,
+        prune_every: int = 1000,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            path: 数据库文件路径
+            ttl: 过期秒数（按写入时间），0 表示不过期
+            max_rows: 最大行数，超出时删除最早写入的行，0 表示不限
+            prune_every: 每多少次写入清理一次
+            clock: 墙钟时间（跨进程持久化，不能用 monotonic）
+        """
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._clock = clock
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embedding_cache_created_at ON embedding_cache (created_at)"
+            )
+            self._conn.commit()
+        # 启动时先清理一次，上次运行遗留的过期行 / 超额行不必等到写满 prune_every 次
+        self.prune()
+    
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def _min_created_at(self) -> float:
+        return self._clock() - self.ttl if self.ttl > 0 else float("-inf")
+    
+    def get(self, model: str, text: str) -> Optional[array]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT embedding FROM embedding_cache WHERE model = ? AND text_hash = ? AND created_at >= ?",
+                (model, self._hash(text), self._min_created_at())
+            ).fetchone()
+        if row is None:
+            return None
+        values = array("f")
+        values.frombytes(row[0])
+        return values
+    
+    def set(self, model: str, text: str, values: array):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache VALUES (?, ?, ?, ?)",
+                (model, self._hash(text), values.tobytes(), self._clock())
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes < self.prune_every:
+                return
+        self.prune()
+    
+    def prune(self) -> int:
+        """
+        删除过期行，并把行数裁剪到 max_rows（先删最早写入的）
+        
+        Returns:
+            删除的行数
+        """
+        with self._lock:
+            self._writes = 0
+            deleted = 0
+            if self.ttl > 0:
+                deleted += self._conn.execute(
+                    "DELETE FROM embedding_cache WHERE created_at < ?",
+                    (self._min_created_at(),)
+                ).rowcount
+            if self.max_rows > 0:
+                deleted += self._conn.execute(
+                    """
+                    DELETE FROM embedding_cache WHERE rowid IN (
+                        SELECT rowid FROM embedding_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_rows,)
+                ).rowcount
+            self._conn.commit()
+        if deleted:
+            logger.info(f"Embedding 持久缓存清理: 删除 {deleted} 行")
+        return deleted
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """Embedding LRU 缓存（容量 + TTL 淘汰）"""
+    
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 86400,
+        sqlite_path: str = "",
+        sqlite_max_rows: int = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, array]]" = OrderedDict()
+        self._persistent = None
+        if sqlite_path:
+            self._persistent = SQLiteEmbeddingStore(sqlite_path, ttl=ttl, max_rows=sqlite_max_rows)
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+    
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        查询缓存
+        
+        Returns:
+            命中时返回向量，未命中返回 None
+        """
+        key = (model, normalize_text(text))
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, values = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return values.tolist()
+            del self._entries[key]
+        
+        if self._persistent:
+            values = await asyncio.to_thread(self._persistent.get, *key)
+            if values is not None:
+                self._put(key, values)
+                self.hits += 1
+                self.persistent_hits += 1
+                return values.tolist()
+        
+        self.misses += 1
+        return None
+    
+    async def set(self, model: str, text: str, embedding: List[float]):
+        """写入缓存（同时写入持久层）"""
+        key = (model, normalize_text(text))
+        values = array("f", embedding)
+        self._put(key, values)
+        if self._persistent:
+            try:
+                await asyncio.to_thread(self._persistent.set, *key, values)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding 持久缓存写入失败: {str(e)}")
+    
+    def _put(self, key: Tuple[str, str], values: array):
+        self._entries[key] = (self._clock() + self.ttl, values)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent_hits": self.persistent_hits,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+    
+    def close(self):
+        """关闭持久层"""
+        if self._persistent:
+            self._persistent.close()
@@ -0,0 +1,158 @@
+"""
+Embedding 提供方
+
+Retriever 通过 EmbeddingProvider 接口批量向量化，按 settings.EMBEDDING_MODEL 选择：
+- "local:<模型名或路径>"：进程内 CPU 推理（sentence-transformers，可选 ONNX Runtime 后端），
+  省去每次查询 100-300ms 的远程调用
+- 其他：OpenAI 兼容的远程 Embedding 接口
+
+本地推理在专用线程池中执行，不阻塞事件循环；并发查询由 Retriever 的 EmbeddingBatcher
+合并成批后一次 encode，输出为 float32 NumPy 向量。
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL_PREFIX = "local:"
+
+
+def is_local_model(model: str) -> bool:
+    """EMBEDDING_MODEL 是否指向本地模型"""
+    return model.startswith(LOCAL_MODEL_PREFIX)
+
+
+class EmbeddingProvider:
+    """Embedding 提供方接口"""
+    
+    name = "base"
+    
+    async def embed(self, texts: List[str]) -> Sequence[Sequence[float]]:
+        """
+        批量向量化
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            与输入顺序一致的向量列表
+        """
+        raise NotImplementedError
+    
+    async def warmup(self):
+        """预加载模型 / 建立连接，应用启动时调用"""
+    
+    def is_ready(self) -> bool:
+        """是否可以处理请求（用于就绪检查）"""
+        return True
+    
+    async def close(self):
+        """释放资源"""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI 兼容的远程 Embedding 接口"""
+    
+    name = "openai"
+    
+    def __init__(self, client, model: str):
+        """
+        Args:
+            client: AsyncOpenAI 客户端
+            model: 模型名
+        """
+        self.client = client
+        self.model = model
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    def is_ready(self) -> bool:
+        return bool(self.client.api_key)
+    
+    async def close(self):
+        await self.client.close()
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """进程内 CPU 推理（sentence-transformers）"""
+    
+    name = "local"
+    
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        workers: int = 1,
+        batch_size: int = 64,
+        normalize: bool = True,
+        model=None
+    ):
+        """
+        Args:
+            model_name: sentence-transformers 模型名或本地路径
+            backend: 推理后端：torch 或 onnx（ONNX Runtime，需 sentence-transformers>=3.2）
+            workers: 推理线程数；torch / onnxruntime 在单次 encode 内部已多线程，默认 1
+            batch_size: 单次 encode 的最大批大小
+            normalize: 是否输出单位向量（与余弦距离检索配合）
+            model: 已加载的模型（便于测试），为空时首次使用时加载
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self._model = model
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+    
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._model.get_sentence_embedding_dimension() if self._model is not None else None
+    
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        loop = asyncio.get_running_loop()
+        matrix = await loop.run_in_executor(self._executor, self._encode, texts)
+        return list(matrix)
+    
+    async def warmup(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._encode, ["warmup"])
+        logger.info(f"本地 Embedding 模型已加载: {self.model_name}, backend={self.backend}, dimension={self.dimension}")
+    
+    def is_ready(self) -> bool:
+        return self._model is not None
+    
+    async def close(self):
+        self._executor.shutdown(wait=False)
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        matrix = self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+            show_progress_bar=False
+        )
+        return np.asarray(matrix, dtype=np.float32)
+    
+    def _load(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                    except ImportError as e:
+                        raise RuntimeError(
+                            "本地 Embedding 模型需要安装 sentence-transformers（ONNX 后端另需 onnxruntime）"
+                        ) from e
+                    kwargs = {"device": "cpu"}
+                    if self.backend != "torch":
+                        kwargs["backend"] = self.backend
+                    self._model = SentenceTransformer(self.model_name, **kwargs)
+        return self._model
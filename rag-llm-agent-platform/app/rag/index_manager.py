@@ -0,0 +1,176 @@
+"""
+向量索引管理（pgvector HNSW / IVFFlat）
+
+根据数据量推导索引构建参数，并提供在线重建索引的管理命令：
+    python -m app.rag.index_manager status
+    python -m app.rag.index_manager reindex --method hnsw
+    python -m app.rag.index_manager text-index
+    python -m app.rag.index_manager notify-trigger
+"""
+import argparse
+import asyncio
+import logging
+import math
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.rag.document_changes import NOTIFY_CHANNEL, NOTIFY_FUNCTION_SQL, NOTIFY_TRIGGER_SQL
+from app.rag.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "documents_embedding_idx"
+INDEX_METHODS = ("hnsw", "ivfflat")
+TEXT_INDEX_NAME = "documents_content_tsv_idx"
+
+
+def plan_index(method: str, row_count: int) -> Dict:
+    """
+    根据数据量推导索引参数（参考 pgvector 官方建议）
+    
+    - IVFFlat: lists = 行数/1000（100 万行以内）或 sqrt(行数)，建议 probes = sqrt(lists)
+    - HNSW: 默认 m=16 / ef_construction=64，百万级以上提高到 m=24 / ef_construction=128
+    
+    Returns:
+        {"method", "build": 构建参数, "search": 建议的查询参数}
+    """
+    if method not in INDEX_METHODS:
+        raise ValueError(f"不支持的索引类型: {method}")
+    
+    if method == "ivfflat":
+        if row_count <= 1_000_000:
+            lists = max(10, row_count // 1000)
+        else:
+            lists = int(math.sqrt(row_count))
+        return {
+            "method": method,
+            "build": {"lists": lists},
+            "search": {"probes": max(1, int(math.sqrt(lists)))}
+        }
+    
+    if row_count <= 1_000_000:
+        m, ef_construction = 16, 64
+    else:
+        m, ef_construction = 24, 128
+    return {
+        "method": method,
+        "build": {"m": m, "ef_construction": ef_construction},
+        "search": {"ef_search": max(40, ef_construction // 2)}
+    }
+
+
+def index_ddl(plan: Dict, name: str = INDEX_NAME, table: str = "documents") -> str:
+    """生成建索引语句（CONCURRENTLY，不阻塞写入）"""
+    options = ", ".join(f"{key} = {int(value)}" for key, value in plan["build"].items())
+    return (
+        f"CREATE INDEX CONCURRENTLY {name} ON {table} "
+        f"USING {plan['method']} (embedding vector_cosine_ops) WITH ({options})"
+    )
+
+
+class IndexManager:
+    """向量索引管理器"""
+    
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+    
+    async def row_count(self) -> int:
+        """估算行数（pg_class.reltuples，避免全表 COUNT）"""
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            estimate = await conn.fetchval(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = 'documents'::regclass"
+            )
+            if estimate is None or estimate < 0:
+                estimate = await conn.fetchval("SELECT count(*) FROM documents")
+        return int(estimate)
+    
+    async def status(self) -> Dict:
+        """当前索引定义与行数"""
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            definition = await conn.fetchval(
+                "SELECT indexdef FROM pg_indexes WHERE tablename = 'documents' AND indexname = $1",
+                INDEX_NAME
+            )
+        return {"index": definition, "row_count": await self.row_count()}
+    
+    async def reindex(self, method: Optional[str] = None) -> Dict:
+        """
+        按当前数据量重建向量索引
+        
+        先并发创建新索引，再删除旧索引并改名，重建期间查询仍可使用旧索引
+        
+        Args:
+            method: hnsw / ivfflat，默认 settings.VECTOR_INDEX_METHOD
+            
+        Returns:
+            使用的索引计划
+        """
+        method = method or settings.VECTOR_INDEX_METHOD
+        plan = plan_index(method, await self.row_count())
+        new_name = f"{INDEX_NAME}_new"
+        
+        logger.info(f"开始重建向量索引: {plan}")
+        async with self.vector_store.connection_pool.acquire() as conn:
+            # CONCURRENTLY 不能在事务中执行
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}")
+            await conn.execute(index_ddl(plan, new_name))
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            await conn.execute(f"ALTER INDEX {new_name} RENAME TO {INDEX_NAME}")
+        logger.info(f"向量索引重建完成: {INDEX_NAME}")
+        return plan
+    
+    async def ensure_text_index(self):
+        """
+        为已有数据库补建全文检索列与 GIN 索引（混合检索使用）
+        
+        新库由 docker/init.sql 创建；添加 STORED 生成列会重写全表，请在低峰期执行
+        """
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            await conn.execute(
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+                "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED"
+            )
+            await conn.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TEXT_INDEX_NAME} "
+                "ON documents USING GIN (content_tsv)"
+            )
+        logger.info(f"全文索引已就绪: {TEXT_INDEX_NAME}")
+    
+    async def ensure_notify_trigger(self):
+        """
+        为已有数据库创建变更通知触发器（内存向量索引增量同步、语义缓存失效使用，需要 PostgreSQL 14+）
+        
+        新库由 docker/init.sql 创建
+        """
+        await self.vector_store.connect()
+        async with self.vector_store.connection_pool.acquire() as conn:
+            await conn.execute(NOTIFY_FUNCTION_SQL)
+            await conn.execute(NOTIFY_TRIGGER_SQL)
+        logger.info(f"变更通知触发器已就绪: channel={NOTIFY_CHANNEL}")
+
+
+async def _main(args):
+    vector_store = VectorStore()
+    manager = IndexManager(vector_store)
+    try:
+        if args.command == "reindex":
+            print(await manager.reindex(args.method))
+        elif args.command == "text-index":
+            await manager.ensure_text_index()
+        elif args.command == "notify-trigger":
+            await manager.ensure_notify_trigger()
+        else:
+            print(await manager.status())
+    finally:
+        await vector_store.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="pgvector 向量索引管理")
+    parser.add_argument("command", choices=["status", "reindex", "text-index", "notify-trigger"])
+    parser.add_argument("--method", choices=INDEX_METHODS, default=None)
+    asyncio.run(_main(parser.parse_args()))
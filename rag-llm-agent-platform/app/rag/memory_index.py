@@ -0,0 +1,592 @@
+"""
+进程内向量索引（IVF + 乘积量化，NumPy 实现）
+
+热点集合的检索耗时主要在数据库往返上。MEMORY_INDEX_ENABLED=true 时，VectorStore 启动后把
+documents 表加载到内存，无过滤条件的 search_similar / search_many 直接在本地回答：
+
+- 向量归一化后以 float16 保存，用于候选集的精确重排（余弦距离与 pgvector <=> 一致）
+- 粗聚类（IVF，nlist 个中心）+ 乘积量化编码（每个向量 pq_m 字节），查询时只扫描最近的
+  nprobe 个簇，用查表法（ADC）近似打分，取 top_k * rerank_factor 个候选精确重排
+- 行数不足 train_min 时不训练，直接精确扫描全部向量
+
+- 删除 / 更新的行先标记删除（检索时跳过），更新后的行重新写入；自上次训练后行数增长
+  retrain_growth 倍或已删除行超过 rebuild_deleted_ratio 时，另建新索引重新训练并去掉已删除行，
+  完成后整体替换，期间检索继续使用旧索引
+
+MemoryIndexReplica 负责与数据库同步：独立连接 LISTEN documents 表的变更通知（见
+app/rag/document_changes.py），先按主键分页加载全表，之后按通知增量加载新行、删除或重新加载
+变更行，无法逐行同步的变更（大批量更新 / 删除、TRUNCATE）整体重建。连接断开期间 ready 为 False，
+检索回退到 SQL；断开期间的更新 / 删除无从得知，重连后重新加载全表。
+"""
+import asyncio
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core import metrics
+from app.rag.document_changes import NOTIFY_CHANNEL, DocumentChange, parse_change
+from app.rag.pgvector_codec import decode_vector_numpy, encode_vector, init_connection
+
+logger = logging.getLogger(__name__)
+
+_LOAD_SQL = """
+    SELECT id, id::text AS doc_id, content, metadata, embedding
+    FROM documents
+    WHERE id > $1 AND id <= $2 AND embedding IS NOT NULL
+    ORDER BY id
+    LIMIT $3
+"""
+
+_LOAD_IDS_SQL = """
+    SELECT id, id::text AS doc_id, content, metadata, embedding
+    FROM documents
+    WHERE id = ANY($1::bigint[]) AND embedding IS NOT NULL
+    ORDER BY id
+"""
+
+_MAX_ID = 2 ** 63 - 1
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """每行最近的中心（L2）：argmax(x·c - |c|²/2)，分块避免大矩阵"""
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk):
+        scores = x[start:start + chunk] @ centroids.T - half_norms
+        labels[start:start + chunk] = scores.argmax(axis=1)
+    return labels
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd k-means，空簇保留上一轮中心"""
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _nearest(x, centroids)
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        present, starts, counts = np.unique(sorted_labels, return_index=True, return_counts=True)
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centroids[present] = sums / counts[:, None]
+    return centroids
+
+
+def _auto_pq_m(dim: int) -> int:
+    """子空间数：取能整除维度、且子空间维度不小于 16 的最大值（1536 维为 96）"""
+    for dsub in range(min(16, dim), dim + 1):
+        if dim % dsub == 0:
+            return dim // dsub
+    return 1
+
+
+class ProductQuantizer:
+    """乘积量化：向量切成 m 段，每段用 ksub 个中心之一的编号（uint8）表示"""
+    
+    def __init__(self, dim: int, m: int, ksub: int = 256):
+        if dim % m:
+            raise ValueError(f"维度 {dim} 不能被子空间数 {m} 整除")
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.ksub = ksub
+        self.codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+    
+    def train(self, x: np.ndarray, iters: int, rng: np.random.Generator):
+        # 每个中心约 64 个样本即可收敛，多余样本只增加训练耗时
+        if len(x) > 64 * self.ksub:
+            x = x[rng.choice(len(x), 64 * self.ksub, replace=False)]
+        self.ksub = min(self.ksub, len(x))
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(self._sub(x, i)), self.ksub, iters, rng)
+            for i in range(self.m)
+        ])
+    
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for i in range(self.m):
+            codes[:, i] = _nearest(np.ascontiguousarray(self._sub(x, i)), self.codebooks[i])
+        return codes
+    
+    def lookup(self, query: np.ndarray) -> np.ndarray:
+        """查询与每段每个中心的内积表 (m, ksub)，近似内积 = Σ table[i, code[i]]"""
+        return np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.m, self.dsub))
+    
+    def _sub(self, x: np.ndarray, i: int) -> np.ndarray:
+        return x[:, i * self.dsub:(i + 1) * self.dsub]
+
+
+class MemoryVectorIndex:
+    """
+    IVF-PQ 内存索引 + float16 精确重排
+    
+    写入（add / remove / train）需串行调用；检索可与写入并发：新行先写入存储数组，再发布到
+    count / 倒排列表，检索先读取列表快照再读取数组，扩容时旧数组仍有效。
+    """
+    
+    def __init__(
+        self,
+        dim: int,
+        nlist: int = 0,
+        nprobe: int = 16,
+        pq_m: int = 0,
+        rerank_factor: int = 40,
+        train_min: int = 10000,
+        train_sample: int = 50000,
+        train_iters: int = 10,
+        retrain_growth: float = 1.0,
+        rebuild_deleted_ratio: float = 0.2,
+        seed: int = 0
+    ):
+        """
+        Args:
+            dim: 向量维度
+            nlist: 粗聚类中心数，0 表示按训练时行数取 sqrt(行数)
+            nprobe: 查询扫描的簇数
+            pq_m: 乘积量化子空间数（每个向量的编码字节数），0 表示自动
+            rerank_factor: 近似打分取 top_k * rerank_factor 个候选做精确重排
+            train_min: 行数达到该值时训练 IVF-PQ，之前精确扫描
+            train_sample: 训练使用的最大采样行数
+            train_iters: k-means 迭代次数
+            retrain_growth: 自上次训练后行数增长该比例时需要重新训练（needs_rebuild），0 表示不重新训练
+            rebuild_deleted_ratio: 已删除行占比超过该值时需要重建
+            seed: 随机种子
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.train_min = train_min
+        self.train_sample = train_sample
+        self.train_iters = train_iters
+        self.retrain_growth = retrain_growth
+        self.rebuild_deleted_ratio = rebuild_deleted_ratio
+        self._seed = seed
+        self._pq_m = pq_m
+        self._rng = np.random.default_rng(seed)
+        self.pq = ProductQuantizer(dim, pq_m or _auto_pq_m(dim))
+        
+        # count 为存储行数（含已删除行），size 为有效行数
+        self.count = 0
+        self.removed = 0
+        self.trained_rows = 0
+        self._vectors = np.empty((0, dim), dtype=np.float16)
+        self._codes = np.empty((0, self.pq.m), dtype=np.uint8)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._docs: List[Tuple[str, Optional[Dict]]] = []
+        self._rows: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+    
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+    
+    @property
+    def size(self) -> int:
+        return self.count - self.removed
+    
+    @property
+    def needs_rebuild(self) -> bool:
+        """行数增长超过 retrain_growth 或已删除行过多时需要重建（rebuilt）"""
+        if self.removed and self.removed > self.rebuild_deleted_ratio * self.count:
+            return True
+        return bool(
+            self.trained and self.retrain_growth
+            and self.size >= (1 + self.retrain_growth) * self.trained_rows
+        )
+    
+    def add(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        contents: Sequence[str],
+        metadatas: Sequence[Optional[Dict]],
+        auto_train: bool = True
+    ) -> int:
+        """
+        添加向量（已存在的 ID 跳过）
+        
+        Args:
+            ids: 文档ID
+            vectors: (n, dim) 向量
+            contents: 文档内容
+            metadatas: 元数据
+            auto_train: 行数达到 train_min 时是否立即训练（批量加载时由调用方在加载完成后训练）
+            
+        Returns:
+            实际新增的行数
+        """
+        keep = [i for i, doc_id in enumerate(ids) if doc_id not in self._rows]
+        if not keep:
+            return 0
+        vectors = _normalize(np.asarray(vectors)[keep])
+        start, end = self.count, self.count + len(keep)
+        
+        if end > len(self._vectors):
+            capacity = max(end, 2 * len(self._vectors), 1024)
+            self._vectors = _grow(self._vectors, capacity, start)
+            self._deleted = _grow(self._deleted, capacity, start)
+            if self.trained:
+                self._codes = _grow(self._codes, capacity, start)
+        self._vectors[start:end] = vectors
+        for row, i in enumerate(keep, start):
+            self._ids.append(ids[i])
+            self._docs.append((contents[i], metadatas[i]))
+            self._rows[ids[i]] = row
+        
+        if self.trained:
+            labels = _nearest(vectors, self._centroids)
+            self._codes[start:end] = self.pq.encode(vectors - self._centroids[labels])
+            self._publish(labels, start)
+        self.count = end
+        
+        if auto_train and not self.trained and self.count >= self.train_min:
+            self.train()
+        return len(keep)
+    
+    def remove(self, ids: Sequence[str]) -> int:
+        """
+        标记删除（检索时跳过，needs_rebuild 后重建时去掉）
+        
+        Args:
+            ids: 文档ID，不存在的跳过
+            
+        Returns:
+            实际删除的行数
+        """
+        removed = 0
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is not None:
+                self._deleted[row] = True
+                removed += 1
+        self.removed += removed
+        return removed
+    
+    def empty_copy(self) -> "MemoryVectorIndex":
+        """参数相同的空索引"""
+        return MemoryVectorIndex(
+            self.dim,
+            nlist=self.nlist,
+            nprobe=self.nprobe,
+            pq_m=self._pq_m,
+            rerank_factor=self.rerank_factor,
+            train_min=self.train_min,
+            train_sample=self.train_sample,
+            train_iters=self.train_iters,
+            retrain_growth=self.retrain_growth,
+            rebuild_deleted_ratio=self.rebuild_deleted_ratio,
+            seed=self._seed
+        )
+    
+    def rebuilt(self) -> "MemoryVectorIndex":
+        """以当前有效行新建索引并重新训练（不修改本索引，检索可继续使用本索引）"""
+        index = self.empty_copy()
+        live = np.flatnonzero(~self._deleted[:self.count])
+        index.add(
+            [self._ids[row] for row in live],
+            self._vectors[live].astype(np.float32),
+            [self._docs[row][0] for row in live],
+            [self._docs[row][1] for row in live],
+            auto_train=False
+        )
+        index.train()
+        logger.info(f"内存向量索引已重建: rows={index.size}, 去掉已删除行 {self.removed}")
+        return index
+    
+    def train(self):
+        """按当前数据训练粗聚类中心与 PQ 码本，并为全部行编码"""
+        n = self.count
+        if n < max(self.train_min, 1):
+            return
+        vectors = self._vectors[:n].astype(np.float32)
+        sample = vectors[self._rng.choice(n, min(n, self.train_sample), replace=False)]
+        nlist = min(self.nlist or max(1, int(math.sqrt(n))), len(sample))
+        
+        # PQ 编码相对所属簇中心的残差，码本精度用在簇内差异上
+        centroids = _kmeans(sample, nlist, self.train_iters, self._rng)
+        self.pq.train(sample - centroids[_nearest(sample, centroids)], self.train_iters, self._rng)
+        labels = _nearest(vectors, centroids)
+        codes = np.empty((len(self._vectors), self.pq.m), dtype=np.uint8)
+        codes[:n] = self.pq.encode(vectors - centroids[labels])
+        
+        self._codes = codes
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._publish(labels, 0)
+        self._centroids = centroids
+        self.trained_rows = n - self.removed
+        logger.info(f"内存向量索引训练完成: rows={n}, nlist={nlist}, pq_m={self.pq.m}")
+    
+    def search(self, query: Sequence[float], top_k: int = 5) -> List[Dict]:
+        """
+        相似度检索
+        
+        Args:
+            query: 查询向量
+            top_k: 返回前K个结果
+            
+        Returns:
+            相似文档列表（id / content / metadata / distance，distance 为余弦距离）
+        """
+        query = _normalize(query)
+        if self.trained:
+            # 先确定候选行再读取数组：候选行发布前已写入数组，扩容后的新数组也包含它们
+            rows, base = self._probe(query, self._lists, self._centroids)
+            vectors, codes, deleted = self._vectors, self._codes, self._deleted
+            live = ~deleted[rows]
+            rows, base = rows[live], base[live]
+            candidates = top_k * self.rerank_factor
+            if len(rows) > candidates:
+                # 近似内积 = q·簇中心 + Σ 残差码本查表
+                table = self.pq.lookup(query)
+                approx = base + table[np.arange(self.pq.m), codes[rows]].sum(axis=1)
+                rows = rows[np.argpartition(-approx, candidates)[:candidates]]
+        else:
+            n, vectors, deleted = self.count, self._vectors, self._deleted
+            rows = np.flatnonzero(~deleted[:n])
+        if not len(rows):
+            return []
+        
+        scores = vectors[rows].astype(np.float32) @ query
+        order = np.argsort(-scores)[:top_k]
+        results = []
+        for i in order:
+            content, metadata = self._docs[rows[i]]
+            results.append({
+                "id": self._ids[rows[i]],
+                "content": content,
+                "metadata": metadata,
+                "distance": float(1.0 - scores[i])
+            })
+        return results
+    
+    def stats(self) -> Dict:
+        """行数与向量部分的内存占用（不含文档内容与元数据，含已删除行）"""
+        n = self.count
+        nbytes = n * self.dim * 2
+        if self.trained:
+            nbytes += n * (self.pq.m + 8) + self._centroids.nbytes + self.pq.codebooks.nbytes
+        return {
+            "rows": self.size,
+            "deleted": self.removed,
+            "trained": self.trained,
+            "nlist": len(self._lists),
+            "nprobe": self.nprobe,
+            "pq_m": self.pq.m,
+            "vector_bytes": nbytes,
+            "bytes_per_vector": nbytes / n if n else 0.0
+        }
+    
+    def _probe(
+        self,
+        query: np.ndarray,
+        lists: List[np.ndarray],
+        centroids: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """最近 nprobe 个簇中的行，以及每行所属簇中心与查询的内积"""
+        dots = centroids @ query
+        scores = dots - 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        nprobe = min(self.nprobe, len(centroids))
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        members = [lists[i] for i in probes]
+        return np.concatenate(members), np.repeat(dots[probes], [len(rows) for rows in members])
+    
+    def _publish(self, labels: np.ndarray, start: int):
+        """把新行加入倒排列表（替换列表对象，不原地修改，正在进行的检索不受影响）"""
+        rows = np.arange(start, start + len(labels))
+        order = np.argsort(labels, kind="stable")
+        present, starts = np.unique(labels[order], return_index=True)
+        for label, group in zip(present, np.split(rows[order], starts[1:])):
+            self._lists[label] = np.concatenate([self._lists[label], group])
+
+
+def _grow(array: np.ndarray, capacity: int, used: int) -> np.ndarray:
+    grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class MemoryIndexReplica:
+    """documents 表的内存副本：启动时全量加载，LISTEN/NOTIFY 增量同步"""
+    
+    def __init__(
+        self,
+        index: MemoryVectorIndex,
+        connect: Callable,
+        load_batch: int = 5000,
+        workers: int = 4,
+        retry_seconds: float = 5.0,
+        on_change: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            index: 内存索引
+            connect: 建立独立数据库连接的协程函数（LISTEN 需要独占连接）
+            load_batch: 每次从数据库加载的行数
+            workers: 检索 / 写入索引的线程数（NumPy 运算期间释放 GIL）
+            retry_seconds: 连接断开后的重连间隔
+            on_change: 文档变更回调（每条可解析的通知与每次全量加载后调用）
+        """
+        self.index = index
+        self.on_change = on_change
+        self._connect = connect
+        self.load_batch = load_batch
+        self.retry_seconds = retry_seconds
+        self.ready = False
+        self.max_id = 0
+        self.notifications = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memory-index")
+        self._write_lock = asyncio.Lock()
+        self._pending: List[DocumentChange] = []
+        self._drain_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self._conn = None
+    
+    def start(self):
+        """在后台加载并开始同步，加载完成前 ready 为 False"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def search(self, query: Sequence[float], top_k: int = 5) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.index.search, query, top_k)
+    
+    async def search_many(self, queries: Sequence[Sequence[float]], top_k: int = 5) -> List[List[Dict]]:
+        loop = asyncio.get_running_loop()
+        index = self.index
+        return await loop.run_in_executor(
+            self._executor, lambda: [index.search(query, top_k) for query in queries]
+        )
+    
+    async def close(self):
+        for task in (self._task, self._drain_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._drain_task = None
+        self.ready = False
+        self._executor.shutdown(wait=False)
+    
+    def stats(self) -> Dict:
+        return {**self.index.stats(), "ready": self.ready, "max_id": self.max_id, "notifications": self.notifications}
+    
+    async def _run(self):
+        while True:
+            lost = asyncio.Event()
+            conn = None
+            try:
+                conn = await self._connect()
+                await init_connection(conn)
+                # 加载时直接解码为 float32 数组，避免百万级 Python float 列表
+                await conn.set_type_codec(
+                    "vector", schema="public", encoder=encode_vector, decoder=decode_vector_numpy, format="binary"
+                )
+                conn.add_termination_listener(lambda _: lost.set())
+                # 先 LISTEN 再加载：加载期间提交的变更要么被分页读到，要么收到通知
+                await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                self._conn = conn
+                
+                async with self._write_lock:
+                    await self._reload(conn)
+                self.ready = True
+                await lost.wait()
+                logger.warning("内存向量索引的通知连接已断开，检索回退到数据库")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"内存向量索引同步失败，检索回退到数据库: {str(e)}")
+            finally:
+                self.ready = False
+                self._conn = None
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.retry_seconds)
+    
+    def _on_notify(self, conn, pid, channel, payload):
+        change = parse_change(payload)
+        if change is None:
+            return
+        self.notifications += 1
+        if self.on_change:
+            self.on_change()
+        self._pending.append(change)
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+    
+    async def _drain(self):
+        async with self._write_lock:
+            while self._pending and self._conn is not None:
+                change = self._pending.pop(0)
+                try:
+                    await self._apply(self._conn, change)
+                except Exception as e:
+                    # 连接断开时由重连后的全量加载补齐
+                    logger.error(f"内存向量索引增量同步失败: {change}, 错误: {str(e)}")
+            if self.index.needs_rebuild:
+                loop = asyncio.get_running_loop()
+                self.index = await loop.run_in_executor(self._executor, self.index.rebuilt)
+            metrics.MEMORY_INDEX_ROWS.set(self.index.size)
+    
+    async def _apply(self, conn, change: DocumentChange):
+        if change.op == "insert":
+            await self._load(conn, self.index, change.low, change.high, auto_train=True)
+        elif change.op == "reset":
+            await self._reload(conn)
+        else:
+            # 更新的行删除后按 ID 重新加载（内容、元数据或向量都可能变化）
+            self.index.remove([str(doc_id) for doc_id in change.ids])
+            if change.op == "update":
+                rows = await conn.fetch(_LOAD_IDS_SQL, change.ids)
+                await self._add_rows(self.index, rows, auto_train=True)
+    
+    async def _reload(self, conn):
+        """全量加载到新索引后整体替换（首次加载、重连、无法逐行同步的变更），加载期间检索使用旧索引"""
+        loop = asyncio.get_running_loop()
+        index = self.index if not self.index.count else self.index.empty_copy()
+        max_id = await self._load(conn, index, 0, _MAX_ID, auto_train=False)
+        if not index.trained:
+            await loop.run_in_executor(self._executor, index.train)
+        self.index, self.max_id = index, max_id
+        if self.on_change:
+            self.on_change()
+        metrics.MEMORY_INDEX_ROWS.set(index.size)
+        logger.info(f"内存向量索引加载完成: {index.stats()}")
+    
+    async def _load(self, conn, index: MemoryVectorIndex, after: int, until: int, auto_train: bool) -> int:
+        """按主键分页加载 (after, until] 范围内的行，返回已加载的最大 ID"""
+        max_id = after
+        while True:
+            rows = await conn.fetch(_LOAD_SQL, after, until, self.load_batch)
+            if not rows:
+                break
+            await self._add_rows(index, rows, auto_train)
+            after = rows[-1]["id"]
+            max_id = max(max_id, after)
+            if len(rows) < self.load_batch:
+                break
+        if index is self.index:
+            self.max_id = max(self.max_id, max_id)
+        return max_id
+    
+    async def _add_rows(self, index: MemoryVectorIndex, rows, auto_train: bool):
+        if not rows:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            lambda: index.add(
+                [row["doc_id"] for row in rows],
+                np.stack([row["embedding"] for row in rows]),
+                [row["content"] for row in rows],
+                [row["metadata"] for row in rows],
+                auto_train=auto_train
+            )
+        )
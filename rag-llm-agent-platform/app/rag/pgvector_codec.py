@@ -0,0 +1,82 @@
+"""
+pgvector 二进制编解码（asyncpg type codec）
+
+pgvector 的二进制格式：uint16 维度 + uint16 保留位 + 维度个大端 float32。
+相比 str(embedding) + ::vector 的文本往返，1536 维向量从约 30KB 十进制文本
+降为 6KB 定长字节，且服务端无需解析浮点文本。
+"""
+import json
+import struct
+import sys
+from array import array
+from typing import List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖
+    np = None
+
+_HEADER = struct.Struct(">HH")
+_NEEDS_BYTESWAP = sys.byteorder == "little"
+
+
+def encode_vector(embedding: Sequence[float]) -> bytes:
+    """将向量编码为 pgvector 二进制格式"""
+    if np is not None and isinstance(embedding, np.ndarray):
+        data = np.asarray(embedding, dtype=">f4").tobytes()
+        dim = embedding.shape[0]
+    else:
+        values = array("f", embedding)
+        if _NEEDS_BYTESWAP:
+            values.byteswap()
+        data = values.tobytes()
+        dim = len(values)
+    return _HEADER.pack(dim, 0) + data
+
+
+def decode_vector(data: bytes) -> List[float]:
+    """将 pgvector 二进制格式解码为 float 列表"""
+    dim, _ = _HEADER.unpack_from(data)
+    values = array("f")
+    values.frombytes(data[_HEADER.size:_HEADER.size + 4 * dim])
+    if _NEEDS_BYTESWAP:
+        values.byteswap()
+    return values.tolist()
+
+
+def decode_vector_numpy(data: bytes):
+    """将 pgvector 二进制格式解码为 float32 NumPy 数组（批量加载向量时使用）"""
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=_HEADER.size).astype(np.float32)
+
+
+def encode_jsonb(value) -> bytes:
+    """jsonb 二进制格式：1 字节版本号 + JSON 文本"""
+    return b"\x01" + json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def decode_jsonb(data: bytes):
+    """解码 jsonb 二进制格式"""
+    return json.loads(data[1:])
+
+
+async def init_connection(conn):
+    """
+    连接初始化回调（asyncpg.create_pool(init=...)）
+
+    注册 vector 与 jsonb 的二进制编解码（二进制格式同时适用于 COPY）
+    """
+    await conn.set_type_codec(
+        "vector",
+        schema="public",
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary"
+    )
+    await conn.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=encode_jsonb,
+        decoder=decode_jsonb,
+        format="binary"
+    )
@@ -0,0 +1,288 @@
+"""
+检索结果重排序
+
+向量检索多取候选（RERANK_CANDIDATES），按与问题的相关度重新打分，只把最相关的
+top_n 篇交给 LLM，减少提示词 token 与生成延迟。
+
+打分器可替换：
+- CrossEncoderScorer：本地 CPU 交叉编码器（sentence-transformers CrossEncoder），在线程池中按批推理
+- LexicalScorer：问题与文档的词 / 汉字二元组重叠率，无模型依赖，作为兜底
+
+分数按 (打分器, 归一化问题, 文档ID) 缓存；打分超过延迟预算时跳过重排序直接使用向量检索
+顺序，超时的打分在后台完成后仍写入缓存，下一次同样的问题可以命中。后台打分最多保留
+max_background 个，其余超时的打分直接取消（尚在线程池队列中的推理随之撤销），避免持续过载时
+超时任务在线程池中积压，使之后的每次重排序都排在积压之后而全部超时。
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core import metrics
+from app.rag.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = re.compile(r"[\u4e00-\u9fff]+")
+
+
+class RerankScorer:
+    """重排序打分器接口"""
+    
+    name = "base"
+    
+    async def score(self, query: str, docs: List[Dict]) -> List[float]:
+        """
+        计算问题与每篇文档的相关度
+        
+        Args:
+            query: 用户问题
+            docs: 候选文档（包含 content）
+            
+        Returns:
+            与 docs 顺序一致的分数，越大越相关
+        """
+        raise NotImplementedError
+    
+    async def close(self):
+        """释放资源"""
+
+
+class LexicalScorer(RerankScorer):
+    """词法重叠打分：问题中的词（英文单词、数字、汉字二元组）在文档中出现的比例"""
+    
+    name = "lexical"
+    
+    async def score(self, query: str, docs: List[Dict]) -> List[float]:
+        query_terms = _terms(query)
+        if not query_terms:
+            return [0.0] * len(docs)
+        return [
+            len(query_terms & _terms(doc.get("content") or "")) / len(query_terms)
+            for doc in docs
+        ]
+
+
+class CrossEncoderScorer(RerankScorer):
+    """本地 CPU 交叉编码器（sentence-transformers CrossEncoder）"""
+    
+    name = "cross_encoder"
+    
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 32,
+        max_length: int = 512,
+        workers: int = 1,
+        model=None
+    ):
+        """
+        Args:
+            model_name: CrossEncoder 模型名或本地路径（如 BAAI/bge-reranker-base）
+            batch_size: 单次推理的 (问题, 文档) 对数
+            max_length: 单个输入对的最大 token 数，超出截断
+            workers: 推理线程数
+            model: 已加载的模型（便于测试），为空时首次使用时加载
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = model
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+    
+    async def score(self, query: str, docs: List[Dict]) -> List[float]:
+        pairs = [(query, doc.get("content") or "") for doc in docs]
+        loop = asyncio.get_running_loop()
+        scores = await loop.run_in_executor(self._executor, self._predict, pairs)
+        return [float(score) for score in scores]
+    
+    async def close(self):
+        self._executor.shutdown(wait=False)
+    
+    def _predict(self, pairs: List[Tuple[str, str]]):
+        return self._load().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+    
+    def _load(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                    except ImportError as e:
+                        raise RuntimeError("交叉编码器重排序需要安装 sentence-transformers") from e
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+
+class Reranker:
+    """重排序阶段：分数缓存 + 延迟预算 + 打分失败时词法兜底"""
+    
+    def __init__(
+        self,
+        scorer: RerankScorer,
+        top_n: int = 5,
+        candidates: int = 50,
+        budget_ms: float = 300.0,
+        cache_size: int = 50000,
+        fallback: Optional[RerankScorer] = None,
+        max_background: int = 1
+    ):
+        """
+        Args:
+            scorer: 主打分器
+            top_n: 重排序后保留的文档数
+            candidates: 向量检索阶段取回的候选数
+            budget_ms: 打分的延迟预算，超出时跳过重排序
+            cache_size: 缓存的 (问题, 文档) 分数条数
+            fallback: 主打分器出错时使用的打分器，默认 LexicalScorer
+            max_background: 超出预算后允许在后台继续的打分数，超出的直接取消
+        """
+        self.scorer = scorer
+        self.top_n = top_n
+        self.candidates = max(candidates, top_n)
+        self.budget = budget_ms / 1000
+        self.cache_size = cache_size
+        self.max_background = max_background
+        self.fallback = fallback or (LexicalScorer() if not isinstance(scorer, LexicalScorer) else None)
+        self._scores: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._background: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.fallbacks = 0
+    
+    async def rerank(self, query: str, docs: List[Dict], top_n: Optional[int] = None) -> List[Dict]:
+        """
+        重排序候选文档
+        
+        Args:
+            query: 用户问题
+            docs: 向量检索的候选文档（按距离排序）
+            top_n: 保留的文档数，默认 self.top_n
+            
+        Returns:
+            按相关度排序的前 top_n 篇文档（附 rerank_score）；超出延迟预算时为原顺序的前 top_n 篇
+        """
+        top_n = top_n or self.top_n
+        if len(docs) <= 1:
+            return docs[:top_n]
+        
+        start = time.perf_counter()
+        normalized = normalize_text(query)
+        keys = [(self.scorer.name, normalized, _doc_key(doc)) for doc in docs]
+        scores: List[Optional[float]] = [self._get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        
+        if missing:
+            try:
+                computed = await self._score_within_budget(query, docs, keys, missing)
+                for i, score in zip(missing, computed):
+                    scores[i] = score
+            except asyncio.TimeoutError:
+                self.skipped += 1
+                metrics.RERANK_SKIPPED.observe(time.perf_counter() - start)
+                logger.warning(f"重排序超出延迟预算 {self.budget * 1000:.0f}ms，使用向量检索顺序")
+                return docs[:top_n]
+            except Exception as e:
+                if not self.fallback:
+                    logger.warning(f"重排序打分失败，使用向量检索顺序: {str(e)}")
+                    return docs[:top_n]
+                # 兜底打分器的分数与主打分器不可比，全部候选重新打分
+                self.fallbacks += 1
+                logger.warning(f"重排序打分失败，使用 {self.fallback.name} 兜底: {str(e)}")
+                scores = await self.fallback.score(query, docs)
+        
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)[:top_n]
+        metrics.RERANK_RERANKED.observe(time.perf_counter() - start)
+        return [{**docs[i], "rerank_score": scores[i]} for i in order]
+    
+    async def _score_within_budget(
+        self,
+        query: str,
+        docs: List[Dict],
+        keys: List[Tuple[str, str, str]],
+        missing: List[int]
+    ) -> List[float]:
+        pending = [docs[i] for i in missing]
+        task = asyncio.ensure_future(self.scorer.score(query, pending))
+        try:
+            computed = await asyncio.wait_for(asyncio.shield(task), timeout=self.budget)
+        except asyncio.TimeoutError:
+            if len(self._background) >= self.max_background:
+                task.cancel()
+                raise
+            # 打分在后台继续，完成后写入缓存
+            self._background.add(task)
+            task.add_done_callback(lambda done: self._store_later(done, [keys[i] for i in missing]))
+            raise
+        
+        for i, score in zip(missing, computed):
+            self._put(keys[i], score)
+        return computed
+    
+    def _store_later(self, task: asyncio.Task, keys: List[Tuple[str, str, str]]):
+        self._background.discard(task)
+        if task.cancelled() or task.exception() is not None:
+            return
+        for key, score in zip(keys, task.result()):
+            self._put(key, score)
+    
+    def _get(self, key: Tuple[str, str, str]) -> Optional[float]:
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self._scores.move_to_end(key)
+        self.hits += 1
+        return score
+    
+    def _put(self, key: Tuple[str, str, str], score: float):
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.cache_size:
+            self._scores.popitem(last=False)
+    
+    async def close(self):
+        """等待后台打分结束并释放打分器"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.scorer.close()
+    
+    def stats(self) -> Dict:
+        """缓存与跳过统计"""
+        total = self.hits + self.misses
+        return {
+            "scorer": self.scorer.name,
+            "cache_size": len(self._scores),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "skipped": self.skipped,
+            "fallbacks": self.fallbacks
+        }
+
+
+def _terms(text: str) -> Set[str]:
+    """英文单词 / 数字按词切分，汉字按二元组切分（单字词保留单字）"""
+    text = text.casefold()
+    terms = set(_WORD.findall(text))
+    for run in _CJK.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _doc_key(doc: Dict) -> str:
+    """文档ID；没有ID时以内容摘要代替"""
+    doc_id = doc.get("id")
+    if doc_id is not None:
+        return str(doc_id)
+    return hashlib.sha1((doc.get("content") or "").encode("utf-8")).hexdigest()
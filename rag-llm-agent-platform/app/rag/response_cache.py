@@ -0,0 +1,198 @@
+"""
+语义回答缓存
+
+新问题的向量与已缓存问题的向量做余弦相似度比较，超过阈值即直接返回缓存的
+回答和来源，跳过检索与 LLM 调用。向量保存在预分配的 float32 矩阵中，
+单次查找是一次矩阵-向量乘法。
+
+失效策略：
+- TTL 到期
+- 文档变更（VectorStore.generation 变化，包括其他进程写入后经变更通知递增）时整体清空
+- 依赖工具调用（实时业务数据）的回答不写入缓存
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    """缓存的回答"""
+    response: str
+    sources: list
+    similarity: float = 1.0
+
+
+class SemanticResponseCache:
+    """语义回答缓存（容量 + TTL 淘汰，按 scope 隔离）"""
+    
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float = 3600,
+        max_size: int = 5000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            ttl: 缓存有效期（秒）
+            max_size: 最大条数，满后淘汰最久未使用的条目
+            clock: 时钟函数（便于测试）
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._matrix: Optional[np.ndarray] = None
+        self._expires = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+        self._scopes = np.full(max_size, -1, dtype=np.int64)
+        self._entries: List[Optional[CachedResponse]] = [None] * max_size
+        # scope -> 编号，以及每个编号占用的槽位数；最后一个槽位被覆盖时删除，
+        # 映射大小不超过 max_size（search_options 组合由请求决定，不能无限增长）
+        self._scope_ids: Dict[str, int] = {}
+        self._scope_slots: Dict[int, int] = {}
+        self._scope_names: Dict[int, str] = {}
+        self._next_scope_id = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.invalidations = 0
+    
+    def get(
+        self,
+        embedding: List[float],
+        scope: str = "",
+        generation: int = 0
+    ) -> Optional[CachedResponse]:
+        """
+        查找语义相近的已缓存问题
+        
+        Args:
+            embedding: 问题向量
+            scope: 缓存隔离键（如检索参数），只在相同 scope 内匹配
+            generation: 当前文档版本，与缓存版本不一致时清空缓存
+        
+        Returns:
+            命中时返回缓存的回答，否则返回 None
+        """
+        self._check_generation(generation)
+        scope_id = self._scope_ids.get(scope)
+        if self._matrix is None or scope_id is None:
+            self.misses += 1
+            return None
+        
+        query = _normalize(embedding)
+        if query.shape[0] != self._matrix.shape[1]:
+            self.misses += 1
+            return None
+        
+        now = self._clock()
+        candidates = np.flatnonzero((self._scopes == scope_id) & (self._expires > now))
+        if candidates.size == 0:
+            self.misses += 1
+            return None
+        
+        similarities = self._matrix[candidates] @ query
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+        
+        slot = int(candidates[best])
+        self._last_used[slot] = now
+        self.hits += 1
+        entry = self._entries[slot]
+        return CachedResponse(entry.response, entry.sources, similarity)
+    
+    def set(
+        self,
+        embedding: List[float],
+        response: str,
+        sources: list,
+        scope: str = "",
+        generation: int = 0
+    ):
+        """写入缓存"""
+        self._check_generation(generation)
+        vector = _normalize(embedding)
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self._matrix.shape[1]:
+            return
+        
+        now = self._clock()
+        expired = np.flatnonzero(self._expires <= now)
+        slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+        
+        self._matrix[slot] = vector
+        self._expires[slot] = now + self.ttl
+        self._last_used[slot] = now
+        self._release_scope(int(self._scopes[slot]))
+        self._scopes[slot] = self._acquire_scope(scope)
+        self._entries[slot] = CachedResponse(response, list(sources))
+    
+    def _acquire_scope(self, scope: str) -> int:
+        scope_id = self._scope_ids.get(scope)
+        if scope_id is None:
+            scope_id = self._scope_ids[scope] = self._next_scope_id
+            self._scope_names[scope_id] = scope
+            self._next_scope_id += 1
+        self._scope_slots[scope_id] = self._scope_slots.get(scope_id, 0) + 1
+        return scope_id
+    
+    def _release_scope(self, scope_id: int):
+        if scope_id < 0:
+            return
+        remaining = self._scope_slots[scope_id] - 1
+        if remaining:
+            self._scope_slots[scope_id] = remaining
+            return
+        del self._scope_slots[scope_id]
+        del self._scope_ids[self._scope_names.pop(scope_id)]
+    
+    def record_bypass(self):
+        """记录一次未写入缓存的回答（依赖工具调用等）"""
+        self.bypasses += 1
+    
+    def invalidate(self):
+        """清空缓存"""
+        self._expires[:] = 0
+        self._scopes[:] = -1
+        self._entries = [None] * self.max_size
+        self._scope_ids.clear()
+        self._scope_slots.clear()
+        self._scope_names.clear()
+        self.invalidations += 1
+    
+    def _check_generation(self, generation: int):
+        if generation != self.generation:
+            self.invalidate()
+            self.generation = generation
+            logger.info(f"文档已变更，语义回答缓存已清空: generation={generation}")
+    
+    def stats(self) -> Dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": int(np.count_nonzero(self._expires > self._clock())),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
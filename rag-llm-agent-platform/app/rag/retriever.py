@@ -2,11 +2,23 @@
 RAG 检索器
 """
 import logging
-from typing import List, Dict
-from openai import AsyncOpenAI
+import time
+from typing import List, Dict, Optional, Union
 
+from app.rag.embedding_batcher import EmbeddingBatcher
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embedding_provider import (
+    LOCAL_MODEL_PREFIX,
+    EmbeddingProvider,
+    LocalEmbeddingProvider,
+    OpenAIEmbeddingProvider,
+    is_local_model
+)
+from app.rag.search_filter import SearchFilter
 from app.rag.vector_store import VectorStore
+from app.core import metrics
 from app.core.config import settings
+from app.core.http_client import create_openai_client
 
 logger = logging.getLogger(__name__)
 
@@ -16,32 +28,139 @@ class Retriever:
     
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
-        self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.embedding_provider = self._create_embedding_provider()
+        self.embedding_batcher = None
+        if settings.EMBEDDING_BATCH_ENABLED:
+            self.embedding_batcher = EmbeddingBatcher(
+                self.embed_texts,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
+            )
+        self.embedding_cache = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                max_size=settings.EMBEDDING_CACHE_SIZE,
+                ttl=settings.EMBEDDING_CACHE_TTL,
+                sqlite_path=settings.EMBEDDING_CACHE_SQLITE_PATH,
+                sqlite_max_rows=settings.EMBEDDING_CACHE_SQLITE_MAX_ROWS
+            )
+    
+    @staticmethod
+    def _create_embedding_provider() -> EmbeddingProvider:
+        """按 EMBEDDING_MODEL 选择本地模型（local: 前缀）或远程 Embedding 接口"""
+        if is_local_model(settings.EMBEDDING_MODEL):
+            return LocalEmbeddingProvider(
+                settings.EMBEDDING_MODEL[len(LOCAL_MODEL_PREFIX):],
+                backend=settings.EMBEDDING_LOCAL_BACKEND,
+                workers=settings.EMBEDDING_LOCAL_WORKERS,
+                batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
+            )
+        return OpenAIEmbeddingProvider(create_openai_client(), settings.EMBEDDING_MODEL)
+    
+    async def warmup(self):
+        """预加载 Embedding 模型（本地模型加载耗时较长，放在启动阶段）"""
+        await self.embedding_provider.warmup()
+        dimension = getattr(self.embedding_provider, "dimension", None)
+        if dimension and dimension != settings.VECTOR_DIMENSION:
+            logger.warning(
+                f"Embedding 维度 {dimension} 与 VECTOR_DIMENSION={settings.VECTOR_DIMENSION} 不一致，"
+                f"需按新维度重建 documents 表"
+            )
+    
+    async def close(self):
+        """关闭 Embedding 客户端"""
+        if self.embedding_batcher:
+            await self.embedding_batcher.close()
+        await self.embedding_provider.close()
+        if self.embedding_cache:
+            self.embedding_cache.close()
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        查询向量化（优先命中缓存）
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            查询向量
+        """
+        if self.embedding_cache:
+            cached = await self.embedding_cache.get(settings.EMBEDDING_MODEL, query)
+            if cached is not None:
+                return cached
+        
+        if self.embedding_batcher:
+            # 与并发请求合并为一次批量调用
+            embedding = await self.embedding_batcher.embed(query)
+        else:
+            embedding = (await self.embed_texts([query]))[0]
+        
+        if self.embedding_cache:
+            await self.embedding_cache.set(settings.EMBEDDING_MODEL, query, embedding)
+        return embedding
     
-    async def retrieve(self, query: str, top_k: int = 5) -> List[Dict]:
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量向量化（单次 Embedding 请求 / 单次本地推理）
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            与输入顺序一致的向量列表（本地模型为 float32 NumPy 向量）
+        """
+        start = time.perf_counter()
+        embeddings = await self.embedding_provider.embed(texts)
+        metrics.EMBEDDING_LATENCY.observe(time.perf_counter() - start)
+        metrics.EMBEDDING_BATCH_SIZE.observe(len(texts))
+        return embeddings
+    
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        search_options: Optional[Dict] = None,
+        filters: Optional[Union[SearchFilter, Dict]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict]:
         """
         检索相关文档
         
         Args:
             query: 查询文本
             top_k: 返回前K个结果
+            search_options: 请求级检索参数（mode / ef_search / probes / filters），
+                mode 为 vector 或 hybrid，默认 settings.RETRIEVAL_MODE，其余透传给 VectorStore
+            filters: 元数据 / 时间过滤条件（优先于 search_options 中的 filters）
+            query_embedding: 已计算好的查询向量（调用方已向量化时避免重复计算）
             
         Returns:
             相关文档列表
         """
         try:
             # 1. 将查询文本向量化
-            embedding_response = await self.openai_client.embeddings.create(
-                model=settings.EMBEDDING_MODEL,
-                input=query
-            )
-            query_embedding = embedding_response.data[0].embedding
+            if query_embedding is None:
+                query_embedding = await self.embed_query(query)
             
-            # 2. 向量相似度搜索
-            results = await self.vector_store.search_similar(
-                query_embedding=query_embedding,
-                top_k=top_k
-            )
+            # 2. 向量相似度搜索（hybrid 模式下同时做全文检索并融合）
+            options = dict(search_options or {})
+            mode = options.pop("mode", None) or settings.RETRIEVAL_MODE
+            if filters is not None:
+                options["filters"] = filters
+            if mode == "hybrid":
+                results = await self.vector_store.hybrid_search(
+                    query_embedding=query_embedding,
+                    query_text=query,
+                    top_k=top_k,
+                    **options
+                )
+            else:
+                results = await self.vector_store.search_similar(
+                    query_embedding=query_embedding,
+                    top_k=top_k,
+                    **options
+                )
             
             logger.info(f"检索完成: query={query[:50]}..., 返回 {len(results)} 个结果")
             return results
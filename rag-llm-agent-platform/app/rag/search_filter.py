@@ -0,0 +1,62 @@
+"""
+向量检索的结构化过滤条件
+
+过滤条件下推为 SQL 谓词：
+- contains: JSONB 包含（metadata @> ...），可使用 documents_metadata_idx GIN 索引
+- equals: 键值文本相等（metadata->>key = value），兼容数字/字符串混存的字段
+- created_after / created_before: created_at 时间范围
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+@dataclass
+class SearchFilter:
+    """检索过滤条件"""
+    contains: Optional[Dict[str, Any]] = None
+    equals: Optional[Dict[str, Any]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    
+    @classmethod
+    def coerce(cls, value: Union["SearchFilter", Dict, None]) -> Optional["SearchFilter"]:
+        """兼容字典形式（如 API 请求体）"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(**value)
+    
+    def is_empty(self) -> bool:
+        return not (self.contains or self.equals or self.created_after or self.created_before)
+    
+    def to_sql(self, first_param: int) -> Tuple[str, List[Any]]:
+        """
+        生成 WHERE 子句
+        
+        Args:
+            first_param: 第一个占位符序号（前面的占位符由调用方使用）
+        
+        Returns:
+            (WHERE 子句，无条件时为空串, 参数列表)
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        
+        def bind(value: Any) -> str:
+            params.append(value)
+            return f"${first_param + len(params) - 1}"
+        
+        if self.contains:
+            clauses.append(f"metadata @> {bind(self.contains)}::jsonb")
+        for key, value in (self.equals or {}).items():
+            expected = value if isinstance(value, str) else json.dumps(value)
+            clauses.append(f"metadata->>{bind(key)} = {bind(expected)}")
+        if self.created_after:
+            clauses.append(f"created_at >= {bind(self.created_after)}")
+        if self.created_before:
+            clauses.append(f"created_at < {bind(self.created_before)}")
+        
+        if not clauses:
+            return "", []
+        return "WHERE " + " AND ".join(clauses), params
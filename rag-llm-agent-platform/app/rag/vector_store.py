@@ -1,38 +1,203 @@
 """
 向量存储实现（基于 PostgreSQL + pgvector）
 """
+import asyncio
 import logging
+import time
 import asyncpg
-from typing import List, Dict
+from typing import List, Dict, Optional, Union, Iterable, AsyncIterable, Callable, Awaitable
+from app.core import metrics
 from app.core.config import settings
+from app.rag.document_changes import DocumentChangeListener
+from app.rag.memory_index import MemoryIndexReplica, MemoryVectorIndex
+from app.rag.pgvector_codec import init_connection
+from app.rag.search_filter import SearchFilter
 
 logger = logging.getLogger(__name__)
 
+_DOCUMENT_COLUMNS = ["content", "embedding", "metadata"]
+
+_SEARCH_SQL = """
+    SELECT id::text AS id, content, metadata,
+           embedding <=> $1::vector AS distance
+    FROM documents
+    {where}
+    ORDER BY embedding <=> $1::vector
+    LIMIT $2
+"""
+
+# 过滤条件命中的行数（最多数到 $1）：ANN 结果不足 top_k 时判断是否真的被截断
+_COUNT_MATCHES_SQL = """
+    SELECT count(*) FROM (SELECT 1 FROM documents {where} LIMIT $1) AS matched
+"""
+
+# pgvector 对 hnsw.ef_search 的上限，超出时 SET 直接报错
+_HNSW_EF_SEARCH_MAX = 1000
+
+# 迭代扫描（hnsw.iterative_scan / ivfflat.iterative_scan）需要 pgvector 0.8+
+_ITERATIVE_SCAN_MIN_VERSION = (0, 8)
+
+# 批量检索：多个查询向量在一条语句中完成，每个向量各自走一次 ANN 索引扫描（LATERAL），
+# 结果按输入顺序（ord）分组
+_SEARCH_MANY_SQL = """
+    SELECT q.ord, hit.id, hit.content, hit.metadata, hit.distance
+    FROM unnest($1::vector[]) WITH ORDINALITY AS q(embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT id::text AS id, content, metadata,
+               embedding <=> q.embedding AS distance
+        FROM documents
+        {where}
+        ORDER BY embedding <=> q.embedding
+        LIMIT $2
+    ) hit
+    ORDER BY q.ord, hit.distance
+"""
+
+# 混合检索：向量 / 全文两路候选在同一条语句中取出，按加权 RRF 融合
+#   score = Σ weight / (rrf_k + rank)
+# 全文检索使用 content_tsv 生成列（'simple' 分词，不做词干化，SKU / 订单号等按原样匹配）
+_HYBRID_SQL = """
+    WITH vector_hits AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT d.id, d.embedding <=> $1::vector AS distance
+            FROM (SELECT id, embedding FROM documents {where}) d
+            ORDER BY d.embedding <=> $1::vector
+            LIMIT $3
+        ) v
+    ),
+    text_hits AS (
+        SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+        FROM (
+            SELECT d.id, ts_rank_cd(d.content_tsv, q.query) AS text_rank
+            FROM (SELECT id, content_tsv FROM documents {where}) d,
+                 websearch_to_tsquery('simple', $4) AS q(query)
+            WHERE d.content_tsv @@ q.query
+            ORDER BY text_rank DESC
+            LIMIT $3
+        ) t
+    ),
+    fused AS (
+        SELECT id, SUM(score) AS score
+        FROM (
+            SELECT id, $5::float8 / ($7 + rank) AS score FROM vector_hits
+            UNION ALL
+            SELECT id, $6::float8 / ($7 + rank) AS score FROM text_hits
+        ) s
+        GROUP BY id
+    )
+    SELECT documents.id::text AS id, documents.content, documents.metadata,
+           documents.embedding <=> $1::vector AS distance, fused.score
+    FROM fused JOIN documents ON documents.id = fused.id
+    ORDER BY fused.score DESC
+    LIMIT $2
+"""
+
+
+class BulkInsertError(Exception):
+    """批量写入失败，stats 中记录已提交的批次，可据此续传；cause 为原始异常（解析 / 预处理 / 写入）"""
+    
+    def __init__(self, message: str, stats: Dict, cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.stats = stats
+        self.cause = cause
+
 
 class VectorStore:
     """向量存储类"""
     
     def __init__(self):
         self.connection_pool = None
+        # 文档版本号：本进程写入后、以及收到（其他进程写入的）变更通知时递增，
+        # 供下游缓存（如语义回答缓存）判断失效
+        self.generation = 0
+        # 服务端 pgvector 版本，建立连接池时读取；版本过低时不启用迭代扫描
+        self.pgvector_version: Optional[str] = None
+        # 进程内向量索引（MEMORY_INDEX_ENABLED），加载完成前检索走 SQL
+        self.memory_index = _make_memory_index(self._bump_generation) if settings.MEMORY_INDEX_ENABLED else None
+        # 未启用内存索引但启用语义回答缓存时，单独监听变更通知
+        self.change_listener = None
+        if not self.memory_index and settings.RESPONSE_CACHE_ENABLED:
+            self.change_listener = DocumentChangeListener(
+                connect=lambda: asyncpg.connect(**_connection_kwargs()),
+                on_change=self._bump_generation
+            )
+    
+    def _bump_generation(self):
+        self.generation += 1
     
     async def connect(self):
         """建立连接池"""
         if not self.connection_pool:
             self.connection_pool = await asyncpg.create_pool(
-                host=settings.POSTGRES_HOST,
-                port=settings.POSTGRES_PORT,
-                database=settings.POSTGRES_DB,
-                user=settings.POSTGRES_USER,
-                password=settings.POSTGRES_PASSWORD,
+                **_connection_kwargs(),
                 min_size=5,
-                max_size=20
+                max_size=20,
+                init=init_connection
             )
             logger.info("向量数据库连接池创建成功")
+            async with self.connection_pool.acquire() as conn:
+                self.pgvector_version = await conn.fetchval(
+                    "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+                )
+            if settings.VECTOR_ITERATIVE_SCAN and not self.iterative_scan_supported:
+                logger.warning(
+                    f"pgvector {self.pgvector_version} 不支持迭代扫描（需要 0.8+），"
+                    f"过滤检索改为放大候选集（FILTER_OVERFETCH_FACTOR）"
+                )
+    
+    @property
+    def iterative_scan_supported(self) -> bool:
+        """服务端 pgvector 是否支持迭代扫描；版本未知（尚未建立连接池）时按支持处理"""
+        if not self.pgvector_version:
+            return True
+        try:
+            version = tuple(int(part) for part in self.pgvector_version.split(".")[:2])
+        except ValueError:
+            return True
+        return version >= _ITERATIVE_SCAN_MIN_VERSION
+    
+    @property
+    def iterative_scan(self) -> str:
+        """过滤检索实际使用的迭代扫描模式，为空表示不启用"""
+        return settings.VECTOR_ITERATIVE_SCAN if self.iterative_scan_supported else ""
+    
+    async def warmup(self):
+        """建立连接池，并让 min_size 个连接都完成一次查询往返（含类型编解码注册）；启用内存索引时在后台开始加载"""
+        # 内存索引使用独立连接并自行重连，数据库暂不可用时也先启动
+        self._start_sync()
+        await self.connect()
+        
+        async def touch():
+            async with self.connection_pool.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+        
+        await asyncio.gather(*(touch() for _ in range(self.connection_pool.get_min_size())))
+        logger.info(f"向量数据库连接池预热完成: size={self.connection_pool.get_size()}")
+    
+    def _start_sync(self):
+        """启动内存索引同步 / 变更监听（已启动时无操作）；未经 warmup 时在首次检索 / 就绪检查时启动"""
+        if self.memory_index:
+            self.memory_index.start()
+        if self.change_listener:
+            self.change_listener.start()
+    
+    async def ping(self):
+        """通过连接池执行 SELECT 1，连接池未建立时尝试重新建立"""
+        self._start_sync()
+        await self.connect()
+        async with self.connection_pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
     
     async def close(self):
-        """关闭连接池"""
+        """关闭连接池、内存索引同步与变更监听"""
+        if self.memory_index:
+            await self.memory_index.close()
+        if self.change_listener:
+            await self.change_listener.close()
         if self.connection_pool:
             await self.connection_pool.close()
+            self.connection_pool = None
             logger.info("向量数据库连接池已关闭")
     
     async def insert_vector(
@@ -58,56 +223,360 @@ class VectorStore:
             doc_id = await conn.fetchval(
                 """
                 INSERT INTO documents (content, embedding, metadata)
-                VALUES ($1, $2::vector, $3)
+                VALUES ($1, $2, $3)
                 RETURNING id
                 """,
                 content,
-                str(embedding),
+                embedding,
                 metadata or {}
             )
+        self.generation += 1
         
         logger.info(f"向量插入成功: doc_id={doc_id}")
         return str(doc_id)
     
+    async def insert_many(
+        self,
+        documents: Union[Iterable[Dict], AsyncIterable[Dict]],
+        batch_size: Optional[int] = None,
+        start_batch: int = 0,
+        prepare_batch: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]] = None
+    ) -> Dict:
+        """
+        批量插入向量（COPY 协议，每批一个事务）
+        
+        Args:
+            documents: 文档迭代器（同步或异步），每项包含 content / embedding / metadata
+            batch_size: 每批行数，默认 settings.INGEST_BATCH_SIZE
+            start_batch: 从第几批开始写入（之前的批次视为已提交，用于失败续传）
+            prepare_batch: 写入前对每批文档的预处理（如补齐 embedding），跳过的批次不会调用
+            
+        Returns:
+            写入统计：rows / batches / next_batch / elapsed_seconds / rows_per_sec
+            
+        Raises:
+            BulkInsertError: 某批写入失败，stats["next_batch"] 为续传起点
+        """
+        batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        await self.connect()
+        
+        stats = {"rows": 0, "batches": 0, "next_batch": start_batch}
+        start = time.perf_counter()
+        batch_index = 0
+        
+        try:
+            async for batch in _batched(documents, batch_size):
+                if batch_index < start_batch:
+                    batch_index += 1
+                    continue
+                
+                if prepare_batch:
+                    batch = await prepare_batch(batch)
+                await self._copy_batch(batch)
+                self.generation += 1
+                
+                batch_index += 1
+                stats["rows"] += len(batch)
+                stats["batches"] += 1
+                stats["next_batch"] = batch_index
+                logger.info(f"批量写入进度: batch={batch_index}, rows={stats['rows']}")
+        except Exception as e:
+            _finish_stats(stats, start)
+            logger.error(f"批量写入失败: next_batch={stats['next_batch']}, 错误: {str(e)}")
+            raise BulkInsertError(str(e), stats, cause=e) from e
+        
+        _finish_stats(stats, start)
+        logger.info(
+            f"批量写入完成: rows={stats['rows']}, batches={stats['batches']}, "
+            f"rows/sec={stats['rows_per_sec']:.1f}"
+        )
+        return stats
+    
+    async def _copy_batch(self, batch: List[Dict]):
+        """在单个事务内通过 COPY 写入一批文档"""
+        records = [
+            (doc["content"], doc["embedding"], doc.get("metadata") or {})
+            for doc in batch
+        ]
+        async with self.connection_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "documents",
+                    records=records,
+                    columns=_DOCUMENT_COLUMNS
+                )
+    
     async def search_similar(
         self,
         query_embedding: List[float],
-        top_k: int = 5
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[Union[SearchFilter, Dict]] = None
     ) -> List[Dict]:
         """
         相似度搜索
         
+        无过滤条件且内存索引（MEMORY_INDEX_ENABLED）已就绪时在进程内检索，ef_search / probes 不生效
+        
         Args:
             query_embedding: 查询向量
             top_k: 返回前K个结果
+            ef_search: HNSW 查询候选集大小（越大召回越高、越慢），默认 settings.HNSW_EF_SEARCH
+            probes: IVFFlat 查询探测的列表数，默认 settings.IVFFLAT_PROBES
+            filters: 元数据 / 时间过滤条件，在 SQL 中过滤
             
         Returns:
             相似文档列表
         """
+        filters = SearchFilter.coerce(filters)
+        filtered = filters is not None and not filters.is_empty()
+        self._start_sync()
+        if not filtered and self.memory_index and self.memory_index.ready:
+            start = time.perf_counter()
+            results = await self.memory_index.search(query_embedding, top_k)
+            metrics.VECTOR_SEARCH_MEMORY.observe(time.perf_counter() - start)
+            logger.info(f"相似度搜索完成（内存索引）: 返回 {len(results)} 个结果")
+            return results
+        
         await self.connect()
+        where, filter_args = filters.to_sql(first_param=3) if filtered else ("", [])
+        sql = _SEARCH_SQL.format(where=where)
+        args = (query_embedding, top_k, *filter_args)
         
+        iterative_scan = self.iterative_scan
+        search_params = _search_params(ef_search, probes, top_k, filtered, iterative_scan)
+        start = time.perf_counter()
         async with self.connection_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id, content, metadata,
-                       embedding <=> $1::vector AS distance
-                FROM documents
-                ORDER BY embedding <=> $1::vector
-                LIMIT $2
-                """,
-                str(query_embedding),
-                top_k
-            )
+            rows = await _fetch_with_params(conn, sql, args, search_params)
+            
+            # 未启用迭代扫描时 ANN 索引只在有限候选集上过滤，结果可能不足 top_k；
+            # 过滤条件命中的行数多于已返回的结果时才禁用索引扫描做精确检索
+            # （过滤条件仍可走 GIN / 时间索引的位图扫描）
+            if filtered and not iterative_scan and len(rows) < top_k:
+                count_where, count_args = filters.to_sql(first_param=2)
+                matched = await conn.fetchval(_COUNT_MATCHES_SQL.format(where=count_where), top_k, *count_args)
+                if matched > len(rows):
+                    async with conn.transaction():
+                        await _apply_search_params(conn, {"enable_indexscan": "off"})
+                        rows = await conn.fetch(sql, *args)
+                    logger.info(f"过滤检索结果不足 top_k，已回退精确检索: 返回 {len(rows)} 个结果")
+        metrics.VECTOR_SEARCH_VECTOR.observe(time.perf_counter() - start)
         
-        results = []
-        for row in rows:
-            results.append({
-                "id": str(row["id"]),
-                "content": row["content"],
-                "metadata": row["metadata"],
-                "distance": float(row["distance"])
-            })
+        # 类型转换已在 SQL 和编解码器中完成，直接转换 Record
+        results = [dict(row) for row in rows]
+        if filtered and iterative_scan == "relaxed_order":
+            # relaxed_order 下结果只是近似有序
+            results.sort(key=lambda doc: doc["distance"])
         
         logger.info(f"相似度搜索完成: 返回 {len(results)} 个结果")
         return results
+    
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[Union[SearchFilter, Dict]] = None
+    ) -> List[List[Dict]]:
+        """
+        批量相似度搜索，一次数据库往返完成多个查询
+        
+        Args:
+            query_embeddings: 查询向量列表
+            top_k: 每个查询返回前K个结果
+            ef_search / probes / filters: 同 search_similar（过滤条件对所有查询生效，
+                结果不足 top_k 时不做精确检索回退）
+            
+        Returns:
+            与输入顺序一致的结果列表，每项为该查询的相似文档列表
+        """
+        if not query_embeddings:
+            return []
+        filters = SearchFilter.coerce(filters)
+        filtered = filters is not None and not filters.is_empty()
+        self._start_sync()
+        if not filtered and self.memory_index and self.memory_index.ready:
+            start = time.perf_counter()
+            results = await self.memory_index.search_many(query_embeddings, top_k)
+            metrics.VECTOR_SEARCH_MEMORY.observe(time.perf_counter() - start)
+            return results
+        
+        await self.connect()
+        where, filter_args = filters.to_sql(first_param=3) if filtered else ("", [])
+        sql = _SEARCH_MANY_SQL.format(where=where)
+        # asyncpg 把嵌套的 list 当作多维数组，tuple 才作为单个元素交给 vector 编解码器
+        args = ([tuple(embedding) for embedding in query_embeddings], top_k, *filter_args)
+        
+        search_params = _search_params(ef_search, probes, top_k, filtered, self.iterative_scan)
+        start = time.perf_counter()
+        async with self.connection_pool.acquire() as conn:
+            rows = await _fetch_with_params(conn, sql, args, search_params)
+        metrics.VECTOR_SEARCH_BATCH.observe(time.perf_counter() - start)
+        
+        results: List[List[Dict]] = [[] for _ in query_embeddings]
+        for row in rows:
+            doc = dict(row)
+            results[doc.pop("ord") - 1].append(doc)
+        logger.info(f"批量相似度搜索完成: queries={len(query_embeddings)}, 返回 {len(rows)} 个结果")
+        return results
+    
+    async def hybrid_search(
+        self,
+        query_embedding: List[float],
+        query_text: str,
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[Union[SearchFilter, Dict]] = None,
+        vector_weight: Optional[float] = None,
+        text_weight: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        混合检索（向量 + 全文，RRF 融合），单次数据库往返
+        
+        Args:
+            query_embedding: 查询向量
+            query_text: 查询文本（websearch_to_tsquery 语法）
+            top_k: 返回前K个结果
+            ef_search / probes / filters: 同 search_similar
+            vector_weight: 向量检索的融合权重，默认 settings.HYBRID_VECTOR_WEIGHT
+            text_weight: 全文检索的融合权重，默认 settings.HYBRID_TEXT_WEIGHT
+            
+        Returns:
+            按融合分数排序的文档列表（含 distance 与 score）
+        """
+        await self.connect()
+        
+        filters = SearchFilter.coerce(filters)
+        filtered = filters is not None and not filters.is_empty()
+        where, filter_args = filters.to_sql(first_param=8) if filtered else ("", [])
+        sql = _HYBRID_SQL.format(where=where)
+        candidates = max(top_k, settings.HYBRID_CANDIDATES)
+        args = (
+            query_embedding,
+            top_k,
+            candidates,
+            query_text,
+            settings.HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight,
+            settings.HYBRID_TEXT_WEIGHT if text_weight is None else text_weight,
+            settings.RRF_K,
+            *filter_args
+        )
+        
+        search_params = _search_params(ef_search, probes, candidates, filtered, self.iterative_scan)
+        start = time.perf_counter()
+        async with self.connection_pool.acquire() as conn:
+            rows = await _fetch_with_params(conn, sql, args, search_params)
+        metrics.VECTOR_SEARCH_HYBRID.observe(time.perf_counter() - start)
+        
+        results = [dict(row) for row in rows]
+        logger.info(f"混合检索完成: 返回 {len(results)} 个结果")
+        return results
+
+
+def _connection_kwargs() -> Dict[str, object]:
+    return {
+        "host": settings.POSTGRES_HOST,
+        "port": settings.POSTGRES_PORT,
+        "database": settings.POSTGRES_DB,
+        "user": settings.POSTGRES_USER,
+        "password": settings.POSTGRES_PASSWORD
+    }
+
+
+def _make_memory_index(on_change: Callable[[], None]) -> MemoryIndexReplica:
+    """按配置创建内存索引副本（同步使用独立连接，不占用连接池）"""
+    index = MemoryVectorIndex(
+        settings.VECTOR_DIMENSION,
+        nlist=settings.MEMORY_INDEX_NLIST,
+        nprobe=settings.MEMORY_INDEX_NPROBE,
+        pq_m=settings.MEMORY_INDEX_PQ_M,
+        rerank_factor=settings.MEMORY_INDEX_RERANK_FACTOR,
+        train_min=settings.MEMORY_INDEX_TRAIN_MIN,
+        retrain_growth=settings.MEMORY_INDEX_RETRAIN_GROWTH
+    )
+    return MemoryIndexReplica(
+        index,
+        connect=lambda: asyncpg.connect(**_connection_kwargs()),
+        load_batch=settings.MEMORY_INDEX_LOAD_BATCH,
+        workers=settings.MEMORY_INDEX_WORKERS,
+        on_change=on_change
+    )
+
+
+def _search_params(
+    ef_search: Optional[int],
+    probes: Optional[int],
+    top_k: int = 5,
+    filtered: bool = False,
+    iterative_scan: str = ""
+) -> Dict[str, object]:
+    """
+    合并请求级与全局的索引查询参数，0 表示使用服务端默认值
+    
+    带过滤条件时：开启 pgvector 0.8+ 的迭代扫描（iterative_scan，取自 VECTOR_ITERATIVE_SCAN，
+    服务端版本过低时为空），否则按 FILTER_OVERFETCH_FACTOR 放大候选集，保证过滤后仍有 top_k 个结果；
+    放大后的 ef_search 不超过 pgvector 上限 1000，probes 不超过 FILTER_MAX_PROBES（候选集不足时由精确检索兜底）
+    """
+    params = {}
+    ef_search = ef_search or settings.HNSW_EF_SEARCH
+    probes = probes or settings.IVFFLAT_PROBES
+    
+    if filtered:
+        if iterative_scan:
+            params["hnsw.iterative_scan"] = iterative_scan
+            # IVFFlat 只支持 relaxed_order
+            params["ivfflat.iterative_scan"] = "relaxed_order"
+        else:
+            factor = settings.FILTER_OVERFETCH_FACTOR
+            ef_search = max(ef_search or 40, top_k * factor)
+            probes = max(probes or 1, min(factor, settings.FILTER_MAX_PROBES))
+    
+    ef_search = min(ef_search, _HNSW_EF_SEARCH_MAX)
+    if ef_search:
+        params["hnsw.ef_search"] = ef_search
+    if probes:
+        params["ivfflat.probes"] = probes
+    return params
+
+
+async def _fetch_with_params(conn, sql: str, args: tuple, params: Dict[str, object]):
+    """在设置了查询参数的事务中执行查询（无参数时直接执行）"""
+    if not params:
+        return await conn.fetch(sql, *args)
+    async with conn.transaction():
+        await _apply_search_params(conn, params)
+        return await conn.fetch(sql, *args)
+
+
+async def _apply_search_params(conn, params: Dict[str, object]):
+    """SET LOCAL 语义：参数只在当前事务内生效，不污染连接池中的连接"""
+    for name, value in params.items():
+        await conn.execute("SELECT set_config($1, $2, true)", name, str(value))
+
+
+async def _batched(documents: Union[Iterable[Dict], AsyncIterable[Dict]], batch_size: int):
+    """按固定大小分批，兼容同步与异步迭代器"""
+    batch = []
+    if hasattr(documents, "__aiter__"):
+        async for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    else:
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
 
+def _finish_stats(stats: Dict, start: float):
+    elapsed = time.perf_counter() - start
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = stats["rows"] / elapsed if elapsed > 0 else 0.0
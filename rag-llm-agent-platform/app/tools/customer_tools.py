@@ -48,7 +48,9 @@ class CustomerTools:
                     },
                     "required": ["customer_id", "field", "value"]
                 },
-                "handler": self.update_customer_info
+                "handler": self.update_customer_info,
+                "mutating": True,
+                "entity_key": "customer_id"
             },
             "get_customer_orders": {
                 "description": "获取客户的订单列表",
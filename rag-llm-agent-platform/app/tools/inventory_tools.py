@@ -51,7 +51,9 @@ class InventoryTools:
                     },
                     "required": ["product_id", "quantity", "warehouse_id"]
                 },
-                "handler": self.update_inventory
+                "handler": self.update_inventory,
+                "mutating": True,
+                "entity_key": "product_id"
             },
             "reserve_inventory": {
                 "description": "预留库存（用于订单）",
@@ -73,7 +75,9 @@ class InventoryTools:
                     },
                     "required": ["product_id", "quantity", "order_id"]
                 },
-                "handler": self.reserve_inventory
+                "handler": self.reserve_inventory,
+                "mutating": True,
+                "entity_key": "product_id"
             }
         }
     
@@ -37,7 +37,9 @@ class OrderTools:
                     },
                     "required": ["customer_id", "items"]
                 },
-                "handler": self.create_order
+                "handler": self.create_order,
+                "mutating": True,
+                "entity_key": "customer_id"
             },
             "update_order": {
                 "description": "更新订单信息",
@@ -56,7 +58,9 @@ class OrderTools:
                     },
                     "required": ["order_id", "status"]
                 },
-                "handler": self.update_order
+                "handler": self.update_order,
+                "mutating": True,
+                "entity_key": "order_id"
             },
             "get_order": {
                 "description": "查询订单详情",
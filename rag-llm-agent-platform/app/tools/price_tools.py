@@ -29,7 +29,9 @@ class PriceTools:
                     },
                     "required": ["product_id", "new_price"]
                 },
-                "handler": self.update_price
+                "handler": self.update_price,
+                "mutating": True,
+                "entity_key": "product_id"
             },
             "get_price": {
                 "description": "查询商品价格",
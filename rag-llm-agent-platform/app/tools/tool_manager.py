@@ -2,8 +2,16 @@
 Function Calling 工具管理器
 支持 30+ 业务工具
 """
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Dict, List, Any
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
+from app.core import metrics
+from app.core.config import settings
 from app.tools.order_tools import OrderTools
 from app.tools.price_tools import PriceTools
 from app.tools.inventory_tools import InventoryTools
@@ -11,52 +19,116 @@ from app.tools.customer_tools import CustomerTools
 
 logger = logging.getLogger(__name__)
 
+# 意图关键词 -> 工具分组，用于只向 LLM 发送相关工具，减少提示词 token
+TOOL_GROUP_KEYWORDS = {
+    "order": ("订单", "下单", "发货", "物流", "退货", "order"),
+    "price": ("价格", "多少钱", "价钱", "报价", "调价", "price"),
+    "inventory": ("库存", "存货", "仓库", "预留", "缺货", "inventory", "stock"),
+    "customer": ("客户", "顾客", "会员", "customer"),
+}
+
+
+@dataclass(frozen=True)
+class ToolSchemaSet:
+    """预计算的工具 Schema 集合"""
+    schemas: Tuple[Dict, ...]
+    payload: bytes  # 预序列化的 tools 数组 JSON，与 SDK / httpx 发送的字节一致（紧凑、不排序键、不转义非 ASCII）
+    version: str  # payload 的 SHA-256 前 16 位，同一工具子集稳定不变，供提示词缓存与日志做键
+
 
 class ToolManager:
     """工具管理器"""
     
     def __init__(self):
         self.tools = {}
+        self.tool_groups: Dict[str, Tuple[str, ...]] = {}
+        self._schema_sets: Dict[Tuple[str, ...], ToolSchemaSet] = {}
+        # 写操作按实体加锁：{锁键: [锁, 引用计数]}
+        self._entity_locks: Dict[str, list] = {}
         self._register_tools()
     
     def _register_tools(self):
         """注册所有工具"""
         # 注册订单相关工具
-        order_tools = OrderTools()
-        self.tools.update(order_tools.get_tools())
+        self._register_group("order", OrderTools())
         
         # 注册价格相关工具
-        price_tools = PriceTools()
-        self.tools.update(price_tools.get_tools())
+        self._register_group("price", PriceTools())
         
         # 注册库存相关工具
-        inventory_tools = InventoryTools()
-        self.tools.update(inventory_tools.get_tools())
+        self._register_group("inventory", InventoryTools())
         
         # 注册客户相关工具
-        customer_tools = CustomerTools()
-        self.tools.update(customer_tools.get_tools())
+        self._register_group("customer", CustomerTools())
         
-        logger.info(f"已注册 {len(self.tools)} 个工具")
+        # 注册完成后一次性构建 Schema，后续每轮对话直接复用
+        self._schema_sets.clear()
+        self.schema_set = self._build_schema_set(tuple(self.tools))
+        logger.info(f"已注册 {len(self.tools)} 个工具, schema version={self.schema_set.version}")
     
-    def get_available_tools(self) -> List[Dict]:
-        """
-        获取可用工具列表（用于 Function Calling）
-        
-        Returns:
-            OpenAI Function Calling 格式的工具列表
-        """
-        return [
+    def _register_group(self, group: str, provider):
+        tools = provider.get_tools()
+        self.tools.update(tools)
+        self.tool_groups[group] = tuple(tools)
+    
+    def _build_schema_set(self, names: Tuple[str, ...]) -> ToolSchemaSet:
+        schemas = tuple(
             {
                 "type": "function",
                 "function": {
                     "name": name,
-                    "description": tool["description"],
-                    "parameters": tool["parameters"]
+                    "description": self.tools[name]["description"],
+                    "parameters": self.tools[name]["parameters"]
                 }
             }
-            for name, tool in self.tools.items()
-        ]
+            for name in names
+        )
+        # 与 httpx 序列化请求体的参数一致，payload 即请求体中 "tools" 字段的原样字节
+        payload = json.dumps(schemas, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+        return ToolSchemaSet(
+            schemas=schemas,
+            payload=payload,
+            version=hashlib.sha256(payload).hexdigest()[:16]
+        )
+    
+    def select_groups(self, message: str) -> Tuple[str, ...]:
+        """根据用户消息匹配相关的工具分组，无匹配时返回全部分组"""
+        text = message.casefold()
+        groups = tuple(
+            group for group, keywords in TOOL_GROUP_KEYWORDS.items()
+            if group in self.tool_groups and any(keyword in text for keyword in keywords)
+        )
+        return groups or tuple(self.tool_groups)
+    
+    def get_schema_set(self, message: Optional[str] = None) -> ToolSchemaSet:
+        """
+        获取工具 Schema 集合（按意图分组子集，结果缓存）
+        
+        Args:
+            message: 用户消息，为空时返回全部工具
+        """
+        if not message:
+            return self.schema_set
+        
+        groups = self.select_groups(message)
+        schema_set = self._schema_sets.get(groups)
+        if schema_set is None:
+            names = tuple(name for group in groups for name in self.tool_groups[group])
+            schema_set = self._build_schema_set(names)
+            self._schema_sets[groups] = schema_set
+        return schema_set
+    
+    def get_available_tools(self, message: Optional[str] = None) -> Tuple[Dict, ...]:
+        """
+        获取可用工具列表（用于 Function Calling）
+        
+        Args:
+            message: 用户消息，传入时只返回意图相关的工具分组
+            
+        Returns:
+            OpenAI Function Calling 格式的工具列表（预计算的不可变元组，调用方不应修改）
+        """
+        return self.get_schema_set(message).schemas
     
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
@@ -74,12 +146,53 @@ class ToolManager:
         
         tool = self.tools[tool_name]
         handler = tool["handler"]
+        timeout = tool.get("timeout", settings.TOOL_TIMEOUT)
         
+        start = time.perf_counter()
         try:
-            result = await handler(**arguments)
+            async with self._entity_lock(self.get_lock_key(tool_name, arguments)):
+                result = await asyncio.wait_for(handler(**arguments), timeout=timeout)
+            metrics.observe_tool(tool_name, "success", time.perf_counter() - start)
             logger.info(f"工具执行成功: {tool_name}, 参数: {arguments}")
             return result
+        except asyncio.TimeoutError:
+            metrics.observe_tool(tool_name, "timeout", time.perf_counter() - start)
+            logger.error(f"工具执行超时: {tool_name}, timeout={timeout}s")
+            raise
         except Exception as e:
+            metrics.observe_tool(tool_name, "error", time.perf_counter() - start)
             logger.error(f"工具执行失败: {tool_name}, 错误: {str(e)}")
             raise
+    
+    def get_lock_key(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """
+        获取写操作的串行化锁键
+        
+        工具定义中声明 "mutating": True 的工具按 entity_key 对应的参数值串行执行
+        （如同一 product_id 的库存更新与预留），只读工具返回 None 可并发执行
+        """
+        tool = self.tools.get(tool_name, {})
+        if not tool.get("mutating"):
+            return None
+        entity_key = tool.get("entity_key")
+        if entity_key and arguments.get(entity_key) is not None:
+            return f"{entity_key}:{arguments[entity_key]}"
+        return f"tool:{tool_name}"
+    
+    @asynccontextmanager
+    async def _entity_lock(self, key: Optional[str]):
+        """按锁键串行执行，无人等待时回收锁"""
+        if key is None:
+            yield
+            return
+        
+        entry = self._entity_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entity_locks[key]
 
@@ -0,0 +1,60 @@
+"""
+基准测试公共工具
+"""
+import math
+import time
+from typing import Dict, List, Sequence
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(name: str, samples_ms: List[float], elapsed: float = 0.0) -> Dict:
+    """汇总延迟样本（毫秒）"""
+    summary = {
+        "name": name,
+        "count": len(samples_ms),
+        "p50_ms": percentile(samples_ms, 50),
+        "p99_ms": percentile(samples_ms, 99),
+        "max_ms": max(samples_ms) if samples_ms else 0.0,
+    }
+    if elapsed:
+        summary["rps"] = len(samples_ms) / elapsed
+    return summary
+
+
+def print_report(rows: List[Dict]):
+    """以表格形式打印结果"""
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {
+        col: max(len(col), *(len(_fmt(row.get(col))) for row in rows))
+        for col in columns
+    }
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print("  ".join(_fmt(row.get(col)).ljust(widths[col]) for col in columns))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+class Timer:
+    """上下文计时器（毫秒）"""
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.elapsed_ms = (time.perf_counter() - self.start) * 1000
@@ -0,0 +1,88 @@
+"""
+每请求新建 RAGAgent vs 应用级共享 RAGAgent 的延迟对比
+
+上游调用（Embedding / 向量检索 / LLM）以固定延迟模拟，测量的是客户端构造、
+工具注册和连接池建立带来的额外开销。配置了 PostgreSQL 时加 --with-db 可把
+真实的连接池建立计入“每请求新建”一侧。
+
+用法:
+    python -m benchmarks.bench_agent_lifecycle --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.rag_agent import RAGAgent
+from app.core.config import settings
+from app.llm.llm_client import LLMClient
+from app.rag.retriever import Retriever
+from benchmarks._common import print_report, summarize
+
+
+def _install_fake_upstreams(latency_ms: float):
+    """用固定延迟替换网络调用"""
+    async def fake_retrieve(self, query, top_k=5, **kwargs):
+        await asyncio.sleep(latency_ms / 1000)
+        return [{"content": "文档", "source": "doc"}]
+    
+    async def fake_chat(self, message, **kwargs):
+        await asyncio.sleep(latency_ms / 1000)
+        return {"content": "回答", "tool_calls": None}
+    
+    Retriever.retrieve = fake_retrieve
+    LLMClient.chat = fake_chat
+
+
+async def _run(handler, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await handler()
+            samples.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return samples, time.perf_counter() - start
+
+
+async def main(args):
+    # 占位凭据：仅用于构造客户端，不会发出网络请求
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "sk-bench"
+    settings.AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID or "bench"
+    settings.AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY or "bench"
+    _install_fake_upstreams(args.upstream_latency_ms)
+    
+    async def per_request():
+        agent = RAGAgent()
+        if args.with_db:
+            await agent.startup()
+        await agent.chat("库存查询")
+        if args.with_db:
+            await agent.vector_store.close()
+    
+    shared = RAGAgent()
+    if args.with_db:
+        await shared.startup()
+    
+    async def shared_agent():
+        await shared.chat("库存查询")
+    
+    rows = []
+    for name, handler in (("per-request agent", per_request), ("shared agent", shared_agent)):
+        samples, elapsed = await _run(handler, args.requests, args.concurrency)
+        rows.append(summarize(name, samples, elapsed))
+    
+    await shared.close()
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    parser.add_argument("--with-db", action="store_true", help="计入真实的 asyncpg 连接池建立")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""
+批量对话压测：逐条调用 RAGAgent.chat vs /chat:batch 批量任务
+
+启动本地假上游（Embedding + Chat，兼容 OpenAI 协议），对同一组问题分别：
+- 逐条：以 --concurrency 并发调用 agent.chat（每个问题一次 Embedding 请求、一次检索）
+- 批量：BatchChatRunner（每 --batch-size 个问题一次 Embedding 请求、一次 search_many）
+对比吞吐、上游请求数和数据库往返次数。
+
+本地没有 PostgreSQL 时，检索以固定往返延迟模拟：单次检索 --db-latency-ms，
+批量检索 --db-latency-ms + 每个查询 --db-per-query-ms。配置了数据库时加 --with-db 使用真实检索。
+
+用法:
+    python -m benchmarks.bench_batch_chat --questions 1000 --concurrency 16 --batch-size 64
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.rag_agent import RAGAgent
+from app.core.config import settings
+from app.rag.vector_store import VectorStore
+from benchmarks._common import print_report
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+_search_calls = {"count": 0}
+
+
+def _install_fake_search(latency_ms: float, per_query_ms: float):
+    """检索以固定往返延迟替换"""
+    async def fake_search_similar(self, query_embedding, top_k=5, **kwargs):
+        _search_calls["count"] += 1
+        await asyncio.sleep(latency_ms / 1000)
+        return [{"content": "文档", "source": "doc"}]
+    
+    async def fake_search_many(self, query_embeddings, top_k=5, **kwargs):
+        _search_calls["count"] += 1
+        await asyncio.sleep((latency_ms + per_query_ms * len(query_embeddings)) / 1000)
+        return [[{"content": "文档", "source": "doc"}] for _ in query_embeddings]
+    
+    VectorStore.search_similar = fake_search_similar
+    VectorStore.search_many = fake_search_many
+
+
+async def _per_question(agent: RAGAgent, questions, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def one(question):
+        async with semaphore:
+            await agent.chat(question)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(question) for question in questions))
+    return time.perf_counter() - start
+
+
+async def _batch(agent: RAGAgent, questions) -> float:
+    start = time.perf_counter()
+    job = agent.batch_runner.submit([{"id": i, "message": question} for i, question in enumerate(questions)])
+    async for _ in job.iter_results():
+        pass
+    return time.perf_counter() - start
+
+
+async def main(args):
+    config = FakeUpstreamConfig(
+        embedding_latency_ms=args.upstream_latency_ms,
+        max_concurrency=args.concurrency,
+        chat_latency_ms=args.llm_latency_ms,
+        chat_max_concurrency=args.concurrency
+    )
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        settings.AWS_ACCESS_KEY_ID = ""
+        settings.AWS_SECRET_ACCESS_KEY = ""
+        settings.EMBEDDING_CACHE_ENABLED = False
+        settings.RESPONSE_CACHE_ENABLED = False
+        settings.CONCURRENCY_LIMIT_ENABLED = False
+        settings.BATCH_CHAT_SIZE = args.batch_size
+        settings.BATCH_LLM_CONCURRENCY = args.concurrency
+        if not args.with_db:
+            _install_fake_search(args.db_latency_ms, args.db_per_query_ms)
+        
+        rows = []
+        for name, run in (("per-question chat", _per_question), ("batch job", _batch)):
+            agent = RAGAgent()
+            if args.with_db:
+                await agent.startup()
+            questions = [f"{name} 问题 {i}" for i in range(args.questions)]
+            before = dict(config.stats)
+            searches_before = _search_calls["count"]
+            
+            if run is _per_question:
+                elapsed = await run(agent, questions, args.concurrency)
+            else:
+                elapsed = await run(agent, questions)
+            
+            rows.append({
+                "name": name,
+                "questions": args.questions,
+                "seconds": elapsed,
+                "questions_per_sec": args.questions / elapsed,
+                "embedding_requests": config.stats["embedding_requests"] - before["embedding_requests"],
+                "llm_requests": config.stats["chat_requests"] - before["chat_requests"],
+                "search_calls": "-" if args.with_db else _search_calls["count"] - searches_before
+            })
+            await agent.close()
+    
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16, help="LLM 并发数（两种方式相同）")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--upstream-latency-ms", type=float, default=30.0, help="Embedding 请求延迟")
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0, help="LLM 首字延迟")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--db-per-query-ms", type=float, default=0.5)
+    parser.add_argument("--with-db", action="store_true", help="使用真实的 PostgreSQL 检索")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""
+会话历史内存占用：10 万个打开的会话
+
+用 tracemalloc 统计 ConversationStore 在不同对话轮数下的总内存与平均每会话内存，
+并验证长对话的单会话占用不会随轮数增长（受 max_turns / max_chars 限制）。
+
+用法:
+    python -m benchmarks.bench_conversation_memory --conversations 100000 --turns 1 5 50
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.core.config import settings
+from app.agents.conversation_store import ConversationStore
+from benchmarks._common import print_report
+
+QUESTION = "我上周下的订单什么时候能到？订单号 ORD-2024-{i:06d}"
+ANSWER = "您的订单 ORD-2024-{i:06d} 已于昨日发货，预计 2-3 个工作日送达，可在订单详情页查看物流进度。"
+
+
+async def measure(conversations: int, turns: int, args) -> dict:
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    store = ConversationStore(
+        max_conversations=conversations,
+        max_turns=args.max_turns,
+        max_chars=args.max_chars,
+        ttl=3600
+    )
+    
+    start = time.perf_counter()
+    for turn in range(turns):
+        for i in range(conversations):
+            await store.append(f"conv-{i}", QUESTION.format(i=i), ANSWER.format(i=i))
+    elapsed = time.perf_counter() - start
+    
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    per_conversation = used / conversations
+    return {
+        "name": f"turns={turns}",
+        "conversations": store.stats()["conversations"],
+        "total_mb": used / 1024 / 1024,
+        "bytes_per_conv": per_conversation,
+        "appends_per_sec": conversations * turns / elapsed,
+    }
+
+
+async def main(args):
+    rows = [await measure(args.conversations, turns, args) for turns in args.turns]
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 5, 50])
+    parser.add_argument("--max-turns", type=int, default=settings.CONVERSATION_MAX_TURNS)
+    parser.add_argument("--max-chars", type=int, default=settings.CONVERSATION_MAX_CHARS)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Embedding 微批处理压测：逐条请求 vs 微批合并
+
+启动本地假 Embedding 服务（固定基础延迟 + 并发上限），以突发方式并发调用
+Retriever.embed_query，对比上游请求数、吞吐和 p50/p99。
+
+用法:
+    python -m benchmarks.bench_embedding_batcher --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.rag.retriever import Retriever
+from benchmarks._common import print_report, summarize
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+
+async def _run(retriever: Retriever, requests: int, concurrency: int, run_id: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await retriever.embed_query(f"{run_id} 问题 {i}")
+            samples.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return samples, time.perf_counter() - start
+
+
+async def main(args):
+    config = FakeUpstreamConfig(
+        embedding_latency_ms=args.upstream_latency_ms,
+        embedding_dimension=args.dimension,
+        max_concurrency=args.upstream_concurrency
+    )
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        settings.EMBEDDING_CACHE_ENABLED = False
+        settings.EMBEDDING_BATCH_MAX_WAIT_MS = args.window_ms
+        
+        rows = []
+        for batching in (False, True):
+            settings.EMBEDDING_BATCH_ENABLED = batching
+            retriever = Retriever(vector_store=None)
+            before = config.stats["embedding_requests"]
+            samples, elapsed = await _run(retriever, args.requests, args.concurrency, str(batching))
+            await retriever.close()
+            
+            row = summarize("micro-batched" if batching else "one request each", samples, elapsed)
+            row["upstream_requests"] = config.stats["embedding_requests"] - before
+            rows.append(row)
+    
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--upstream-latency-ms", type=float, default=30.0)
+    parser.add_argument("--upstream-concurrency", type=int, default=8)
+    # 假服务与压测客户端同进程，维度过大时 JSON 编解码的 CPU 开销会掩盖网络效果
+    parser.add_argument("--dimension", type=int, default=256)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Embedding 提供方压测：远程接口 vs 本地 CPU 推理
+
+远程路径由本地假 Embedding 服务模拟（固定延迟，默认 150ms，对应 ada-002 常见的
+100-300ms），本地路径加载 sentence-transformers 模型在 CPU 上推理。两条路径都经过
+Retriever.embed_query（含微批合并，不使用缓存），以固定并发发送查询，
+对比 queries/sec 与 p50/p99。
+
+本地模型未安装或无法加载（如离线环境）时跳过本地路径。
+
+用法:
+    python -m benchmarks.bench_embedding_provider --queries 2000 --concurrency 32 \\
+        --local-model sentence-transformers/all-MiniLM-L6-v2 --backend onnx
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.rag.retriever import Retriever
+from benchmarks._common import print_report, summarize
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+
+async def _run(retriever: Retriever, queries: int, concurrency: int, run_id: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await retriever.embed_query(f"{run_id} 如何申请退货 {i}")
+            samples.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(queries)))
+    return samples, time.perf_counter() - start
+
+
+async def _bench(name: str, model: str, args):
+    settings.EMBEDDING_MODEL = model
+    retriever = Retriever(vector_store=None)
+    try:
+        warmup_start = time.perf_counter()
+        await retriever.warmup()
+        warmup_ms = (time.perf_counter() - warmup_start) * 1000
+        samples, elapsed = await _run(retriever, args.queries, args.concurrency, name)
+    finally:
+        await retriever.close()
+    row = summarize(name, samples, elapsed)
+    row["warmup_ms"] = warmup_ms
+    return row
+
+
+async def main(args):
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.EMBEDDING_BATCH_ENABLED = True
+    settings.EMBEDDING_BATCH_MAX_SIZE = args.batch_size
+    settings.EMBEDDING_LOCAL_BACKEND = args.backend
+    
+    config = FakeUpstreamConfig(
+        embedding_latency_ms=args.remote_latency_ms,
+        max_concurrency=args.concurrency
+    )
+    rows = []
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        rows.append(await _bench("remote (stub)", "text-embedding-ada-002", args))
+    
+    try:
+        rows.append(await _bench(f"local ({args.backend})", f"local:{args.local_model}", args))
+    except Exception as e:
+        print(f"跳过本地路径: {type(e).__name__}: {e}")
+    
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--remote-latency-ms", type=float, default=150.0)
+    parser.add_argument("--local-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""
+带元数据过滤的向量检索：召回率 / 返回条数 vs 延迟（需要 PostgreSQL + pgvector）
+
+在 bench_documents 表中为每行分配 category（按不同选择度），建立 HNSW 与
+metadata GIN 索引，对比四种策略：
+- post_filter: 默认 ef_search，索引扫描后过滤（低选择度时常返回不足 k 条）
+- overfetch: 按 FILTER_OVERFETCH_FACTOR 放大 ef_search
+- iterative: pgvector 0.8+ hnsw.iterative_scan=relaxed_order
+- exact: 禁用索引扫描，走 GIN 位图 + 精确排序
+
+用法:
+    python -m benchmarks.bench_filtered_search --rows 50000 --selectivity 0.5 0.05 0.005
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+from app.rag.index_manager import index_ddl, plan_index
+from app.rag.pgvector_codec import init_connection
+from app.rag.search_filter import SearchFilter
+from benchmarks._common import print_report, summarize
+from benchmarks.bench_vector_index import make_corpus
+
+TABLE = "bench_documents"
+
+
+def strategies(k: int, factor: int):
+    return {
+        "post_filter": {},
+        "overfetch": {"hnsw.ef_search": str(max(40, k * factor))},
+        "iterative": {"hnsw.iterative_scan": "relaxed_order"},
+        "exact": {"enable_indexscan": "off"},
+    }
+
+
+async def load_corpus(conn, vectors, categories):
+    await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await conn.execute(
+        f"CREATE TABLE {TABLE} (id BIGINT PRIMARY KEY, embedding vector({vectors.shape[1]}), metadata JSONB)"
+    )
+    await conn.copy_records_to_table(
+        TABLE,
+        records=((i, vector, {"category": category}) for i, (vector, category) in enumerate(zip(vectors, categories))),
+        columns=["id", "embedding", "metadata"]
+    )
+    await conn.execute(f"CREATE INDEX {TABLE}_metadata_idx ON {TABLE} USING GIN (metadata)")
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def measure(conn, name, params, queries, truth, k, search_filter):
+    where, filter_args = search_filter.to_sql(first_param=3)
+    sql = f"SELECT id FROM {TABLE} {where} ORDER BY embedding <=> $1::vector LIMIT $2"
+    samples, recalls, returned = [], [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        async with conn.transaction():
+            for key, value in params.items():
+                await conn.execute("SELECT set_config($1, $2, true)", key, value)
+            rows = await conn.fetch(sql, query, k, *filter_args)
+        samples.append((time.perf_counter() - start) * 1000)
+        returned.append(len(rows))
+        recalls.append(len({row["id"] for row in rows} & expected) / max(1, len(expected)))
+    row = summarize(name, samples)
+    row["recall"] = float(np.mean(recalls))
+    row["avg_returned"] = float(np.mean(returned))
+    return row
+
+
+async def main(args):
+    vectors = make_corpus(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(2)
+    draws = rng.random(args.rows)
+    # 每个选择度一个类别：category=s{选择度} 的行占比约为该选择度
+    categories = ["other"] * args.rows
+    lower = 0.0
+    for selectivity in sorted(args.selectivity):
+        for i in np.nonzero((draws >= lower) & (draws < lower + selectivity))[0]:
+            categories[i] = f"s{selectivity}"
+        lower += selectivity
+    labels = np.array(categories)
+    
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)]
+    
+    conn = await asyncpg.connect(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD
+    )
+    await init_connection(conn)
+    try:
+        await load_corpus(conn, vectors, categories)
+        await conn.execute(index_ddl(plan_index("hnsw", args.rows), f"{TABLE}_idx", table=TABLE))
+        
+        for selectivity in args.selectivity:
+            category = f"s{selectivity}"
+            mask = labels == category
+            ids = np.nonzero(mask)[0]
+            truth = [set(ids[np.argsort(-(vectors[mask] @ query))[:args.k]].tolist()) for query in queries]
+            search_filter = SearchFilter(contains={"category": category})
+            
+            print(f"\nselectivity={selectivity} ({mask.sum()} rows)")
+            rows = [
+                await measure(conn, name, params, queries, truth, args.k, search_filter)
+                for name, params in strategies(args.k, args.overfetch_factor).items()
+            ]
+            print_report(rows)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--selectivity", type=float, nargs="+", default=[0.5, 0.05, 0.005])
+    parser.add_argument("--overfetch-factor", type=int, default=settings.FILTER_OVERFETCH_FACTOR)
+    parser.add_argument("--keep", action="store_true", help="保留 bench_documents 表")
+    asyncio.run(main(parser.parse_args()))
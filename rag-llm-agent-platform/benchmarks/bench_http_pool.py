@@ -0,0 +1,97 @@
+"""
+OpenAI 客户端 HTTP 传输：SDK 默认配置 vs 共享连接池（app/core/http_client.py）
+
+每次请求与 RAG 流程一致：先调 Embedding 接口，再调 Chat 接口。请求分 --waves 波突发，
+每波 --concurrency 个并发请求，波与波之间空闲 --idle-seconds 秒（默认超过 SDK 5 秒的 keep-alive）。
+假上游按 --error-rate 比例返回 503（--retry-after 非空时带 Retry-After 头）。
+- SDK 默认：Embedding 与 Chat 各一个 AsyncOpenAI，各自的连接池，keep-alive 5 秒，SDK 自身重试
+- 共享连接池：create_openai_client，共用一个连接池，keep-alive HTTP_KEEPALIVE_EXPIRY 秒，传输层抖动重试
+报告端到端延迟与服务端接受的连接数。假上游（uvicorn）只支持 HTTP/1.1，这里测不到 HTTP/2 多路复用。
+
+用法:
+    python -m benchmarks.bench_http_pool --waves 3 --concurrency 64 --idle-seconds 6 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.http_client import create_openai_client
+from benchmarks._common import print_report, summarize
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+
+async def _one(embedding_client, chat_client, i: int):
+    await embedding_client.embeddings.create(model="fake", input=[f"问题 {i}"])
+    await chat_client.chat.completions.create(model="fake", messages=[{"role": "user", "content": f"问题 {i}"}])
+
+
+async def _run(name: str, make_client, config: FakeUpstreamConfig, args):
+    embedding_client, chat_client = make_client(), make_client()
+    config.connections.clear()
+    samples, failures = [], 0
+    
+    async def one(i):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await _one(embedding_client, chat_client, i)
+        except Exception:
+            failures += 1
+            return
+        samples.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    busy = 0.0
+    for wave in range(args.waves):
+        if wave:
+            await asyncio.sleep(args.idle_seconds)
+        wave_start = time.perf_counter()
+        await asyncio.gather(*(one(wave * args.concurrency + i) for i in range(args.concurrency)))
+        busy += time.perf_counter() - wave_start
+    
+    row = summarize(name, samples, busy)
+    row["failures"] = failures
+    row["connections"] = len(config.connections)
+    await embedding_client.close()
+    await chat_client.close()
+    print(f"{name}: 总耗时 {time.perf_counter() - start:.1f}s（rps 不含空闲间隔）")
+    return row
+
+
+async def main(args):
+    config = FakeUpstreamConfig(
+        embedding_latency_ms=20.0,
+        embedding_dimension=256,
+        max_concurrency=args.concurrency,
+        chat_latency_ms=args.llm_latency_ms,
+        chat_tokens=10,
+        chat_max_concurrency=args.concurrency,
+        error_rate=args.error_rate,
+        error_retry_after=args.retry_after
+    )
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        
+        def sdk_default():
+            return AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+        
+        rows = [
+            await _run("sdk default", sdk_default, config, args),
+            await _run("shared pool", create_openai_client, config, args)
+        ]
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=64, help="每波并发请求数")
+    parser.add_argument("--idle-seconds", type=float, default=6.0, help="波与波之间的空闲时间")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="假上游返回 503 的比例")
+    parser.add_argument("--retry-after", default="", help="503 响应的 Retry-After 值（秒），为空不带该头")
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0)
+    asyncio.run(main(parser.parse_args()))
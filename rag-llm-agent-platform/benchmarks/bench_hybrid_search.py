@@ -0,0 +1,144 @@
+"""
+混合检索（向量 + 全文 RRF）vs 纯向量检索：命中率与延迟（需要 PostgreSQL + pgvector）
+
+合成商品目录：每个商品有唯一 SKU、类别和描述，向量 = 类别中心 + 噪声。
+两类查询：
+- sku: 按 SKU 精确查找（查询向量只携带类别语义，纯向量检索难以命中具体商品）
+- semantic: 描述性查询（查询向量接近目标商品）
+统计目标商品出现在 top-k 中的比例（hit@k）与 p50/p99 延迟。
+
+用法:
+    python -m benchmarks.bench_hybrid_search --rows 50000 --queries 200
+"""
+import argparse
+import asyncio
+import re
+import time
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+from app.rag.pgvector_codec import init_connection
+from app.rag.vector_store import _HYBRID_SQL, _SEARCH_SQL
+from benchmarks._common import print_report, summarize
+
+TABLE = "bench_documents"
+CATEGORIES = ["laptop", "phone", "monitor", "keyboard", "mouse", "headset", "camera", "printer"]
+
+
+def on_table(sql: str) -> str:
+    return re.sub(r"\bdocuments\b", TABLE, sql.format(where=""))
+
+
+def make_catalog(rows: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(len(CATEGORIES), dim)).astype(np.float32)
+    labels = rng.integers(0, len(CATEGORIES), size=rows)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    contents = [
+        f"SKU-{i:07d} {CATEGORIES[label]} model {rng.integers(100, 999)} stock item"
+        for i, label in enumerate(labels)
+    ]
+    return rng, centers, labels, vectors, contents
+
+
+def make_queries(rng, centers, labels, vectors, count: int):
+    queries = []
+    for kind in ("sku", "semantic"):
+        for target in rng.choice(len(labels), count, replace=False):
+            category = CATEGORIES[labels[target]]
+            if kind == "sku":
+                vector = centers[labels[target]] + 0.5 * rng.normal(size=centers.shape[1])
+                text = f"SKU-{target:07d}"
+            else:
+                vector = vectors[target] + 0.05 * rng.normal(size=vectors.shape[1])
+                text = f"{category} model"
+            vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+            queries.append((kind, int(target), vector, text))
+    return queries
+
+
+async def load_catalog(conn, vectors, contents):
+    await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await conn.execute(
+        f"""
+        CREATE TABLE {TABLE} (
+            id BIGINT PRIMARY KEY,
+            content TEXT NOT NULL,
+            embedding vector({vectors.shape[1]}),
+            metadata JSONB,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+        )
+        """
+    )
+    await conn.copy_records_to_table(
+        TABLE,
+        records=((i, content, vector, {}) for i, (content, vector) in enumerate(zip(contents, vectors))),
+        columns=["id", "content", "embedding", "metadata"]
+    )
+    await conn.execute(f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_cosine_ops)")
+    await conn.execute(f"CREATE INDEX ON {TABLE} USING GIN (content_tsv)")
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def run_mode(conn, mode, queries, k, args):
+    samples = {"sku": [], "semantic": []}
+    hits = {"sku": 0, "semantic": 0}
+    for kind, target, vector, text in queries:
+        start = time.perf_counter()
+        if mode == "vector":
+            rows = await conn.fetch(on_table(_SEARCH_SQL), vector, k)
+        else:
+            rows = await conn.fetch(
+                on_table(_HYBRID_SQL), vector, k, args.candidates, text,
+                args.vector_weight, args.text_weight, args.rrf_k
+            )
+        samples[kind].append((time.perf_counter() - start) * 1000)
+        hits[kind] += any(int(row["id"]) == target for row in rows)
+    
+    report = []
+    for kind in ("sku", "semantic"):
+        row = summarize(f"{mode}/{kind}", samples[kind])
+        row[f"hit@{k}"] = hits[kind] / len(samples[kind])
+        report.append(row)
+    return report
+
+
+async def main(args):
+    rng, centers, labels, vectors, contents = make_catalog(args.rows, args.dim)
+    queries = make_queries(rng, centers, labels, vectors, args.queries)
+    
+    conn = await asyncpg.connect(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD
+    )
+    await init_connection(conn)
+    try:
+        await load_catalog(conn, vectors, contents)
+        rows = []
+        for mode in ("vector", "hybrid"):
+            rows.extend(await run_mode(conn, mode, queries, args.k, args))
+        print_report(rows)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200, help="每类查询条数")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=settings.HYBRID_CANDIDATES)
+    parser.add_argument("--vector-weight", type=float, default=settings.HYBRID_VECTOR_WEIGHT)
+    parser.add_argument("--text-weight", type=float, default=settings.HYBRID_TEXT_WEIGHT)
+    parser.add_argument("--rrf-k", type=int, default=settings.RRF_K)
+    parser.add_argument("--keep", action="store_true", help="保留 bench_documents 表")
+    asyncio.run(main(parser.parse_args()))
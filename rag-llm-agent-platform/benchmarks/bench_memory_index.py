@@ -0,0 +1,152 @@
+"""
+内存向量索引（IVF-PQ + float16 精确重排）vs pgvector
+
+在同一组聚类分布的合成向量上：
+- 构建 MemoryVectorIndex，报告训练耗时与每百万向量的内存占用（向量部分，不含文档内容）
+- 以固定并发经 MemoryIndexReplica 的线程池检索，扫描 nprobe，报告 QPS / p50 / p99 / recall@k
+- 加 --with-db 时把向量写入 bench_documents 表并建 HNSW 索引，以同样并发经连接池检索对比
+  （需要 PostgreSQL + pgvector）
+
+recall@k 以 numpy 暴力检索结果为基准。
+
+用法:
+    python -m benchmarks.bench_memory_index --rows 100000 --dim 1536 --concurrency 16 --with-db
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+from app.rag.index_manager import index_ddl, plan_index
+from app.rag.memory_index import MemoryIndexReplica, MemoryVectorIndex
+from app.rag.pgvector_codec import init_connection
+from benchmarks._common import print_report, summarize
+from benchmarks.bench_vector_index import TABLE, load_corpus, make_corpus
+
+
+async def _measure(name: str, search, queries, truth, k: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, recalls = [], []
+    
+    async def one(query, expected):
+        async with semaphore:
+            start = time.perf_counter()
+            ids = await search(query)
+            samples.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(set(ids) & expected) / k)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query, expected) for query, expected in zip(queries, truth)))
+    row = summarize(name, samples, time.perf_counter() - start)
+    row["recall"] = float(np.mean(recalls))
+    return row
+
+
+async def _bench_memory(vectors, queries, truth, args):
+    index = MemoryVectorIndex(vectors.shape[1], nlist=args.nlist, pq_m=args.pq_m, rerank_factor=args.rerank_factor)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), 10000):
+        batch = vectors[offset:offset + 10000]
+        ids = [str(i) for i in range(offset, offset + len(batch))]
+        index.add(ids, batch, [""] * len(batch), [None] * len(batch), auto_train=False)
+    index.train()
+    stats = index.stats()
+    print(
+        f"内存索引构建 {time.perf_counter() - start:.1f}s: nlist={stats['nlist']}, pq_m={stats['pq_m']}, "
+        f"{stats['bytes_per_vector'] * 1e6 / 2 ** 20:.0f} MiB/百万向量"
+        f"（float32 原始向量 {4 * vectors.shape[1] * 1e6 / 2 ** 20:.0f} MiB/百万向量）"
+    )
+    
+    replica = MemoryIndexReplica(index, connect=None, workers=args.workers)
+    rows = []
+    try:
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            
+            async def search(query):
+                return [int(doc["id"]) for doc in await replica.search(query, args.k)]
+            
+            rows.append(await _measure(f"memory nprobe={nprobe}", search, queries, truth, args.k, args.concurrency))
+    finally:
+        await replica.close()
+    return rows
+
+
+async def _bench_pgvector(vectors, queries, truth, args):
+    conn = await asyncpg.connect(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD
+    )
+    await init_connection(conn)
+    pool = await asyncpg.create_pool(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        min_size=args.concurrency,
+        max_size=args.concurrency,
+        init=init_connection
+    )
+    rows = []
+    try:
+        await load_corpus(conn, vectors)
+        await conn.execute(index_ddl(plan_index("hnsw", len(vectors)), f"{TABLE}_idx", table=TABLE))
+        size = await conn.fetchval(f"SELECT pg_total_relation_size('{TABLE}')")
+        print(f"pgvector 表 + HNSW 索引: {size / len(vectors):.0f} B/向量")
+        
+        for ef_search in args.ef_search:
+            async def search(query):
+                async with pool.acquire() as pooled:
+                    async with pooled.transaction():
+                        await pooled.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(ef_search))
+                        records = await pooled.fetch(
+                            f"SELECT id FROM {TABLE} ORDER BY embedding <=> $1::vector LIMIT $2",
+                            query, args.k
+                        )
+                return [record["id"] for record in records]
+            
+            rows.append(await _measure(f"pgvector ef_search={ef_search}", search, queries, truth, args.k, args.concurrency))
+    finally:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+        await pool.close()
+    return rows
+
+
+async def main(args):
+    vectors = make_corpus(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.05 * rng.normal(
+        size=(args.queries, args.dim)
+    ).astype(np.float32)
+    truth = [set(np.argsort(-vectors @ query)[:args.k].tolist()) for query in queries]
+    
+    rows = await _bench_memory(vectors, queries, truth, args)
+    if args.with_db:
+        rows += await _bench_pgvector(vectors, queries, truth, args)
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="内存索引检索线程数")
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--pq-m", type=int, default=0)
+    parser.add_argument("--rerank-factor", type=int, default=40)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 80, 160])
+    parser.add_argument("--with-db", action="store_true", help="同时测试 pgvector HNSW（需要 PostgreSQL）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""
+过载压测：无并发限制 vs AIMD 自适应并发限制
+
+启动本地假 LLM 服务（固定首字延迟 + 并发上限，超出的请求在上游排队），
+以固定速率开环发送请求（到达速率不受响应快慢影响，模拟真实流量），
+请求速率高于上游容量时：
+- 无限制：所有请求都进入上游排队，排队越来越长，p99 随压测时长持续上升
+- AIMD：并发上限收敛到延迟目标附近，超出部分快速返回 503，成功请求的 p99 保持稳定
+
+检索阶段以固定延迟模拟（不需要 PostgreSQL），LLM 调用经 OPENAI_BASE_URL 指向假上游。
+
+用法:
+    python -m benchmarks.bench_overload --rps 150 --duration 10 --upstream-concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.rag_agent import RAGAgent
+from app.core.concurrency import OverloadedError
+from app.core.config import settings
+from app.rag.retriever import Retriever
+from benchmarks._common import percentile, print_report, summarize
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+
+def _install_fake_retriever(latency_ms: float):
+    """检索以固定延迟替换"""
+    async def fake_retrieve(self, query, top_k=5, **kwargs):
+        await asyncio.sleep(latency_ms / 1000)
+        return [{"content": "文档", "source": "doc"}]
+    
+    Retriever.retrieve = fake_retrieve
+
+
+async def _open_loop(agent: RAGAgent, rps: float, duration: float, stream: bool):
+    samples, rejected, errors = [], 0, 0
+    
+    async def one(i):
+        nonlocal rejected, errors
+        start = time.perf_counter()
+        try:
+            if stream:
+                # 流式接口记录首字延迟，读完整个回答后才释放并发许可
+                ttft = None
+                async for chunk in agent.chat_stream(f"问题 {i}"):
+                    if ttft is None and chunk["content"]:
+                        ttft = (time.perf_counter() - start) * 1000
+                samples.append(ttft)
+            else:
+                await agent.chat(f"问题 {i}")
+                samples.append((time.perf_counter() - start) * 1000)
+        except OverloadedError:
+            rejected += 1
+        except Exception:
+            errors += 1
+    
+    tasks = []
+    start = time.perf_counter()
+    total = int(rps * duration)
+    for i in range(total):
+        delay = start + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(i)))
+    await asyncio.gather(*tasks)
+    return samples, rejected, errors, time.perf_counter() - start
+
+
+async def main(args):
+    config = FakeUpstreamConfig(
+        chat_latency_ms=args.upstream_latency_ms,
+        chat_tokens=args.tokens,
+        chat_max_concurrency=args.upstream_concurrency
+    )
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        settings.AWS_ACCESS_KEY_ID = ""
+        settings.AWS_SECRET_ACCESS_KEY = ""
+        settings.RESPONSE_CACHE_ENABLED = False
+        settings.CHAT_LATENCY_TARGET_MS = args.latency_target_ms
+        settings.STREAM_TTFT_TARGET_MS = args.latency_target_ms
+        settings.CONCURRENCY_INITIAL_LIMIT = args.upstream_concurrency
+        _install_fake_retriever(args.retrieval_latency_ms)
+        
+        rows = []
+        for limited in (False, True):
+            settings.CONCURRENCY_LIMIT_ENABLED = limited
+            agent = RAGAgent()
+            samples, rejected, errors, elapsed = await _open_loop(agent, args.rps, args.duration, args.stream)
+            
+            row = summarize("aimd limiter" if limited else "no limiter", samples, elapsed)
+            row["p999_ms"] = percentile(samples, 99.9)
+            row["rejected"] = rejected
+            row["errors"] = errors
+            limiter = agent.stream_limiter if args.stream else agent.chat_limiter
+            row["final_limit"] = limiter.stats()["limit"] if limiter else "-"
+            rows.append(row)
+            await agent.close()
+    
+    service_seconds = (config.chat_latency_ms + config.chat_token_interval_ms * config.chat_tokens) / 1000
+    print(f"offered={args.rps:.0f} rps, upstream capacity≈{args.upstream_concurrency / service_seconds:.0f} rps")
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=150.0, help="开环到达速率")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument("--stream", action="store_true", help="压测 chat_stream（按首字延迟统计）")
+    parser.add_argument("--latency-target-ms", type=float, default=1000.0)
+    parser.add_argument("--upstream-latency-ms", type=float, default=200.0)
+    parser.add_argument("--upstream-concurrency", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--retrieval-latency-ms", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+工具调用端到端延迟：RAGAgent.chat 两次调用 vs chat_stream 流式工具调用
+
+本地假上游（Embedding + Chat，兼容 OpenAI 协议）在请求带工具时先返回 --tool-calls 个工具调用，
+每个调用的参数分段流式输出；工具执行延迟按工具依次取 --tool-latency-ms，检索以固定延迟模拟。
+- 两次调用：chat 非流式请求拿到全部工具调用 → 并发执行工具 → 再次请求生成回答
+- 流式工具调用：chat_stream 中某个调用的参数一完整就开始执行（与后续参数输出重叠），
+  结果回填后继续流式生成
+对比端到端总耗时与首字延迟（两次调用方式的首字即整个回答）。
+
+两种方式的工具都并发执行：各工具延迟相同时最后一个工具仍要在参数输出完后才开始，总耗时接近，
+差别主要在首字延迟；排在前面的工具越慢，提前执行节省的时间越多。
+
+用法:
+    python -m benchmarks.bench_tool_stream --requests 200 --concurrency 8 --tool-calls 3 \\
+        --tool-latency-ms 400 150 50
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.rag_agent import RAGAgent
+from app.core.config import settings
+from benchmarks._common import percentile, summarize, print_report
+from benchmarks.bench_batch_chat import _install_fake_search
+from benchmarks.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+TOOLS = [
+    {"type": "function", "function": {"name": name, "parameters": {"type": "object", "properties": {}}}}
+    for name in ("get_price", "check_inventory", "get_customer_info")
+]
+
+
+def _make_agent(tool_latency_ms) -> RAGAgent:
+    agent = RAGAgent()
+    latency = {tool["function"]["name"]: tool_latency_ms[i % len(tool_latency_ms)] for i, tool in enumerate(TOOLS)}
+    
+    async def execute_tool(tool_name, arguments):
+        await asyncio.sleep(latency[tool_name] / 1000)
+        return {"tool": tool_name, "ok": True}
+    
+    agent.tool_manager.get_available_tools = lambda message=None: TOOLS
+    agent.tool_manager.execute_tool = execute_tool
+    return agent
+
+
+async def _two_call(agent: RAGAgent, question: str):
+    start = time.perf_counter()
+    await agent.chat(question)
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, elapsed
+
+
+async def _streaming(agent: RAGAgent, question: str):
+    start = time.perf_counter()
+    ttft = None
+    async for chunk in agent.chat_stream(question):
+        if ttft is None and chunk["content"]:
+            ttft = (time.perf_counter() - start) * 1000
+    return (time.perf_counter() - start) * 1000, ttft
+
+
+async def _run(name: str, flow, args):
+    agent = _make_agent(args.tool_latency_ms)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    totals, ttfts = [], []
+    
+    async def one(i):
+        async with semaphore:
+            total, ttft = await flow(agent, f"{name} 问题 {i}")
+            totals.append(total)
+            ttfts.append(ttft)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    row = summarize(name, totals, time.perf_counter() - start)
+    row["ttft_p50_ms"] = percentile(ttfts, 50)
+    await agent.close()
+    return row
+
+
+async def main(args):
+    config = FakeUpstreamConfig(
+        embedding_latency_ms=20.0,
+        max_concurrency=args.concurrency,
+        chat_latency_ms=args.llm_latency_ms,
+        chat_token_interval_ms=args.token_interval_ms,
+        chat_max_concurrency=args.concurrency * 2,
+        chat_tool_calls=args.tool_calls,
+        chat_tool_arg_chunks=args.arg_chunks
+    )
+    with FakeUpstreamServer(config) as server:
+        settings.OPENAI_API_KEY = "sk-bench"
+        settings.OPENAI_BASE_URL = server.base_url
+        settings.AWS_ACCESS_KEY_ID = ""
+        settings.AWS_SECRET_ACCESS_KEY = ""
+        settings.EMBEDDING_CACHE_ENABLED = False
+        settings.RESPONSE_CACHE_ENABLED = False
+        settings.CONCURRENCY_LIMIT_ENABLED = False
+        _install_fake_search(args.db_latency_ms, 0.0)
+        
+        rows = [
+            await _run("two-call chat", _two_call, args),
+            await _run("streaming tool calls", _streaming, args)
+        ]
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tool-calls", type=int, default=3, help="模型每次请求的工具调用数")
+    parser.add_argument("--arg-chunks", type=int, default=10, help="每个调用的参数分几段输出")
+    parser.add_argument("--tool-latency-ms", type=float, nargs="+", default=[150.0], help="各工具的执行延迟，按工具依次取值")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="LLM 首个片段延迟")
+    parser.add_argument("--token-interval-ms", type=float, default=20.0)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,65 @@
+"""
+pgvector 文本 vs 二进制编解码吞吐对比（默认 1536 维）
+
+文本路径模拟原实现：客户端 str(embedding)，服务端按 pgvector 文本格式
+"[x,y,...]" 输出后再逐个解析浮点数。
+
+用法:
+    python -m benchmarks.bench_vector_codec --dim 1536 --iterations 5000
+"""
+import argparse
+import random
+import time
+
+from app.rag.pgvector_codec import decode_vector, encode_vector, np
+from benchmarks._common import print_report
+
+
+def text_encode(embedding):
+    return str(embedding)
+
+
+def text_decode(data: str):
+    return [float(x) for x in data[1:-1].split(",")]
+
+
+def _measure(name, func, payload, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(payload)
+    elapsed = time.perf_counter() - start
+    return {
+        "name": name,
+        "ops_per_sec": iterations / elapsed,
+        "us_per_op": elapsed / iterations * 1e6,
+    }
+
+
+def main(args):
+    embedding = [random.uniform(-1, 1) for _ in range(args.dim)]
+    text_payload = text_encode(embedding)
+    # pgvector 文本输出使用 float4 精度
+    text_output = "[" + ",".join(f"{v:.7g}" for v in embedding) + "]"
+    binary_payload = encode_vector(embedding)
+    
+    rows = [
+        _measure("text encode (str)", text_encode, embedding, args.iterations),
+        _measure("text decode (parse)", text_decode, text_output, args.iterations),
+        _measure("binary encode (array)", encode_vector, embedding, args.iterations),
+        _measure("binary decode (array)", decode_vector, binary_payload, args.iterations),
+    ]
+    if np is not None:
+        rows.append(_measure(
+            "binary encode (numpy)", encode_vector,
+            np.asarray(embedding, dtype=np.float32), args.iterations
+        ))
+    
+    print_report(rows)
+    print(f"\npayload bytes: text={len(text_payload.encode())}, binary={len(binary_payload)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--iterations", type=int, default=5000)
+    main(parser.parse_args())
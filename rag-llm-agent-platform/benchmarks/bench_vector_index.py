@@ -0,0 +1,114 @@
+"""
+pgvector 索引召回率 vs 延迟（需要 PostgreSQL + pgvector）
+
+在独立的 bench_documents 表中生成带聚类结构的合成向量，分别构建 HNSW 与
+IVFFlat 索引（参数由 plan_index 按行数推导），扫描 ef_search / probes，
+以 numpy 暴力检索结果为基准计算 recall@k 和 p50/p99 延迟。
+
+用法:
+    python -m benchmarks.bench_vector_index --rows 50000 --queries 200
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+from app.rag.index_manager import index_ddl, plan_index
+from app.rag.pgvector_codec import init_connection
+from benchmarks._common import print_report, summarize
+
+TABLE = "bench_documents"
+
+
+def make_corpus(rows: int, dim: int, clusters: int, seed: int = 0):
+    """生成聚类分布的单位向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+async def load_corpus(conn, vectors):
+    await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await conn.execute(
+        f"CREATE TABLE {TABLE} (id BIGINT PRIMARY KEY, embedding vector({vectors.shape[1]}))"
+    )
+    await conn.copy_records_to_table(
+        TABLE,
+        records=((i, vector) for i, vector in enumerate(vectors)),
+        columns=["id", "embedding"]
+    )
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def measure(conn, queries, truth, k, param_name, value):
+    samples, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        async with conn.transaction():
+            await conn.execute("SELECT set_config($1, $2, true)", param_name, str(value))
+            rows = await conn.fetch(
+                f"SELECT id FROM {TABLE} ORDER BY embedding <=> $1::vector LIMIT $2",
+                query, k
+            )
+        samples.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({row["id"] for row in rows} & expected) / k)
+    row = summarize(f"{param_name}={value}", samples)
+    row["recall"] = float(np.mean(recalls))
+    return row
+
+
+async def main(args):
+    vectors = make_corpus(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.05 * rng.normal(
+        size=(args.queries, args.dim)
+    ).astype(np.float32)
+    # 余弦距离基准（向量已归一化，点积排序等价）
+    truth = [set(np.argsort(-vectors @ query)[:args.k].tolist()) for query in queries]
+    
+    conn = await asyncpg.connect(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD
+    )
+    await init_connection(conn)
+    try:
+        await load_corpus(conn, vectors)
+        sweeps = {
+            "hnsw": ("hnsw.ef_search", (10, 20, 40, 80, 160, 320)),
+            "ivfflat": ("ivfflat.probes", (1, 2, 4, 8, 16, 32)),
+        }
+        for method in args.methods:
+            plan = plan_index(method, args.rows)
+            await conn.execute(f"DROP INDEX IF EXISTS {TABLE}_idx")
+            start = time.perf_counter()
+            await conn.execute(index_ddl(plan, f"{TABLE}_idx", table=TABLE))
+            print(f"\n{method} {plan['build']} built in {time.perf_counter() - start:.1f}s")
+            
+            param_name, values = sweeps[method]
+            rows = [await measure(conn, queries, truth, args.k, param_name, value) for value in values]
+            print_report(rows)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--methods", nargs="+", choices=["hnsw", "ivfflat"], default=["hnsw", "ivfflat"])
+    parser.add_argument("--keep", action="store_true", help="保留 bench_documents 表")
+    asyncio.run(main(parser.parse_args()))
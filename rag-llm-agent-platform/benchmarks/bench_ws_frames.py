@@ -0,0 +1,92 @@
+"""
+WebSocket 帧合并效果：逐块发送 vs 合并写入
+
+模拟 M 路并发流式回复（逐字符或逐 token 产出），统计每路帧数、帧速率和
+每路 CPU 时间（含 JSON 序列化）。假 WebSocket 的 send_json 按 Starlette 的
+方式序列化后丢弃。
+
+用法:
+    python -m benchmarks.bench_ws_frames --streams 50 --chars 2000 --mode char
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.api.stream_writer import CoalescingFrameWriter
+from benchmarks._common import print_report
+
+
+class SerializingWebSocket:
+    """只做序列化和计数的假 WebSocket"""
+    
+    def __init__(self):
+        self.frames = 0
+    
+    async def send_json(self, data):
+        json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.frames += 1
+        await asyncio.sleep(0)
+
+
+async def _produce(text: str, mode: str, token_size: int, delay: float):
+    step = 1 if mode == "char" else token_size
+    for i in range(0, len(text), step):
+        if delay:
+            await asyncio.sleep(delay)
+        yield text[i:i + step]
+
+
+async def _stream_direct(websocket, text, args):
+    async for content in _produce(text, args.mode, args.token_size, args.delay_ms / 1000):
+        await websocket.send_json({"type": "chunk", "content": content, "conversation_id": "c", "done": False})
+
+
+async def _stream_coalesced(websocket, text, args):
+    writer = CoalescingFrameWriter(
+        websocket,
+        flush_interval_ms=args.flush_interval_ms,
+        max_bytes=args.flush_max_bytes,
+        send_timeout=10
+    )
+    async for content in _produce(text, args.mode, args.token_size, args.delay_ms / 1000):
+        await writer.write(content, "c")
+    await writer.close()
+
+
+async def _run(name, handler, args):
+    text = "流式输出测试内容" * (args.chars // 8)
+    sockets = [SerializingWebSocket() for _ in range(args.streams)]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(ws, text, args) for ws in sockets))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    frames = sum(ws.frames for ws in sockets)
+    return {
+        "name": name,
+        "frames_per_stream": frames / args.streams,
+        "frames_per_sec": frames / elapsed,
+        "cpu_ms_per_stream": cpu * 1000 / args.streams,
+        "wall_s": elapsed,
+    }
+
+
+async def main(args):
+    rows = [
+        await _run("send per chunk", _stream_direct, args),
+        await _run("coalesced writer", _stream_coalesced, args),
+    ]
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--mode", choices=["char", "token"], default="char")
+    parser.add_argument("--token-size", type=int, default=3)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="相邻内容块的产出间隔")
+    parser.add_argument("--flush-interval-ms", type=float, default=25.0)
+    parser.add_argument("--flush-max-bytes", type=int, default=1024)
+    asyncio.run(main(parser.parse_args()))
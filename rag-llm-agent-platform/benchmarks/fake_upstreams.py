@@ -0,0 +1,236 @@
+"""
+本地假上游服务（兼容 OpenAI 协议），供基准测试使用
+
+延迟模型：单次请求延迟 = 基础延迟 + 每条输入的增量延迟；max_concurrency
+模拟上游的并发/速率限制，超出的请求在服务端排队。
+Chat 接口：首字延迟 chat_latency_ms，之后每 chat_token_interval_ms 输出一个 token，
+并发上限 chat_max_concurrency（占用期间包括整个生成过程）。
+chat_tool_calls > 0 时，请求带 tools 且消息中还没有工具结果时改为返回 chat_tool_calls 个
+工具调用（依次使用 tools 中的工具），每个调用的参数分 chat_tool_arg_chunks 段输出。
+error_rate > 0 时按该比例直接返回 error_status（error_retry_after 非空时带 Retry-After 头）；
+connections 记录出现过的客户端 (地址, 端口)，即服务端接受的连接数。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Set, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeUpstreamConfig:
+    """假上游配置"""
+    embedding_latency_ms: float = 30.0
+    embedding_per_item_ms: float = 0.2
+    embedding_dimension: int = 1536
+    max_concurrency: int = 8
+    chat_latency_ms: float = 200.0
+    chat_tokens: int = 20
+    chat_token_interval_ms: float = 5.0
+    chat_max_concurrency: int = 16
+    chat_tool_calls: int = 0
+    chat_tool_arg_chunks: int = 10
+    error_rate: float = 0.0
+    error_status: int = 503
+    error_retry_after: str = ""
+    connections: Set[Tuple[str, int]] = field(default_factory=set)
+    stats: Dict[str, int] = field(
+        default_factory=lambda: {"embedding_requests": 0, "embedding_inputs": 0, "chat_requests": 0}
+    )
+
+
+def _fake_embedding(text: str, dimension: int):
+    """根据文本生成确定性的伪向量"""
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(seed[i % len(seed)] - 128) / 128 for i in range(dimension)]
+
+
+def _sse_chunk(model: str, delta: Dict, finish_reason) -> str:
+    chunk = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
+def _wants_tool_calls(body: Dict, config: FakeUpstreamConfig) -> bool:
+    """带 tools 且还没有工具结果（tool 消息或提示词中的工具执行结果）时返回工具调用"""
+    if not config.chat_tool_calls or not body.get("tools"):
+        return False
+    return not any(
+        message["role"] == "tool" or "工具执行结果" in (message.get("content") or "")
+        for message in body["messages"]
+    )
+
+
+def _fake_tool_calls(body: Dict, config: FakeUpstreamConfig):
+    """(id, 工具名, 参数分段) 列表"""
+    names = [tool["function"]["name"] for tool in body["tools"]]
+    calls = []
+    for i in range(config.chat_tool_calls):
+        arguments = json.dumps({"query": f"参数{i}" * config.chat_tool_arg_chunks}, ensure_ascii=False)
+        size = -(-len(arguments) // config.chat_tool_arg_chunks)
+        calls.append((f"call_{i}", names[i % len(names)], [arguments[j:j + size] for j in range(0, len(arguments), size)]))
+    return calls
+
+
+def create_app(config: FakeUpstreamConfig) -> FastAPI:
+    """创建假上游应用"""
+    app = FastAPI()
+    limiter = asyncio.Semaphore(config.max_concurrency)
+    chat_limiter = asyncio.Semaphore(config.chat_max_concurrency)
+    rng = random.Random(0)
+    
+    @app.middleware("http")
+    async def inject_errors(request: Request, call_next):
+        config.connections.add((request.client.host, request.client.port))
+        if config.error_rate and rng.random() < config.error_rate:
+            headers = {"Retry-After": config.error_retry_after} if config.error_retry_after else None
+            return JSONResponse({"error": {"message": "假上游注入的错误"}}, status_code=config.error_status, headers=headers)
+        return await call_next(request)
+    
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        config.stats["embedding_requests"] += 1
+        config.stats["embedding_inputs"] += len(inputs)
+        
+        async with limiter:
+            await asyncio.sleep(
+                (config.embedding_latency_ms + config.embedding_per_item_ms * len(inputs)) / 1000
+            )
+        
+        return {
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _fake_embedding(text, config.embedding_dimension)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        }
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        config.stats["chat_requests"] += 1
+        tokens = [f"词{i}" for i in range(config.chat_tokens)]
+        tool_calls = _fake_tool_calls(body, config) if _wants_tool_calls(body, config) else []
+        
+        if tool_calls and not body.get("stream"):
+            async with chat_limiter:
+                pieces = sum(len(chunks) for _, _, chunks in tool_calls)
+                await asyncio.sleep((config.chat_latency_ms + config.chat_token_interval_ms * pieces) / 1000)
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": call_id, "type": "function", "function": {"name": name, "arguments": "".join(chunks)}}
+                    for call_id, name, chunks in tool_calls
+                ]
+            }
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": pieces, "total_tokens": pieces + 1}
+            }
+        
+        if not body.get("stream"):
+            async with chat_limiter:
+                await asyncio.sleep(
+                    (config.chat_latency_ms + config.chat_token_interval_ms * len(tokens)) / 1000
+                )
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": len(tokens), "total_tokens": len(tokens) + 1}
+            }
+        
+        async def events():
+            async with chat_limiter:
+                await asyncio.sleep(config.chat_latency_ms / 1000)
+                if tool_calls:
+                    for index, (call_id, name, chunks) in enumerate(tool_calls):
+                        yield _sse_chunk(model, {"tool_calls": [{
+                            "index": index, "id": call_id, "type": "function",
+                            "function": {"name": name, "arguments": ""}
+                        }]}, None)
+                        for piece in chunks:
+                            await asyncio.sleep(config.chat_token_interval_ms / 1000)
+                            yield _sse_chunk(model, {"tool_calls": [{
+                                "index": index, "function": {"arguments": piece}
+                            }]}, None)
+                else:
+                    for i, token in enumerate(tokens):
+                        if i:
+                            await asyncio.sleep(config.chat_token_interval_ms / 1000)
+                        yield _sse_chunk(model, {"content": token}, None)
+            yield _sse_chunk(model, {}, "tool_calls" if tool_calls else "stop")
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    @app.get("/stats")
+    async def stats():
+        return config.stats
+    
+    return app
+
+
+class FakeUpstreamServer:
+    """在后台线程运行的假上游服务"""
+    
+    def __init__(self, config: FakeUpstreamConfig = None):
+        self.config = config or FakeUpstreamConfig()
+        self.port = _free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            create_app(self.config),
+            host="127.0.0.1",
+            port=self.port,
+            log_level="warning",
+            timeout_keep_alive=75  # 与常见网关一致；uvicorn 默认 5 秒会先于客户端断开空闲连接
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+    
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+    
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
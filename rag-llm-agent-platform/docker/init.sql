@@ -7,10 +7,14 @@ CREATE TABLE IF NOT EXISTS documents (
     content TEXT NOT NULL,
     embedding vector(1536),
     metadata JSONB,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- 全文检索列（混合检索；'simple' 分词不做词干化，SKU / 订单号按原样匹配）
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
 );
 
 -- 创建向量索引（用于快速相似度搜索）
+-- 初始为空表时的默认值；导入数据后按数据量重建（支持 HNSW）：
+--   python -m app.rag.index_manager reindex --method hnsw
 CREATE INDEX IF NOT EXISTS documents_embedding_idx 
 ON documents 
 USING ivfflat (embedding vector_cosine_ops)
@@ -20,3 +24,74 @@ WITH (lists = 100);
 CREATE INDEX IF NOT EXISTS documents_metadata_idx 
 ON documents USING GIN (metadata);
 
+-- 创建全文索引（已有数据库执行 python -m app.rag.index_manager text-index）
+CREATE INDEX IF NOT EXISTS documents_content_tsv_idx 
+ON documents USING GIN (content_tsv);
+
+-- 创建时间索引（按 created_at 范围过滤检索）
+CREATE INDEX IF NOT EXISTS documents_created_at_idx 
+ON documents (created_at);
+
+-- 变更通知（内存向量索引增量同步、多进程语义回答缓存失效，见 app/rag/document_changes.py）
+-- 语句级触发器：每条 INSERT / COPY / UPDATE / DELETE / TRUNCATE 发一次通知
+--   插入 "最小ID,最大ID"；更新 / 删除 "update:ID,..." / "delete:ID,..."（超过 500 行时为 "*"）；清空 "truncate:*"
+-- 已有数据库执行 python -m app.rag.index_manager notify-trigger
+CREATE OR REPLACE FUNCTION notify_documents_inserted() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM inserted) THEN
+        PERFORM pg_notify('documents_inserted', (SELECT min(id) || ',' || max(id) FROM inserted));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_documents_changed() RETURNS trigger AS $$
+DECLARE
+    ids TEXT;
+BEGIN
+    SELECT CASE WHEN count(*) > 500 THEN '*' ELSE string_agg(id::text, ',') END
+    INTO ids FROM changed;
+    IF ids IS NOT NULL THEN
+        PERFORM pg_notify('documents_inserted', lower(TG_OP) || ':' || ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_documents_truncated() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('documents_inserted', 'truncate:*');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER documents_inserted_notify
+AFTER INSERT ON documents
+REFERENCING NEW TABLE AS inserted
+FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_inserted();
+
+CREATE OR REPLACE TRIGGER documents_updated_notify
+AFTER UPDATE ON documents
+REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_changed();
+
+CREATE OR REPLACE TRIGGER documents_deleted_notify
+AFTER DELETE ON documents
+REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_changed();
+
+CREATE OR REPLACE TRIGGER documents_truncated_notify
+AFTER TRUNCATE ON documents
+FOR EACH STATEMENT EXECUTE FUNCTION notify_documents_truncated();
+
+-- 会话历史（CONVERSATION_PERSIST=true 时使用）
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id BIGSERIAL PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS conversation_messages_conversation_idx 
+ON conversation_messages (conversation_id, id);
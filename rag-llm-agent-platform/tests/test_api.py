@@ -0,0 +1,279 @@
+"""
+API 路由与应用生命周期测试
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.fixture
+def mock_agent():
+    """模拟共享 Agent"""
+    agent = MagicMock()
+    agent.startup = AsyncMock()
+    agent.close = AsyncMock()
+    agent.chat = AsyncMock(return_value={
+        "response": "这是测试响应",
+        "conversation_id": "conv-1",
+        "sources": ["doc1"]
+    })
+    return agent
+
+
+def test_lifespan_shares_single_agent(mock_agent):
+    """测试多次请求复用同一个 Agent，且启动预热、关闭释放"""
+    with patch("app.main.RAGAgent", return_value=mock_agent) as agent_cls:
+        with TestClient(app) as client:
+            for _ in range(3):
+                response = client.post("/api/v1/chat", json={"message": "你好"})
+                assert response.status_code == 200
+                assert response.json()["response"] == "这是测试响应"
+            
+            assert agent_cls.call_count == 1
+            mock_agent.startup.assert_awaited_once()
+            assert mock_agent.chat.await_count == 3
+        
+        mock_agent.close.assert_awaited_once()
+
+
+def test_lifespan_tolerates_startup_failure(mock_agent):
+    """测试数据库不可用时应用仍能启动"""
+    mock_agent.startup = AsyncMock(side_effect=OSError("connection refused"))
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.post("/api/v1/chat", json={"message": "你好"})
+            assert response.status_code == 200
+
+
+def test_bulk_ingest_streams_ndjson(mock_agent):
+    """测试 NDJSON 批量导入：缺失 embedding 的文档按批补齐"""
+    received = []
+    
+    async def insert_many(documents, batch_size=None, start_batch=0, prepare_batch=None):
+        batch = [doc async for doc in documents]
+        received.extend(await prepare_batch(batch))
+        return {"rows": len(batch), "batches": 1, "next_batch": 1}
+    
+    mock_agent.vector_store.insert_many = insert_many
+    mock_agent.retriever.embed_texts = AsyncMock(return_value=[[0.5, 0.5]])
+    body = '{"content": "文档A", "embedding": [0.1, 0.2]}\n{"content": "文档B"}\n'
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.post("/api/v1/documents:bulk", content=body.encode())
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert [doc["embedding"] for doc in received] == [[0.1, 0.2], [0.5, 0.5]]
+    mock_agent.retriever.embed_texts.assert_awaited_once_with(["文档B"])
+
+
+def test_bulk_ingest_reports_resume_point(mock_agent):
+    """测试写入失败时返回续传批次"""
+    from app.rag.vector_store import BulkInsertError
+    
+    stats = {"rows": 1000, "batches": 2, "next_batch": 2, "elapsed_seconds": 1.0, "rows_per_sec": 1000.0}
+    error = BulkInsertError("copy failed", stats, cause=RuntimeError("copy failed"))
+    mock_agent.vector_store.insert_many = AsyncMock(side_effect=error)
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.post("/api/v1/documents:bulk?batch_size=500", content=b'{"content": "x"}\n')
+    
+    assert response.status_code == 500
+    assert response.json()["resume_from_batch"] == 2
+    assert response.json()["error_type"] == "RuntimeError"
+
+
+def test_bulk_ingest_rejects_malformed_line(mock_agent):
+    """测试 NDJSON 某行格式错误时返回 400，指明行号与批次，之前的批次已提交"""
+    from app.rag.vector_store import VectorStore
+    
+    store = VectorStore()
+    store.connect = AsyncMock()
+    store._copy_batch = AsyncMock()
+    mock_agent.vector_store = store
+    doc = '{"content": "a", "embedding": [0.1]}\n'
+    # 空行计入行号、不计入批次：格式错误的是第 6 行、第 4 个文档（批次 1）
+    body = doc + "\n" + doc + "  \n" + doc + '{"content": \n' + '{"content": "b", "embedding": [0.1]}\n'
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.post("/api/v1/documents:bulk?batch_size=2", content=body.encode())
+            missing = client.post("/api/v1/documents:bulk?batch_size=2", content=b'{"metadata": {}}\n')
+    
+    assert response.status_code == 400
+    data = response.json()
+    assert data["line"] == 6 and data["batch"] == 1
+    assert data["error_type"] == "JSONDecodeError"
+    assert data["resume_from_batch"] == 1
+    store._copy_batch.assert_awaited_once()
+    assert missing.status_code == 400
+    assert missing.json()["error_type"] == "ValueError"
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_counts_physical_lines_across_chunks():
+    """测试 NDJSON 流式解析：行跨数据块拼接，行号按物理行（含空行）计数"""
+    from app.api.ndjson import iter_ndjson
+    
+    chunks = [b'{"a": 1}\n\n{"a"', b': 2', b'}\n', b'\n{"a": 3}']
+    request = MagicMock()
+    
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+    
+    request.stream = stream
+    parsed = [item async for item in iter_ndjson(request, lambda line, line_no: (line_no, line))]
+    
+    assert parsed == [(1, b'{"a": 1}'), (3, b'{"a": 2}'), (5, b'{"a": 3}')]
+
+
+def test_websocket_chat_coalesces_frames(mock_agent):
+    """测试 WebSocket 流式输出经合并写入器发送，完成帧带会话ID"""
+    async def chat_stream(message, conversation_id=None, **kwargs):
+        for char in "你好世界":
+            yield {"content": char, "conversation_id": "conv-9", "done": False}
+        yield {"content": "", "conversation_id": "conv-9", "done": True, "context_tokens": 42}
+    
+    mock_agent.chat_stream = chat_stream
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            with client.websocket_connect("/api/v1/ws/chat") as websocket:
+                websocket.send_text('{"message": "你好"}')
+                frames = []
+                while True:
+                    frame = websocket.receive_json()
+                    frames.append(frame)
+                    if frame["type"] == "done":
+                        break
+    
+    chunks = [frame for frame in frames if frame["type"] == "chunk"]
+    assert "".join(frame["content"] for frame in chunks) == "你好世界"
+    assert len(chunks) < 4
+    assert frames[-1] == {"type": "done", "conversation_id": "conv-9", "context_tokens": 42}
+
+
+def test_chat_returns_503_when_overloaded(mock_agent):
+    """测试超出并发容量时 /chat 快速返回 503 并带 Retry-After"""
+    from app.core.concurrency import OverloadedError
+    
+    mock_agent.chat = AsyncMock(side_effect=OverloadedError("chat 并发已满", retry_after=1.5))
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.post("/api/v1/chat", json={"message": "你好"})
+    
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+
+
+def test_websocket_overload_rejects_message_keeps_connection(mock_agent):
+    """测试 WebSocket 单条消息过载时返回错误帧，连接继续可用"""
+    from app.core.concurrency import OverloadedError
+    
+    calls = []
+    
+    async def chat_stream(message, conversation_id=None, **kwargs):
+        calls.append(message)
+        if len(calls) == 1:
+            raise OverloadedError("chat_stream 排队超时", retry_after=1.0)
+        yield {"content": "好", "conversation_id": "conv-9", "done": False}
+        yield {"content": "", "conversation_id": "conv-9", "done": True, "context_tokens": 1}
+    
+    mock_agent.chat_stream = chat_stream
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            with client.websocket_connect("/api/v1/ws/chat") as websocket:
+                websocket.send_text('{"message": "第一条"}')
+                error = websocket.receive_json()
+                websocket.send_text('{"message": "第二条"}')
+                frames = [websocket.receive_json()]
+                while frames[-1]["type"] != "done":
+                    frames.append(websocket.receive_json())
+    
+    assert error["type"] == "error"
+    assert error["code"] == 503
+    assert frames[-1]["conversation_id"] == "conv-9"
+
+
+def test_batch_chat_job_lifecycle(mock_agent):
+    """测试批量对话：JSONL 上传、状态轮询、结果以 JSONL 输出"""
+    import json
+    from app.agents.batch_chat import BatchChatRunner
+    from app.rag.context_builder import ContextBuilder
+    
+    mock_agent.retriever.embed_texts = AsyncMock(side_effect=lambda texts: [[0.1] for _ in texts])
+    mock_agent.vector_store.search_many = AsyncMock(side_effect=lambda embeddings, top_k: [
+        [{"content": "文档", "source": "doc1"}] for _ in embeddings
+    ])
+    mock_agent.reranker = None
+    mock_agent.context_builder = ContextBuilder()
+    mock_agent._generate = AsyncMock(return_value=({"content": "回答"}, False))
+    mock_agent.batch_runner = BatchChatRunner(mock_agent, batch_size=2)
+    body = '{"id": "q1", "message": "问题1"}\n{"message": "问题2"}\n{"message": "问题3"}\n'
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            submitted = client.post("/api/v1/chat:batch", content=body.encode())
+            job_id = submitted.json()["job_id"]
+            results = client.get(f"/api/v1/chat:batch/{job_id}/results")
+            status = client.get(f"/api/v1/chat:batch/{job_id}")
+            missing = client.get("/api/v1/chat:batch/unknown")
+            invalid = client.post("/api/v1/chat:batch", content=b'{"id": 1}\n')
+    
+    assert submitted.status_code == 202
+    assert results.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in results.text.splitlines()]
+    assert sorted(str(line["id"]) for line in lines) == ["1", "2", "q1"]
+    assert all(line["response"] == "回答" for line in lines)
+    assert status.json()["status"] == "completed"
+    assert status.json()["embedding_requests"] == 2
+    assert missing.status_code == 404
+    assert invalid.status_code == 400
+
+
+def test_metrics_endpoint_exposes_hot_path_metrics(mock_agent):
+    """测试 /metrics 输出 Prometheus 文本格式，连接池指标从共享 Agent 读取"""
+    pool = MagicMock()
+    pool.get_size = MagicMock(return_value=5)
+    pool.get_idle_size = MagicMock(return_value=2)
+    mock_agent.vector_store.connection_pool = pool
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            response = client.get("/metrics")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "rag_db_pool_in_use 3.0" in body
+    for name in ("rag_embedding_seconds", "rag_vector_search_seconds", "rag_llm_ttft_seconds",
+                 "rag_tool_seconds", "rag_ws_active_connections", "rag_ws_frames_sent_total"):
+        assert name in body
+    # 热路径的标签子指标在导入时预先绑定，未观测前也已导出
+    assert 'rag_llm_seconds_count{mode="stream",provider="bedrock"}' in body
+    assert 'rag_rerank_seconds_count{outcome="skipped"}' in body
+
+
+def test_ready_reflects_agent_checks(mock_agent):
+    """测试 /ready 按依赖检查结果返回 200 / 503"""
+    mock_agent.readiness = AsyncMock(side_effect=[
+        {"ready": False, "checks": {"database": "error: connection refused", "embedding": "ok", "llm": "ok"}},
+        {"ready": True, "checks": {"database": "ok", "embedding": "ok", "llm": "ok"}}
+    ])
+    
+    with patch("app.main.RAGAgent", return_value=mock_agent):
+        with TestClient(app) as client:
+            not_ready = client.get("/api/v1/ready")
+            ready = client.get("/api/v1/ready")
+    
+    assert not_ready.status_code == 503
+    assert not_ready.json()["checks"]["database"].startswith("error")
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready"
@@ -0,0 +1,122 @@
+"""
+批量对话任务测试
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.agents.batch_chat import BatchChatRunner
+from app.rag.context_builder import ContextBuilder
+
+
+def make_agent(llm_delay: float = 0.0):
+    """模拟 Agent：向量化 / 批量检索 / LLM 生成"""
+    agent = MagicMock()
+    agent.retriever.embed_texts = AsyncMock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+    agent.vector_store.search_many = AsyncMock(side_effect=lambda embeddings, top_k: [
+        [{"content": f"文档{i}", "source": f"doc{i}"}] for i in range(len(embeddings))
+    ])
+    agent.reranker = None
+    agent.context_builder = ContextBuilder(max_tokens=200)
+    agent.in_flight = agent.max_in_flight = agent.generated = 0
+    
+    async def generate(message, context):
+        agent.in_flight += 1
+        agent.max_in_flight = max(agent.max_in_flight, agent.in_flight)
+        await asyncio.sleep(llm_delay)
+        agent.in_flight -= 1
+        agent.generated += 1
+        return {"content": f"回答:{message}"}, False
+    
+    agent._generate = generate
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_batch_job_groups_embeddings_and_searches():
+    """测试按组批量向量化与检索，每个问题一条结果"""
+    agent = make_agent()
+    runner = BatchChatRunner(agent, batch_size=4, llm_concurrency=2)
+    questions = [{"id": i, "message": f"问题{i}"} for i in range(10)]
+    
+    job = runner.submit(questions)
+    results = [result async for result in job.iter_results()]
+    
+    assert job.status == "completed"
+    assert sorted(result["id"] for result in results) == list(range(10))
+    assert all(result["response"] == f"回答:问题{result['id']}" for result in results)
+    assert agent.retriever.embed_texts.await_count == 3
+    assert agent.vector_store.search_many.await_count == 3
+    report = job.report()
+    assert (report["completed"], report["embedding_requests"], report["search_queries"], report["llm_calls"]) == (10, 3, 3, 10)
+
+
+@pytest.mark.asyncio
+async def test_batch_job_bounds_llm_concurrency():
+    """测试 LLM 调用并发数不超过 llm_concurrency（跨组流水线时也成立）"""
+    agent = make_agent(llm_delay=0.01)
+    runner = BatchChatRunner(agent, batch_size=4, llm_concurrency=3)
+    
+    job = runner.submit([{"id": i, "message": f"问题{i}"} for i in range(20)])
+    await job._task
+    
+    assert job.report()["completed"] == 20
+    assert agent.max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_job_records_failed_group():
+    """测试一组检索失败时该组问题记为失败，其余组继续执行"""
+    agent = make_agent()
+    agent.retriever.embed_texts = AsyncMock(side_effect=[RuntimeError("upstream 500"), [[1.0], [1.0]]])
+    runner = BatchChatRunner(agent, batch_size=2)
+    
+    job = runner.submit([{"id": i, "message": f"问题{i}"} for i in range(4)])
+    await job._task
+    
+    report = job.report()
+    assert report["status"] == "completed"
+    assert (report["completed"], report["failed"]) == (4, 2)
+    assert {result["id"] for result in job.results if result.get("error")} == {0, 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_job_cancels_queued_groups():
+    """测试任务失败时在途的组被取消并等待结束，不再调用 LLM、不向已结束的任务写入结果"""
+    agent = make_agent(llm_delay=0.05)
+    
+    async def rerank(message, docs, top_n):
+        if message == "问题0":
+            raise RuntimeError("rerank failed")
+        return docs
+    
+    agent.reranker = MagicMock()
+    agent.reranker.candidates = 5
+    agent.reranker.rerank = rerank
+    runner = BatchChatRunner(agent, batch_size=2)
+    
+    job = runner.submit([{"id": i, "message": f"问题{i}"} for i in range(6)])
+    await job._task
+    assert job.status == "failed"
+    results, generated = len(job.results), agent.generated
+    
+    await asyncio.sleep(0.1)
+    assert (len(job.results), agent.generated) == (results, generated)
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_evicted_beyond_max_jobs():
+    """测试超出保留数量时淘汰最早结束的任务"""
+    runner = BatchChatRunner(make_agent(), max_jobs=2)
+    
+    jobs = []
+    for _ in range(3):
+        job = runner.submit([{"id": 0, "message": "问题"}])
+        await job._task
+        jobs.append(job)
+    runner.submit([{"id": 0, "message": "问题"}])
+    
+    assert runner.get(jobs[0].id) is None
+    assert runner.get(jobs[2].id) is jobs[2]
+    await runner.close()
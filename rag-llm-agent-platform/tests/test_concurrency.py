@@ -0,0 +1,126 @@
+"""
+自适应并发限制测试
+"""
+import asyncio
+
+import pytest
+
+from app.core.concurrency import AdaptiveLimiter, OverloadedError
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+
+async def _hold(limiter: AdaptiveLimiter, release: asyncio.Event):
+    async with limiter.slot():
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_when_latency_below_target():
+    """测试延迟低于目标且容量被用满时上限加性增长"""
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=2, max_limit=3, clock=FakeClock())
+    
+    for _ in range(10):
+        async with limiter.slot():
+            pass
+    
+    assert 2.0 < limiter.limit <= 3
+
+
+@pytest.mark.asyncio
+async def test_limit_backs_off_once_per_cooldown():
+    """测试延迟超过目标时乘性减小，同一冷却期内只减一次"""
+    clock = FakeClock()
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=10, min_limit=2, backoff=0.5, clock=clock)
+    
+    for _ in range(3):
+        async with limiter.slot():
+            clock.now += 2.0
+    # 每次都跨过冷却期：10 -> 5 -> 2.5 -> 2（下界）
+    assert limiter.limit == 2
+    
+    # 同一波拥塞中同时完成的多个请求只触发一次减小
+    limiter.limit = 10.0
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(_hold(limiter, release)) for _ in range(3)]
+    await asyncio.sleep(0)
+    clock.now += 2.0
+    release.set()
+    await asyncio.gather(*tasks)
+    assert limiter.limit == 5.0
+
+
+@pytest.mark.asyncio
+async def test_upstream_timeout_counts_as_congestion():
+    """测试上游超时视为拥塞"""
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=10, backoff=0.5, clock=FakeClock())
+    
+    with pytest.raises(asyncio.TimeoutError):
+        async with limiter.slot():
+            raise asyncio.TimeoutError()
+    
+    assert limiter.limit == 5.0
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full():
+    """测试达到上限且排队已满时立即拒绝"""
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=1, min_limit=1, queue_size=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+    
+    with pytest.raises(OverloadedError):
+        async with limiter.slot():
+            pass
+    
+    release.set()
+    await asyncio.gather(holder, waiter)
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["queued"], stats["rejected"]) == (0, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_queued_request_times_out():
+    """测试排队超过 queue_timeout 时拒绝，并从队列中移除"""
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=1, min_limit=1, queue_timeout=0.01)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+    
+    with pytest.raises(OverloadedError) as exc_info:
+        async with limiter.slot():
+            pass
+    
+    assert exc_info.value.retry_after >= 1.0
+    assert limiter.stats()["queued"] == 0
+    release.set()
+    await holder
+
+
+@pytest.mark.asyncio
+async def test_release_hands_permit_to_waiter():
+    """测试释放许可时按顺序唤醒排队请求"""
+    limiter = AdaptiveLimiter("test", latency_target=1.0, initial_limit=1, min_limit=1)
+    order = []
+    
+    async def run(name):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(0)
+    
+    await asyncio.gather(*(run(i) for i in range(5)))
+    
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.in_flight == 0
@@ -0,0 +1,50 @@
+"""
+上下文组装单元测试
+"""
+from app.llm.tokens import count_tokens, truncate_to_tokens
+from app.rag.context_builder import ContextBuilder
+
+
+def test_keeps_legacy_layout_for_short_documents():
+    """测试短文档的上下文格式与来源行"""
+    built = ContextBuilder().build([
+        {"content": "退货需在 7 天内申请", "source": "faq.md"},
+        {"content": "运费由买家承担"}
+    ])
+    
+    assert built.text == "相关文档内容：\n\n[1] 退货需在 7 天内申请\n来源: faq.md\n\n[2] 运费由买家承担"
+    assert built.tokens == count_tokens(built.text)
+    assert len(built.documents) == 2
+
+
+def test_truncates_long_documents_and_respects_budget():
+    """测试单篇截断与总预算"""
+    docs = [{"content": "长" * 1000, "source": f"doc{i}"} for i in range(5)]
+    docs = [{**doc, "content": f"{i}" + doc["content"]} for i, doc in enumerate(docs)]
+    
+    built = ContextBuilder(max_tokens=600, per_doc_tokens=200, dedup_threshold=1.1).build(docs)
+    
+    assert built.tokens <= 600
+    assert built.truncated == len(built.documents) == 3
+    assert all(count_tokens(part) <= 210 for part in built.text.split("\n\n")[1:])
+
+
+def test_skips_overlapping_chunks():
+    """测试跳过重复和高度重叠的分块"""
+    base = "订单发货后可在订单详情页查看物流信息，如超过三天未更新请联系客服处理。"
+    built = ContextBuilder(dedup_threshold=0.6).build([
+        {"content": base, "source": "a"},
+        {"content": base[:20], "source": "b"},
+        {"content": base + "谢谢", "source": "c"},
+        {"content": "退款将在 3-5 个工作日内原路返回", "source": "d"}
+    ])
+    
+    assert [doc["source"] for doc in built.documents] == ["a", "d"]
+    assert built.duplicates == 2
+
+
+def test_truncate_to_tokens_estimate():
+    """测试估算模式下的截断"""
+    assert truncate_to_tokens("退货流程说明", 3) == "退货流"
+    assert truncate_to_tokens("abcdefgh", 1) == "abcd"
+    assert truncate_to_tokens("短", 10) == "短"
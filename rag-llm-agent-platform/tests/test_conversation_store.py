@@ -0,0 +1,113 @@
+"""
+会话历史存储单元测试
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.agents.conversation_store import ConversationStore
+from app.agents.rag_agent import RAGAgent
+from app.llm.tokens import estimate_tokens, window_by_tokens
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_token_estimate_and_window():
+    """测试 token 估算与按预算截取"""
+    assert estimate_tokens("退货流程") == 4
+    assert estimate_tokens("order 12345") == 3
+    assert window_by_tokens([50, 30, 20], budget=55) == 2
+    assert window_by_tokens([100], budget=10) == 0
+
+
+@pytest.mark.asyncio
+async def test_buffer_bounded_by_turns_and_chars():
+    """测试单个会话的消息条数与字符数有上限"""
+    store = ConversationStore(max_turns=4, max_chars=30)
+    for i in range(5):
+        await store.append("c1", f"问题{i}", f"回答{i}")
+    
+    history = await store.get_history("c1")
+    assert [turn["content"] for turn in history] == ["问题3", "回答3", "问题4", "回答4"]
+    
+    await store.append("c1", "长" * 50, "好")
+    history = await store.get_history("c1")
+    assert sum(len(turn["content"]) for turn in history) <= 30
+    assert history[-1]["content"] == "好"
+
+
+@pytest.mark.asyncio
+async def test_lru_and_idle_expiry():
+    """测试会话间 LRU 淘汰与空闲过期"""
+    clock = FakeClock()
+    store = ConversationStore(max_conversations=2, ttl=60, clock=clock)
+    await store.append("a", "q", "r")
+    await store.append("b", "q", "r")
+    await store.get_history("a")
+    await store.append("c", "q", "r")
+    
+    assert await store.get_history("b") == []
+    assert len(await store.get_history("a")) == 2
+    
+    clock.now = 120
+    assert await store.get_history("a") == []
+    assert store.stats()["evictions"] == 3
+
+
+@pytest.mark.asyncio
+async def test_loads_history_from_postgres_on_miss():
+    """测试内存未命中时从持久化表加载并写回"""
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        {"role": "user", "content": "订单到哪了"},
+        {"role": "assistant", "content": "已发货"}
+    ])
+    conn.executemany = AsyncMock()
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    vector_store = MagicMock()
+    vector_store.connect = AsyncMock()
+    vector_store.connection_pool.acquire = MagicMock(return_value=acquire)
+    store = ConversationStore(vector_store=vector_store)
+    
+    history = await store.get_history("c1")
+    await store.append("c1", "什么时候到", "明天")
+    
+    assert [turn["role"] for turn in history] == ["user", "assistant"]
+    assert conn.fetch.call_count == 1
+    assert len(await store.get_history("c1")) == 4
+    conn.executemany.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_agent_passes_history_to_llm():
+    """测试同一会话的后续请求带上历史"""
+    retriever = MagicMock()
+    retriever.retrieve = AsyncMock(return_value=[])
+    tool_manager = MagicMock()
+    tool_manager.get_available_tools = MagicMock(return_value=[])
+    llm_client = MagicMock()
+    llm_client.chat = AsyncMock(side_effect=[
+        {"content": "您好", "tool_calls": None},
+        {"content": "已发货", "tool_calls": None}
+    ])
+    
+    with patch('app.agents.rag_agent.VectorStore', return_value=MagicMock()), \
+         patch('app.agents.rag_agent.Retriever', return_value=retriever), \
+         patch('app.agents.rag_agent.ToolManager', return_value=tool_manager), \
+         patch('app.agents.rag_agent.LLMClient', return_value=llm_client):
+        agent = RAGAgent()
+        first = await agent.chat("你好")
+        await agent.chat("我的订单呢", conversation_id=first["conversation_id"])
+    
+    assert llm_client.chat.call_args_list[0].kwargs["history"] == []
+    history = llm_client.chat.call_args_list[1].kwargs["history"]
+    assert [turn["content"] for turn in history] == ["你好", "您好"]
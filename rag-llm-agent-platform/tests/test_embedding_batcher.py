@@ -0,0 +1,72 @@
+"""
+Embedding 微批处理单元测试
+"""
+import asyncio
+import pytest
+
+from app.rag.embedding_batcher import EmbeddingBatcher
+
+
+class FakeEmbedder:
+    """记录每次批量调用的假 Embedding 接口"""
+    
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+    
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("upstream error")
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_batch():
+    """测试时间窗口内的并发请求合并为一次调用，并按请求分发结果"""
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=64, max_wait_ms=5)
+    
+    results = await asyncio.gather(*(batcher.embed("x" * n) for n in (1, 2, 3)))
+    
+    assert results == [[1.0], [2.0], [3.0]]
+    assert embedder.calls == [["x", "xx", "xxx"]]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting():
+    """测试攒满 N 条立即发送，不等待时间窗口"""
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=2, max_wait_ms=10_000)
+    
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.embed("a"), batcher.embed("bb")),
+        timeout=1
+    )
+    
+    assert results == [[1.0], [2.0]]
+    assert len(embedder.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_texts_requested_once():
+    """测试同批重复文本只请求一次"""
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_wait_ms=1)
+    
+    results = await asyncio.gather(batcher.embed("faq"), batcher.embed("faq"))
+    
+    assert results == [[3.0], [3.0]]
+    assert embedder.calls == [["faq"]]
+    assert batcher.stats()["requests"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_error_propagates_to_all_waiters():
+    """测试批量调用失败时所有等待方收到异常"""
+    batcher = EmbeddingBatcher(FakeEmbedder(fail=True), max_wait_ms=1)
+    
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+    
+    assert all(isinstance(result, RuntimeError) for result in results)
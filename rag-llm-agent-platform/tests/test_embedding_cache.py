@@ -0,0 +1,135 @@
+"""
+Embedding 缓存单元测试
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.rag.embedding_cache import EmbeddingCache, normalize_text
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_text():
+    """测试文本归一化"""
+    assert normalize_text("  How  to\tReturn ") == "how to return"
+    assert normalize_text("ＡＢＣ") == "abc"
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_and_miss_counters():
+    """测试命中与未命中计数"""
+    cache = EmbeddingCache(max_size=10)
+    
+    assert await cache.get("m", "退货流程") is None
+    await cache.set("m", "退货流程", [0.5, 0.25])
+    assert await cache.get("m", " 退货流程 ") == [0.5, 0.25]
+    assert await cache.get("other-model", "退货流程") is None
+    
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_lru_eviction():
+    """测试超出容量时淘汰最久未使用的条目"""
+    cache = EmbeddingCache(max_size=2)
+    await cache.set("m", "a", [1.0])
+    await cache.set("m", "b", [2.0])
+    await cache.get("m", "a")
+    await cache.set("m", "c", [3.0])
+    
+    assert await cache.get("m", "b") is None
+    assert await cache.get("m", "a") == [1.0]
+    assert await cache.get("m", "c") == [3.0]
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl_expiry():
+    """测试 TTL 过期"""
+    clock = FakeClock()
+    cache = EmbeddingCache(max_size=10, ttl=60, clock=clock)
+    await cache.set("m", "a", [1.0])
+    
+    clock.now = 59
+    assert await cache.get("m", "a") == [1.0]
+    clock.now = 61
+    assert await cache.get("m", "a") is None
+
+
+@pytest.mark.asyncio
+async def test_cache_persistent_tier(tmp_path):
+    """测试 SQLite 持久层跨实例命中"""
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(sqlite_path=path)
+    await cache.set("m", "常见问题", [0.5, -0.5])
+    cache.close()
+    
+    reopened = EmbeddingCache(sqlite_path=path)
+    assert await reopened.get("m", "常见问题") == [0.5, -0.5]
+    assert reopened.stats()["persistent_hits"] == 1
+    reopened.close()
+
+
+def test_persistent_tier_ttl_and_pruning(tmp_path):
+    """测试 SQLite 持久层按写入时间过期，并定期清理过期行、裁剪到最大行数"""
+    from array import array
+    from app.rag.embedding_cache import SQLiteEmbeddingStore
+    
+    class Clock:
+        now = 1000.0
+        
+        def __call__(self):
+            return self.now
+    
+    clock = Clock()
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.db"), ttl=60, max_rows=3, prune_every=4, clock=clock)
+    store.set("m", "a", array("f", [1.0]))
+    
+    clock.now = 1059
+    assert store.get("m", "a").tolist() == [1.0]
+    clock.now = 1061
+    assert store.get("m", "a") is None
+    
+    def rows():
+        return store._conn.execute("SELECT count(*) FROM embedding_cache").fetchone()[0]
+    
+    # 第 4 次写入触发清理，删除过期的 a
+    for i, text in enumerate("bcd"):
+        clock.now = 1100 + i
+        store.set("m", text, array("f", [float(i)]))
+    assert rows() == 3
+    store.set("m", "e", array("f", [3.0]))
+    assert rows() == 4
+    assert store.prune() == 1
+    assert rows() == 3
+    assert store.get("m", "b") is None
+    assert store.get("m", "e").tolist() == [3.0]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_retriever_skips_embedding_api_on_repeat():
+    """测试相同问题第二次检索不再调用 Embedding 接口"""
+    from app.rag.retriever import Retriever
+    
+    vector_store = MagicMock()
+    vector_store.search_similar = AsyncMock(return_value=[])
+    with patch("app.rag.retriever.create_openai_client") as create_client:
+        embeddings = create_client.return_value.embeddings
+        embeddings.create = AsyncMock(return_value=MagicMock(data=[MagicMock(embedding=[0.5, 0.5], index=0)]))
+        retriever = Retriever(vector_store)
+        
+        await retriever.retrieve("如何退货")
+        await retriever.retrieve("如何退货")
+    
+    embeddings.create.assert_awaited_once()
+    assert vector_store.search_similar.await_count == 2
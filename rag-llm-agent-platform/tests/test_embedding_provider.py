@@ -0,0 +1,79 @@
+"""
+Embedding 提供方测试
+"""
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+from app.rag.embedding_provider import LocalEmbeddingProvider, OpenAIEmbeddingProvider
+
+
+class FakeSentenceModel:
+    """模拟 sentence-transformers 模型：记录每次 encode 的批次与线程"""
+    
+    def __init__(self, dimension: int = 4):
+        self.dimension = dimension
+        self.calls = []
+        self.threads = set()
+    
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False):
+        self.calls.append(list(texts))
+        self.threads.add(threading.current_thread().name)
+        return np.array([[float(len(text))] * self.dimension for text in texts], dtype=np.float64)
+    
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+@pytest.mark.asyncio
+async def test_local_provider_encodes_on_worker_thread_as_float32():
+    """测试本地推理在线程池中执行，输出 float32 向量"""
+    model = FakeSentenceModel()
+    provider = LocalEmbeddingProvider("fake", model=model)
+    
+    embeddings = await provider.embed(["a", "bb"])
+    
+    assert [embedding.dtype for embedding in embeddings] == [np.float32, np.float32]
+    assert embeddings[1].tolist() == [2.0] * 4
+    assert all(name.startswith("embedding") for name in model.threads)
+    assert provider.is_ready() and provider.dimension == 4
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_openai_provider_orders_by_index():
+    """测试远程接口返回的向量按 index 还原输入顺序"""
+    client = MagicMock()
+    client.embeddings.create = AsyncMock(return_value=MagicMock(data=[
+        MagicMock(embedding=[2.0], index=1),
+        MagicMock(embedding=[1.0], index=0)
+    ]))
+    provider = OpenAIEmbeddingProvider(client, "text-embedding-ada-002")
+    
+    assert await provider.embed(["a", "b"]) == [[1.0], [2.0]]
+    client.embeddings.create.assert_awaited_once_with(model="text-embedding-ada-002", input=["a", "b"])
+
+
+@pytest.mark.asyncio
+async def test_retriever_selects_local_provider_and_batches_queries():
+    """测试 EMBEDDING_MODEL=local:... 时使用本地模型，并发查询合并为一次 encode"""
+    from app.rag.retriever import Retriever
+    
+    with patch("app.rag.retriever.settings.EMBEDDING_MODEL", "local:fake-model"), \
+         patch("app.rag.retriever.settings.EMBEDDING_CACHE_ENABLED", False), \
+         patch("app.rag.retriever.settings.EMBEDDING_BATCH_ENABLED", True):
+        retriever = Retriever(vector_store=MagicMock())
+    
+    assert isinstance(retriever.embedding_provider, LocalEmbeddingProvider)
+    assert retriever.embedding_provider.model_name == "fake-model"
+    model = FakeSentenceModel()
+    retriever.embedding_provider._model = model
+    
+    results = await asyncio.gather(*(retriever.embed_query("x" * n) for n in range(1, 6)))
+    
+    assert model.calls == [["x", "xx", "xxx", "xxxx", "xxxxx"]]
+    assert [result[0] for result in results] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    await retriever.close()
@@ -0,0 +1,129 @@
+"""
+共享 HTTP 传输层测试
+"""
+from unittest.mock import patch
+
+import pytest
+
+from app.core import http_client
+from app.core.http_client import RetryTransport, create_openai_client, parse_retry_after
+
+httpx = http_client.httpx
+
+
+class Upstream:
+    """按顺序返回预设响应（或抛出异常）的传输，记录请求次数"""
+    
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.closed = False
+    
+    async def handle(self, request):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    def transport(self):
+        transport = httpx.MockTransport(self.handle)
+        original = transport.aclose
+        
+        async def aclose():
+            self.closed = True
+            await original()
+        
+        transport.aclose = aclose
+        return transport
+
+
+def make_retry(upstream: Upstream, **kwargs):
+    delays = []
+    
+    async def sleep(delay):
+        delays.append(delay)
+    
+    transport = RetryTransport(upstream.transport(), sleep=sleep, rng=lambda: 0.5, **kwargs)
+    return transport, delays
+
+
+def test_parse_retry_after_formats():
+    """测试 retry-after-ms 优先，Retry-After 支持秒数与 HTTP 日期"""
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "250", "retry-after": "3"})) == 0.25
+    assert parse_retry_after(httpx.Headers({"retry-after": "1.5"})) == 1.5
+    assert parse_retry_after(
+        httpx.Headers({"retry-after": "Wed, 21 Oct 2015 07:28:05 GMT"}), now=1445412480.0
+    ) == 5.0
+    assert parse_retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    assert parse_retry_after(httpx.Headers()) is None
+
+
+@pytest.mark.asyncio
+async def test_retries_with_retry_after_then_jittered_backoff():
+    """测试 429 按 Retry-After 等待、503 按抖动指数退避等待，最终返回成功响应"""
+    upstream = Upstream(
+        httpx.Response(429, headers={"Retry-After": "1"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"ok": True})
+    )
+    transport, delays = make_retry(upstream, max_retries=2, backoff=0.2)
+    
+    async with httpx.AsyncClient(transport=transport) as client:
+        response = await client.post("http://upstream/v1/embeddings", json={"input": "a"})
+    
+    assert response.status_code == 200
+    assert upstream.calls == 3
+    assert delays == [1.0, 0.5 * 0.4]
+
+
+@pytest.mark.asyncio
+async def test_gives_up_when_retry_after_exceeds_cap_or_retries_exhausted():
+    """测试 Retry-After 超过等待上限时直接返回；重试用尽后返回最后一次响应"""
+    upstream = Upstream(httpx.Response(429, headers={"Retry-After": "60"}))
+    transport, delays = make_retry(upstream, max_backoff=8.0)
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.post("http://upstream/v1/chat/completions", json={})).status_code == 429
+    assert upstream.calls == 1 and delays == []
+    
+    upstream = Upstream(httpx.Response(502), httpx.Response(502))
+    transport, delays = make_retry(upstream, max_retries=1)
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.post("http://upstream/v1/chat/completions", json={})).status_code == 502
+    assert upstream.calls == 2 and len(delays) == 1
+
+
+@pytest.mark.asyncio
+async def test_connect_errors_retried_but_read_errors_not():
+    """测试连接失败重试，读取失败（请求可能已被处理）不重试"""
+    upstream = Upstream(httpx.ConnectError("拒绝连接"), httpx.Response(200))
+    transport, delays = make_retry(upstream)
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.get("http://upstream/v1/models")).status_code == 200
+    assert upstream.calls == 2
+    
+    upstream = Upstream(httpx.ReadError("连接中断"))
+    transport, _ = make_retry(upstream)
+    async with httpx.AsyncClient(transport=transport) as client:
+        with pytest.raises(httpx.ReadError):
+            await client.get("http://upstream/v1/models")
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_openai_clients_share_pool_until_last_closed():
+    """测试多个 OpenAI 客户端共用一个传输，关闭最后一个时才关闭连接池，SDK 重试关闭"""
+    upstream = Upstream()
+    with patch.object(http_client, "create_transport", side_effect=upstream.transport) as create, \
+         patch.object(http_client.settings, "OPENAI_API_KEY", "sk-test"):
+        embedding_client = create_openai_client()
+        chat_client = create_openai_client()
+    
+    assert create.call_count == 1
+    assert embedding_client.max_retries == 0
+    
+    await embedding_client.close()
+    assert not upstream.closed
+    await chat_client.close()
+    assert upstream.closed
+    assert http_client._shared_transport is None
@@ -0,0 +1,200 @@
+"""
+LLM 客户端单元测试
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.llm.llm_client import LLMClient
+
+
+class SlowBedrockStub:
+    """同步阻塞的假 Bedrock 客户端（模拟 boto3 invoke_model）"""
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.started = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+    
+    def invoke_model(self, modelId, body):
+        with self._lock:
+            self.started += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        prompt = json.loads(body)["prompt"]
+        payload = json.dumps({"completion": f"echo:{len(prompt)}"}).encode()
+        return {"body": io.BytesIO(payload)}
+    
+    def invoke_model_with_response_stream(self, modelId, body):
+        def events():
+            for text in ("你好", "，我是", "助手"):
+                time.sleep(self.delay)
+                yield {"chunk": {"bytes": json.dumps({"completion": text}).encode()}}
+        return {"body": events()}
+
+
+@pytest.fixture
+def bedrock_llm_client():
+    """仅配置了假 Bedrock 的 LLM 客户端"""
+    with patch("app.llm.llm_client.settings.OPENAI_API_KEY", ""):
+        client = LLMClient()
+    client.bedrock_client = SlowBedrockStub(delay=0.2)
+    yield client
+    client._bedrock_executor.shutdown(wait=True)
+
+
+@pytest.mark.asyncio
+async def test_bedrock_calls_overlap(bedrock_llm_client):
+    """测试并发的 Bedrock 调用在线程池中重叠执行，不阻塞事件循环"""
+    ticks = 0
+    
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+    
+    beat = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bedrock_llm_client.chat(f"问题{i}") for i in range(4)))
+    elapsed = time.perf_counter() - start
+    beat.cancel()
+    
+    assert all(result["content"].startswith("echo:") for result in results)
+    # 串行执行需要 0.8s
+    assert elapsed < 0.6
+    # 调用期间事件循环仍在调度其他协程
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_bedrock_timeout_keeps_slot_until_thread_finishes():
+    """测试 Bedrock 调用超时：仍阻塞在 SDK 中的线程继续占用并发槽位，新调用等其结束后才开始"""
+    with patch("app.llm.llm_client.settings.OPENAI_API_KEY", ""), \
+         patch("app.llm.llm_client.settings.BEDROCK_MAX_CONCURRENCY", 2):
+        client = LLMClient()
+    client.bedrock_client = SlowBedrockStub(delay=0.3)
+    
+    with patch("app.llm.llm_client.settings.BEDROCK_TIMEOUT", 0.05):
+        for result in await asyncio.gather(client.chat("问题1"), client.chat("问题2"), return_exceptions=True):
+            assert isinstance(result, asyncio.TimeoutError)
+    
+    # 两个超时的线程仍在执行：槽位未释放，第三个调用在事件循环侧排队，
+    # 排队时间不计入它自己的 BEDROCK_TIMEOUT
+    assert client._bedrock_semaphore.locked()
+    with patch("app.llm.llm_client.settings.BEDROCK_TIMEOUT", 0.4):
+        third = asyncio.create_task(client.chat("问题3"))
+        await asyncio.sleep(0.1)
+        assert client.bedrock_client.started == 2
+        result = await third
+    assert result["content"].startswith("echo:")
+    assert client.bedrock_client.started == 3
+    assert client.bedrock_client.max_in_flight == 2
+    client._bedrock_executor.shutdown(wait=True)
+
+
+@pytest.mark.asyncio
+async def test_bedrock_stream_yields_token_chunks(bedrock_llm_client):
+    """测试 Bedrock 真流式输出：按模型片段输出，首字延迟早于总耗时"""
+    bedrock_llm_client.bedrock_client.delay = 0.05
+    chunks = [chunk async for chunk in bedrock_llm_client.chat_stream("问题")]
+    
+    assert [chunk["content"] for chunk in chunks[:-1]] == ["你好", "，我是", "助手"]
+    done = chunks[-1]
+    assert done["done"] is True
+    assert done["ttft_ms"] < done["total_ms"]
+    assert done["total_ms"] >= 150
+
+
+def test_build_prompt_keeps_recent_history_within_budget(bedrock_llm_client):
+    """测试提示词只保留 token 预算内最近的会话历史"""
+    history = [
+        {"role": "user", "content": "第一个问题", "tokens": 400},
+        {"role": "assistant", "content": "第一个回答", "tokens": 400},
+        {"role": "user", "content": "第二个问题", "tokens": 300},
+        {"role": "assistant", "content": "第二个回答", "tokens": 300}
+    ]
+    
+    with patch("app.llm.llm_client.settings.HISTORY_TOKEN_BUDGET", 1000):
+        prompt = bedrock_llm_client._build_prompt("第三个问题", "", history)
+    
+    assert "第一个问题" not in prompt
+    assert "助手：第一个回答\n用户：第二个问题\n助手：第二个回答" in prompt
+    assert prompt.index("对话历史") < prompt.index("用户问题：第三个问题")
+
+
+def stream_chunk(content=None, tool_calls=None):
+    """构造 OpenAI 流式 chunk"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def tool_delta(index, call_id=None, name=None, arguments=None):
+    """构造流式 tool_calls 增量"""
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+@pytest.mark.asyncio
+async def test_openai_stream_executes_tool_calls_early_and_resumes():
+    """测试流式工具调用：参数完整的调用在本轮结束前开始执行，结果回填后继续流式输出"""
+    events = []
+    
+    async def first_round():
+        yield stream_chunk(content="我查一下")
+        yield stream_chunk(content="价格。")
+        yield stream_chunk(tool_calls=[tool_delta(0, "call_0", "get_price", "")])
+        yield stream_chunk(tool_calls=[tool_delta(0, arguments='{"sku": ')])
+        yield stream_chunk(tool_calls=[tool_delta(0, arguments='"A1"}')])
+        yield stream_chunk(tool_calls=[tool_delta(1, "call_1", "check_inventory", "{bad")])
+        await asyncio.sleep(0.05)
+        events.append("first round done")
+    
+    async def second_round():
+        yield stream_chunk(content="价格")
+        yield stream_chunk(content="100 元")
+    
+    async def executor(tool_call):
+        events.append(f"execute {tool_call['name']}")
+        return {"tool_name": tool_call["name"], "result": {"price": 100}, "success": True}
+    
+    with patch("app.llm.llm_client.settings.OPENAI_API_KEY", "sk-test"), \
+         patch("app.llm.llm_client.settings.AWS_ACCESS_KEY_ID", ""):
+        client = LLMClient()
+    client.openai_client = MagicMock()
+    create = AsyncMock(side_effect=[first_round(), second_round()])
+    client.openai_client.chat.completions.create = create
+    tools = [{"type": "function", "function": {"name": "get_price"}}]
+    
+    chunks = [chunk async for chunk in client.chat_stream("价格", tools=tools, tool_executor=executor)]
+    
+    assert events == ["execute get_price", "first round done"]
+    assert [chunk["content"] for chunk in chunks] == ["我查一下", "价格。", "价格", "100 元", ""]
+    results = chunks[-1]["tool_calls"]
+    assert [result["success"] for result in results] == [True, False]
+    
+    resumed = create.await_args_list[1].kwargs["messages"]
+    assert resumed[1]["content"] == "我查一下价格。"
+    assert [call["function"]["arguments"] for call in resumed[1]["tool_calls"]] == ['{"sku": "A1"}', "{bad"]
+    assert resumed[2] == {"role": "tool", "tool_call_id": "call_0", "content": '{"price": 100}'}
+    assert resumed[3]["content"].startswith("执行失败")
+    client._bedrock_executor.shutdown(wait=False)
+
+
+def test_build_prompt_includes_tool_results(bedrock_llm_client):
+    """测试第二次调用的提示词包含工具执行结果"""
+    prompt = bedrock_llm_client._build_prompt("价格", "", tool_results=[
+        {"tool_name": "get_price", "result": {"price": 100}, "success": True}
+    ])
+    
+    assert "工具执行结果：\n- get_price：{\"price\": 100}" in prompt
@@ -0,0 +1,181 @@
+"""
+内存向量索引测试
+"""
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pytest
+
+from app.rag.memory_index import MemoryIndexReplica, MemoryVectorIndex
+from app.rag.pgvector_codec import decode_vector_numpy, encode_vector
+from app.rag.vector_store import VectorStore
+
+
+def make_corpus(rows: int, dim: int, clusters: int = 20, seed: int = 0):
+    """聚类分布的单位向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, size=rows)] + 0.3 * rng.normal(size=(rows, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def add_all(index: MemoryVectorIndex, vectors, auto_train: bool = True):
+    ids = [str(i) for i in range(len(vectors))]
+    return index.add(ids, vectors, [f"文档{i}" for i in ids], [{"n": i} for i in ids], auto_train=auto_train)
+
+
+def test_untrained_index_exact_search_and_dedup():
+    """测试未训练时精确扫描，距离为余弦距离，重复 ID 跳过"""
+    vectors = make_corpus(200, 16)
+    index = MemoryVectorIndex(16, train_min=1000)
+    
+    assert add_all(index, vectors) == 200
+    assert add_all(index, vectors) == 0
+    
+    query = vectors[7] * 3
+    results = index.search(query, top_k=3)
+    expected = np.argsort(-(vectors @ vectors[7]))[:3]
+    assert [doc["id"] for doc in results] == [str(i) for i in expected]
+    assert results[0]["content"] == "文档7" and results[0]["metadata"] == {"n": "7"}
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-3)
+    assert not index.trained
+
+
+def test_ivf_pq_recall_and_incremental_add():
+    """测试 IVF-PQ 训练后的召回率，以及训练后增量写入的行可被检索到"""
+    vectors = make_corpus(4000, 32)
+    index = MemoryVectorIndex(32, nprobe=8, train_min=1000)
+    add_all(index, vectors, auto_train=False)
+    index.train()
+    
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(4000, 50, replace=False)] + 0.05 * rng.normal(size=(50, 32))
+    recalls = []
+    for query in queries:
+        expected = {str(i) for i in np.argsort(-(vectors @ query))[:10]}
+        recalls.append(len({doc["id"] for doc in index.search(query, top_k=10)} & expected) / 10)
+    assert index.trained and index.stats()["pq_m"] == 2
+    assert np.mean(recalls) >= 0.9
+    
+    index.add(["new"], -vectors[:1], ["新文档"], [None])
+    assert index.search(-vectors[0], top_k=1)[0]["id"] == "new"
+
+
+def test_remove_and_rebuild_after_growth():
+    """测试删除的行不再被检索到、可按同一 ID 重新写入；行数翻倍后需要重建，重建后去掉已删除行"""
+    vectors = make_corpus(400, 16)
+    index = MemoryVectorIndex(16, nprobe=8, train_min=200, retrain_growth=1.0)
+    add_all(index, vectors[:200])
+    assert index.trained and index.trained_rows == 200 and not index.needs_rebuild
+    
+    assert index.remove(["7", "7", "missing"]) == 1
+    assert "7" not in {doc["id"] for doc in index.search(vectors[7], top_k=5)}
+    index.add(["7"], -vectors[7:8], ["更新后"], [None])
+    assert index.search(-vectors[7], top_k=1)[0]["content"] == "更新后"
+    
+    index.add([str(i) for i in range(200, 400)], vectors[200:], [""] * 200, [None] * 200)
+    assert index.needs_rebuild
+    rebuilt = index.rebuilt()
+    assert rebuilt.size == rebuilt.count == 400 and rebuilt.trained_rows == 400
+    assert not rebuilt.needs_rebuild
+    assert rebuilt.search(-vectors[7], top_k=1)[0]["content"] == "更新后"
+
+
+def test_decode_vector_numpy_matches_list_decoder():
+    """测试 NumPy 解码与编码往返一致"""
+    embedding = np.linspace(-1, 1, 8, dtype=np.float32)
+    
+    decoded = decode_vector_numpy(encode_vector(embedding))
+    
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == embedding.tolist()
+
+
+@pytest.mark.asyncio
+async def test_replica_applies_notified_range():
+    """测试收到插入通知后按 ID 范围增量加载，无法解析的通知忽略"""
+    vectors = make_corpus(3, 4)
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        {"id": 10 + i, "doc_id": str(10 + i), "content": f"文档{i}", "metadata": None, "embedding": vectors[i]}
+        for i in range(3)
+    ])
+    replica = MemoryIndexReplica(MemoryVectorIndex(4), connect=AsyncMock(), load_batch=100)
+    replica._conn = conn
+    
+    replica._on_notify(conn, 1, "documents_inserted", "bad")
+    replica._on_notify(conn, 1, "documents_inserted", "10,12")
+    await replica._drain_task
+    
+    assert conn.fetch.await_args.args[1:] == (9, 12, 100)
+    assert replica.index.count == 3 and replica.max_id == 12
+    assert replica.notifications == 1
+    assert (await replica.search(vectors[1], top_k=1))[0]["id"] == "11"
+    await replica.close()
+
+
+@pytest.mark.asyncio
+async def test_replica_applies_update_delete_and_reset_notifications():
+    """测试更新通知按 ID 重新加载、删除通知移除行、无法逐行同步的变更整体重建"""
+    vectors = make_corpus(3, 4)
+    replica = MemoryIndexReplica(MemoryVectorIndex(4), connect=AsyncMock())
+    add_all(replica.index, vectors)
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        {"id": 1, "doc_id": "1", "content": "新内容", "metadata": None, "embedding": -vectors[1]}
+    ])
+    replica._conn = conn
+    
+    replica._on_notify(conn, 1, "documents_inserted", "update:1")
+    replica._on_notify(conn, 1, "documents_inserted", "delete:0,2")
+    await replica._drain_task
+    
+    assert conn.fetch.await_args.args[1] == [1]
+    assert replica.index.size == 1
+    assert (await replica.search(-vectors[1], top_k=3)) == [
+        {"id": "1", "content": "新内容", "metadata": None, "distance": pytest.approx(0.0, abs=1e-3)}
+    ]
+    
+    conn.fetch = AsyncMock(return_value=[])
+    old_index = replica.index
+    replica._on_notify(conn, 1, "documents_inserted", "truncate:*")
+    await replica._drain_task
+    assert replica.index is not old_index and replica.index.size == 0
+    await replica.close()
+
+
+@pytest.mark.asyncio
+async def test_vector_store_starts_memory_index_when_db_down_at_startup():
+    """测试启动时数据库不可用也会启动内存索引同步（其自行重连），就绪检查同样确保已启动"""
+    store = VectorStore()
+    store.memory_index = MagicMock(ready=False)
+    store.connect = AsyncMock(side_effect=OSError("connection refused"))
+    
+    with pytest.raises(OSError):
+        await store.warmup()
+    store.memory_index.start.assert_called_once()
+    
+    with pytest.raises(OSError):
+        await store.ping()
+    assert store.memory_index.start.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_vector_store_uses_memory_index_unless_filtered():
+    """测试内存索引就绪时无过滤检索不访问数据库，带过滤条件时回退 SQL"""
+    store = VectorStore()
+    store.memory_index = MagicMock(ready=True)
+    store.memory_index.search = AsyncMock(return_value=[{"id": "1", "distance": 0.1}])
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[{"id": "2", "content": "文档", "metadata": {}, "distance": 0.2}])
+    conn.transaction = MagicMock(return_value=MagicMock(__aenter__=AsyncMock(), __aexit__=AsyncMock(return_value=False)))
+    conn.execute = AsyncMock()
+    acquire = MagicMock(__aenter__=AsyncMock(return_value=conn), __aexit__=AsyncMock(return_value=False))
+    store.connection_pool = MagicMock(acquire=MagicMock(return_value=acquire))
+    
+    assert await store.search_similar([0.1, 0.2], top_k=1) == [{"id": "1", "distance": 0.1}]
+    conn.fetch.assert_not_awaited()
+    
+    results = await store.search_similar([0.1, 0.2], top_k=1, filters={"equals": {"source": "doc"}})
+    assert results[0]["id"] == "2"
+    store.memory_index.search.assert_awaited_once()
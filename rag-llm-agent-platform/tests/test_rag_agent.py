@@ -60,6 +60,8 @@ async def test_chat_success(mock_retriever, mock_tool_manager, mock_llm_client):
         assert "response" in result
         assert "conversation_id" in result
         assert result["response"] == "这是测试响应"
+        assert result["sources"] == ["doc1", "doc2"]
+        assert result["context_tokens"] > 0
         mock_retriever.retrieve.assert_called_once()
 
 
@@ -93,7 +95,7 @@ async def test_chat_with_tool_calls(mock_retriever, mock_tool_manager, mock_llm_
 @pytest.mark.asyncio
 async def test_chat_stream(mock_retriever, mock_tool_manager, mock_llm_client):
     """测试流式聊天"""
-    async def mock_stream():
+    async def mock_stream(**kwargs):
         yield {"content": "这是", "done": False}
         yield {"content": "流式", "done": False}
         yield {"content": "响应", "done": True}
@@ -113,3 +115,60 @@ async def test_chat_stream(mock_retriever, mock_tool_manager, mock_llm_client):
         assert len(chunks) > 0
         assert all("content" in chunk for chunk in chunks)
 
+
+
+@pytest.mark.asyncio
+async def test_execute_tools_in_parallel_keeps_order(mock_retriever, mock_llm_client):
+    """测试独立工具调用并发执行，结果顺序与调用顺序一致"""
+    import asyncio
+    import time
+    
+    delays = {"get_price": 0.1, "check_inventory": 0.05, "get_customer_info": 0.01}
+    
+    async def execute_tool(tool_name, arguments):
+        await asyncio.sleep(delays[tool_name])
+        return {"tool": tool_name}
+    
+    manager = MagicMock()
+    manager.execute_tool = execute_tool
+    
+    with patch('app.agents.rag_agent.VectorStore', return_value=MagicMock()), \
+         patch('app.agents.rag_agent.Retriever', return_value=mock_retriever), \
+         patch('app.agents.rag_agent.ToolManager', return_value=manager), \
+         patch('app.agents.rag_agent.LLMClient', return_value=mock_llm_client):
+        
+        agent = RAGAgent()
+        start = time.perf_counter()
+        results = await agent._execute_tools([
+            {"name": name, "arguments": {}} for name in delays
+        ])
+        elapsed = time.perf_counter() - start
+    
+    assert [result["tool_name"] for result in results] == list(delays)
+    assert all(result["success"] for result in results)
+    assert elapsed < 0.15
+
+
+@pytest.mark.asyncio
+async def test_readiness_checks_pool_and_caches_result(mock_retriever, mock_tool_manager, mock_llm_client):
+    """测试就绪检查探测连接池，并在缓存期内复用结果"""
+    vector_store = MagicMock()
+    vector_store.ping = AsyncMock(side_effect=[OSError("connection refused"), None])
+    
+    with patch('app.agents.rag_agent.VectorStore', return_value=vector_store), \
+         patch('app.agents.rag_agent.Retriever', return_value=mock_retriever), \
+         patch('app.agents.rag_agent.ToolManager', return_value=mock_tool_manager), \
+         patch('app.agents.rag_agent.LLMClient', return_value=mock_llm_client), \
+         patch('app.agents.rag_agent.settings.OPENAI_API_KEY', "sk-test"):
+        agent = RAGAgent()
+        
+        first = await agent.readiness()
+        cached = await agent.readiness()
+        agent._readiness_checked_at = 0.0
+        recovered = await agent.readiness()
+    
+    assert first["ready"] is False
+    assert first["checks"]["database"] == "error: connection refused"
+    assert cached is first
+    assert recovered["ready"] is True
+    assert vector_store.ping.await_count == 2
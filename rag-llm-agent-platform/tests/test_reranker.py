@@ -0,0 +1,127 @@
+"""
+检索结果重排序测试
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.rag.reranker import CrossEncoderScorer, LexicalScorer, Reranker, RerankScorer
+
+
+class SlowScorer(RerankScorer):
+    """按内容长度打分，可设置延迟；记录每次打分的文档数"""
+    
+    name = "slow"
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+    
+    async def score(self, query, docs):
+        self.calls.append(len(docs))
+        await asyncio.sleep(self.delay)
+        return [float(len(doc["content"])) for doc in docs]
+
+
+def make_docs(*contents):
+    return [{"id": str(i), "content": content, "source": f"doc{i}"} for i, content in enumerate(contents)]
+
+
+@pytest.mark.asyncio
+async def test_lexical_scorer_orders_by_term_overlap():
+    """测试词法打分按问题词（含汉字二元组）的覆盖率排序"""
+    reranker = Reranker(LexicalScorer(), top_n=2)
+    docs = make_docs("天气预报", "如何申请退货：登录后提交退货申请", "退货政策")
+    
+    result = await reranker.rerank("如何申请退货", docs)
+    
+    assert [doc["id"] for doc in result] == ["1", "2"]
+    assert result[0]["rerank_score"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_scores_cached_per_query_and_doc():
+    """测试 (问题, 文档ID) 分数缓存：重复问题只为新文档打分"""
+    scorer = SlowScorer()
+    reranker = Reranker(scorer, top_n=2)
+    docs = make_docs("a", "bbb", "cc")
+    
+    await reranker.rerank("问题", docs)
+    result = await reranker.rerank(" 问题 ", docs + [{"id": "9", "content": "dddd"}])
+    
+    assert scorer.calls == [3, 1]
+    assert [doc["id"] for doc in result] == ["9", "1"]
+    assert reranker.stats()["hits"] == 3
+
+
+@pytest.mark.asyncio
+async def test_budget_exceeded_keeps_vector_order_and_caches_later():
+    """测试超出延迟预算时使用原顺序，后台打分完成后写入缓存"""
+    scorer = SlowScorer(delay=0.05)
+    reranker = Reranker(scorer, top_n=2, budget_ms=10)
+    docs = make_docs("a", "bbb", "cc")
+    
+    result = await reranker.rerank("问题", docs)
+    assert [doc["id"] for doc in result] == ["0", "1"]
+    assert reranker.stats()["skipped"] == 1
+    
+    await reranker.close()
+    result = await reranker.rerank("问题", docs)
+    assert [doc["id"] for doc in result] == ["1", "2"]
+    assert scorer.calls == [3]
+
+
+@pytest.mark.asyncio
+async def test_background_scoring_bounded_under_sustained_overload():
+    """测试持续超出预算时后台打分数不超过上限，多余的超时打分被取消"""
+    scorer = SlowScorer(delay=0.2)
+    reranker = Reranker(scorer, top_n=1, budget_ms=5, max_background=1)
+    docs = make_docs("a", "bbb")
+    
+    for i in range(5):
+        await reranker.rerank(f"问题{i}", docs)
+        assert len(reranker._background) <= 1
+    
+    assert reranker.stats()["skipped"] == 5
+    await reranker.close()
+    assert not reranker._background
+    assert reranker.stats()["cache_size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_scorer_error_falls_back_to_lexical():
+    """测试主打分器出错时使用词法打分兜底"""
+    model = MagicMock()
+    model.predict.side_effect = RuntimeError("模型加载失败")
+    reranker = Reranker(CrossEncoderScorer("fake", model=model), top_n=1)
+    docs = make_docs("无关内容", "退货申请流程")
+    
+    result = await reranker.rerank("退货申请", docs)
+    
+    assert [doc["id"] for doc in result] == ["1"]
+    assert reranker.stats()["fallbacks"] == 1
+    await reranker.close()
+
+
+@pytest.mark.asyncio
+async def test_agent_overfetches_candidates_and_reranks():
+    """测试启用重排序时 Agent 多取候选，只把重排后的 TOP_K_RESULTS 篇交给 LLM"""
+    from app.agents.rag_agent import RAGAgent
+    
+    retriever = MagicMock()
+    retriever.retrieve = AsyncMock(return_value=make_docs("无关", "退货申请流程", "天气", "退货需在七天内"))
+    llm_client = MagicMock()
+    llm_client.chat = AsyncMock(return_value={"content": "回答", "tool_calls": None})
+    with patch("app.agents.rag_agent.settings.RERANK_ENABLED", True), \
+         patch("app.agents.rag_agent.settings.RERANK_CANDIDATES", 20), \
+         patch("app.agents.rag_agent.settings.TOP_K_RESULTS", 2), \
+         patch("app.agents.rag_agent.settings.RESPONSE_CACHE_ENABLED", False), \
+         patch("app.agents.rag_agent.VectorStore", return_value=MagicMock()), \
+         patch("app.agents.rag_agent.Retriever", return_value=retriever), \
+         patch("app.agents.rag_agent.LLMClient", return_value=llm_client):
+        agent = RAGAgent()
+        result = await agent.chat("退货申请")
+    
+    assert retriever.retrieve.await_args.kwargs["top_k"] == 20
+    assert result["sources"] == ["doc1", "doc3"]
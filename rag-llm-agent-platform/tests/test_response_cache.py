@@ -0,0 +1,163 @@
+"""
+语义回答缓存单元测试
+"""
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.agents.rag_agent import RAGAgent
+from app.rag.response_cache import SemanticResponseCache
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_similar_question_hits_above_threshold():
+    """测试相似度超过阈值时命中，低于阈值未命中"""
+    cache = SemanticResponseCache(threshold=0.95, max_size=10)
+    cache.set([1.0, 0.0, 0.0], "7 天内可退货", ["faq.md"])
+    
+    hit = cache.get([0.99, 0.05, 0.0])
+    assert hit.response == "7 天内可退货"
+    assert hit.sources == ["faq.md"]
+    assert hit.similarity > 0.95
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_scope_ttl_and_generation_invalidation():
+    """测试 scope 隔离、TTL 过期与文档变更失效"""
+    clock = FakeClock()
+    cache = SemanticResponseCache(ttl=60, max_size=10, clock=clock)
+    cache.set([1.0, 0.0], "回答", [], scope="a")
+    
+    assert cache.get([1.0, 0.0], scope="b") is None
+    assert cache.get([1.0, 0.0], scope="a") is not None
+    
+    assert cache.get([1.0, 0.0], scope="a", generation=1) is None
+    assert cache.stats()["invalidations"] == 1
+    
+    cache.set([1.0, 0.0], "回答", [], scope="a", generation=1)
+    clock.now = 61
+    assert cache.get([1.0, 0.0], scope="a", generation=1) is None
+
+
+@pytest.mark.asyncio
+async def test_change_notification_from_other_worker_invalidates_cache():
+    """测试其他进程写入文档后，经变更通知递增 generation，本进程的缓存失效；重连后同样失效"""
+    from app.rag.vector_store import VectorStore
+    
+    conn = MagicMock()
+    conn.add_listener = AsyncMock()
+    conn.is_closed = MagicMock(return_value=False)
+    conn.close = AsyncMock()
+    with patch("app.rag.vector_store.settings.RESPONSE_CACHE_ENABLED", True), \
+         patch("app.rag.vector_store.settings.MEMORY_INDEX_ENABLED", False), \
+         patch("app.rag.vector_store.asyncpg.connect", AsyncMock(return_value=conn)):
+        store = VectorStore()
+        store.connect = AsyncMock(side_effect=OSError("connection refused"))
+        with pytest.raises(OSError):
+            await store.ping()
+        await asyncio.sleep(0)
+    
+    listener = store.change_listener
+    assert listener.listening and store.generation == 1
+    cache = SemanticResponseCache(max_size=10)
+    cache.set([1.0, 0.0], "回答", [], generation=store.generation)
+    
+    listener._on_notify(conn, 1, "documents_inserted", "无法解析")
+    assert cache.get([1.0, 0.0], generation=store.generation) is not None
+    listener._on_notify(conn, 1, "documents_inserted", "delete:3")
+    assert cache.get([1.0, 0.0], generation=store.generation) is None
+    await store.close()
+    conn.close.assert_awaited_once()
+
+
+def test_evicts_least_recently_used_when_full():
+    """测试容量满时淘汰最久未使用的条目"""
+    clock = FakeClock()
+    cache = SemanticResponseCache(max_size=2, clock=clock)
+    cache.set([1.0, 0.0, 0.0], "a", [])
+    clock.now = 1
+    cache.set([0.0, 1.0, 0.0], "b", [])
+    clock.now = 2
+    cache.get([1.0, 0.0, 0.0])
+    clock.now = 3
+    cache.set([0.0, 0.0, 1.0], "c", [])
+    
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    assert cache.get([1.0, 0.0, 0.0]).response == "a"
+    assert cache.get([0.0, 0.0, 1.0]).response == "c"
+
+
+@pytest.fixture
+def cached_agent():
+    """启用语义缓存的 Agent"""
+    retriever = MagicMock()
+    retriever.embed_query = AsyncMock(return_value=[0.6, 0.8])
+    retriever.retrieve = AsyncMock(return_value=[{"content": "退货政策", "source": "faq.md"}])
+    tool_manager = MagicMock()
+    tool_manager.get_available_tools = MagicMock(return_value=[])
+    tool_manager.execute_tool = AsyncMock(return_value={"stock": 3})
+    llm_client = MagicMock()
+    
+    with patch('app.agents.rag_agent.settings.RESPONSE_CACHE_ENABLED', True), \
+         patch('app.agents.rag_agent.VectorStore', return_value=MagicMock(generation=0)), \
+         patch('app.agents.rag_agent.Retriever', return_value=retriever), \
+         patch('app.agents.rag_agent.ToolManager', return_value=tool_manager), \
+         patch('app.agents.rag_agent.LLMClient', return_value=llm_client):
+        yield RAGAgent()
+
+
+@pytest.mark.asyncio
+async def test_agent_serves_repeat_question_from_cache(cached_agent):
+    """测试重复问题直接返回缓存回答，跳过检索与 LLM"""
+    cached_agent.llm_client.chat = AsyncMock(return_value={"content": "7 天内可退货", "tool_calls": None})
+    
+    first = await cached_agent.chat("怎么退货")
+    second = await cached_agent.chat("怎么退货？")
+    
+    assert second["response"] == first["response"] == "7 天内可退货"
+    assert second["sources"] == ["faq.md"]
+    cached_agent.llm_client.chat.assert_called_once()
+    cached_agent.retriever.retrieve.assert_called_once()
+    assert cached_agent.retriever.retrieve.call_args.kwargs["query_embedding"] == [0.6, 0.8]
+
+
+@pytest.mark.asyncio
+async def test_agent_does_not_cache_tool_answers(cached_agent):
+    """测试依赖工具调用的回答不写入缓存"""
+    cached_agent.llm_client.chat = AsyncMock(side_effect=[
+        {"content": None, "tool_calls": [{"name": "check_inventory", "arguments": {}}]},
+        {"content": "库存 3 件", "tool_calls": None},
+        {"content": None, "tool_calls": [{"name": "check_inventory", "arguments": {}}]},
+        {"content": "库存 2 件", "tool_calls": None}
+    ])
+    
+    assert (await cached_agent.chat("还有库存吗"))["response"] == "库存 3 件"
+    assert (await cached_agent.chat("还有库存吗"))["response"] == "库存 2 件"
+    assert cached_agent.response_cache.stats()["bypasses"] == 2
+
+
+def test_scope_map_bounded_by_capacity():
+    """测试 scope 映射随槽位淘汰回收，不同 search_options 组合再多也不超过容量"""
+    cache = SemanticResponseCache(max_size=3)
+    
+    for i in range(100):
+        cache.set([1.0, float(i)], f"回答{i}", [], scope=f"filters-{i}")
+    
+    assert len(cache._scope_ids) == 3
+    assert set(cache._scope_ids) == {"filters-97", "filters-98", "filters-99"}
+    assert cache.get([1.0, 99.0], scope="filters-99").response == "回答99"
+    assert cache.get([1.0, 0.0], scope="filters-0") is None
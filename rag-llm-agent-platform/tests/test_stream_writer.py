@@ -0,0 +1,237 @@
+"""
+WebSocket 帧合并写入器单元测试
+"""
+import asyncio
+import pytest
+from starlette.websockets import WebSocketState
+
+from app.api.stream_writer import CoalescingFrameWriter
+
+
+class FakeWebSocket:
+    """记录已发送帧的假 WebSocket"""
+    
+    def __init__(self, send_delay: float = 0.0):
+        self.frames = []
+        self.send_delay = send_delay
+    
+    async def send_json(self, data):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.frames.append(data)
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_sent_immediately():
+    """测试首个内容块立即发送"""
+    websocket = FakeWebSocket()
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=1000, max_bytes=1024)
+    
+    await writer.write("你", "conv-1")
+    
+    assert websocket.frames == [{"type": "chunk", "content": "你", "conversation_id": "conv-1", "done": False}]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_chunks_coalesced_within_interval():
+    """测试时间窗口内的后续内容块合并为一帧"""
+    websocket = FakeWebSocket()
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=20, max_bytes=1024)
+    
+    for char in "你好，世界":
+        await writer.write(char, "conv-1")
+    assert len(websocket.frames) == 1
+    
+    await asyncio.sleep(0.05)
+    assert [frame["content"] for frame in websocket.frames] == ["你", "好，世界"]
+    assert writer.stats()["chunks_received"] == 5
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_on_byte_threshold():
+    """测试累计字节达到阈值立即发送"""
+    websocket = FakeWebSocket()
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=1000, max_bytes=4)
+    
+    for char in "abcdefghi":
+        await writer.write(char)
+    
+    assert [frame["content"] for frame in websocket.frames] == ["a", "bcde", "fghi"]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_remaining_content():
+    """测试关闭时发送剩余内容"""
+    websocket = FakeWebSocket()
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=1000, max_bytes=1024)
+    
+    await writer.write("a")
+    await writer.write("b")
+    await writer.close()
+    
+    assert "".join(frame["content"] for frame in websocket.frames) == "ab"
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_times_out():
+    """测试慢消费者：发送超时抛出异常"""
+    websocket = FakeWebSocket(send_delay=1.0)
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=10, max_bytes=1024, send_timeout=0.05)
+    
+    with pytest.raises(asyncio.TimeoutError):
+        await writer.write("a")
+
+
+@pytest.mark.asyncio
+async def test_timed_flush_error_raised_on_next_write_and_close():
+    """测试定时刷新中的发送超时不丢失：下一次 write() 抛出，close() 同样抛出"""
+    websocket = FakeWebSocket()
+    writer = CoalescingFrameWriter(websocket, flush_interval_ms=10, max_bytes=1024, send_timeout=0.05)
+    await writer.write("a")
+    
+    websocket.send_delay = 1.0
+    await writer.write("b")
+    await asyncio.sleep(0.1)
+    with pytest.raises(asyncio.TimeoutError):
+        await writer.write("c")
+    
+    await writer.write("d")
+    await asyncio.sleep(0.1)
+    with pytest.raises(asyncio.TimeoutError):
+        await writer.close()
+
+
+class FakeChatWebSocket(FakeWebSocket):
+    """按顺序返回客户端消息、检测并发发送的假 WebSocket；消息读完后等待 disconnect 事件再断开"""
+    
+    def __init__(self, messages, send_delay: float = 0.0, fail_on_chunk: bool = False):
+        super().__init__(send_delay)
+        self.messages = list(messages)
+        self.disconnect = asyncio.Event()
+        self.fail_on_chunk = fail_on_chunk
+        self.sending = 0
+        self.overlapped = False
+        self.client_state = WebSocketState.CONNECTED
+        self.closed = False
+    
+    async def accept(self):
+        pass
+    
+    async def close(self, code: int = 1000):
+        if self.client_state == WebSocketState.DISCONNECTED:
+            raise RuntimeError('Cannot call "send" once a close message has been sent.')
+        self.closed = True
+    
+    async def receive_text(self):
+        from fastapi import WebSocketDisconnect
+        
+        if self.messages:
+            await asyncio.sleep(0)
+            return self.messages.pop(0)
+        await self.disconnect.wait()
+        self.client_state = WebSocketState.DISCONNECTED
+        raise WebSocketDisconnect()
+    
+    async def send_json(self, data):
+        from fastapi import WebSocketDisconnect
+        
+        if self.fail_on_chunk and data.get("type") == "chunk":
+            raise WebSocketDisconnect()
+        self.sending += 1
+        self.overlapped = self.overlapped or self.sending > 1
+        try:
+            await super().send_json(data)
+        finally:
+            self.sending -= 1
+
+
+def make_chat_agent(closed: list, chunks: int = 5):
+    from unittest.mock import MagicMock
+    
+    async def chat_stream(message, conversation_id=None, **kwargs):
+        try:
+            for i in range(chunks):
+                await asyncio.sleep(0.005)
+                yield {"content": "x" * 64, "conversation_id": "conv-1", "done": False}
+            yield {"content": "", "conversation_id": "conv-1", "done": True}
+        finally:
+            closed.append(message)
+    
+    agent = MagicMock()
+    agent.chat_stream = chat_stream
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_websocket_error_frames_share_send_lock():
+    """测试接收端的 429 错误帧与内容帧共用发送锁，不会并发写同一连接"""
+    from unittest.mock import patch
+    from app.api.chat import websocket_chat
+    
+    closed = []
+    websocket = FakeChatWebSocket(['{"message": "q%d"}' % i for i in range(4)], send_delay=0.01)
+    with patch("app.api.chat.settings.WS_MAX_QUEUED_MESSAGES", 1), \
+         patch("app.api.stream_writer.settings.WS_FLUSH_MAX_BYTES", 1):
+        handler = asyncio.create_task(websocket_chat(websocket, make_chat_agent(closed)))
+        while len(closed) < 2:
+            await asyncio.sleep(0.01)
+        websocket.disconnect.set()
+        await handler
+    
+    assert any(frame.get("code") == 429 for frame in websocket.frames)
+    assert sum(frame["type"] == "done" for frame in websocket.frames) == 2
+    assert not websocket.overlapped
+    # 客户端已断开：不再发送关闭帧，接收任务已结束
+    assert not websocket.closed
+    assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+
+
+@pytest.mark.asyncio
+async def test_websocket_disconnect_closes_chat_stream_immediately():
+    """测试发送失败（客户端断开）时对话生成器立即关闭，不等垃圾回收"""
+    from app.api.chat import websocket_chat
+    
+    closed = []
+    websocket = FakeChatWebSocket(['{"message": "q"}'], fail_on_chunk=True)
+    
+    await websocket_chat(websocket, make_chat_agent(closed, chunks=100))
+    
+    assert closed == ["q"]
+
+
+class StalledWebSocket(FakeChatWebSocket):
+    """首帧之后发送与关闭都永久阻塞的假 WebSocket（客户端停止读取）"""
+    
+    def __init__(self, messages):
+        super().__init__(messages)
+        self.close_codes = []
+    
+    async def send_json(self, data):
+        if self.frames:
+            await asyncio.Event().wait()
+        await super().send_json(data)
+    
+    async def close(self, code: int = 1000):
+        self.close_codes.append(code)
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_websocket_slow_consumer_exits_without_further_sends():
+    """测试慢消费者：发送超时后不再发送错误帧，以 1008 限时关闭，处理协程仍能退出"""
+    from unittest.mock import patch
+    from app.api.chat import websocket_chat
+    
+    closed = []
+    websocket = StalledWebSocket(['{"message": "q"}'])
+    with patch("app.api.chat.settings.WS_SEND_TIMEOUT", 0.05), \
+         patch("app.api.stream_writer.settings.WS_SEND_TIMEOUT", 0.05), \
+         patch("app.api.stream_writer.settings.WS_FLUSH_MAX_BYTES", 1):
+        await asyncio.wait_for(websocket_chat(websocket, make_chat_agent(closed)), timeout=2)
+    
+    assert len(websocket.frames) == 1
+    assert websocket.close_codes == [1008]
+    assert closed == ["q"]
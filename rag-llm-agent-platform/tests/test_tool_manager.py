@@ -54,3 +54,125 @@ async def test_execute_tool_not_found(tool_manager):
     with pytest.raises(ValueError, match="工具不存在"):
         await tool_manager.execute_tool("non_existent_tool", {})
 
+
+
+def test_lock_key_for_mutating_tools(tool_manager):
+    """测试写操作按实体生成锁键，只读工具不加锁"""
+    assert tool_manager.get_lock_key("get_price", {"product_id": "P1"}) is None
+    assert tool_manager.get_lock_key("update_inventory", {"product_id": "P1"}) == "product_id:P1"
+    assert tool_manager.get_lock_key("reserve_inventory", {"product_id": "P1"}) == "product_id:P1"
+
+
+@pytest.mark.asyncio
+async def test_mutating_tools_serialized_per_entity(tool_manager):
+    """测试同一实体的写操作串行执行，不同实体并发执行"""
+    import asyncio
+    
+    active = {}
+    max_active = {}
+    
+    async def slow_update(product_id: str, quantity: int, warehouse_id: str):
+        active[product_id] = active.get(product_id, 0) + 1
+        max_active[product_id] = max(max_active.get(product_id, 0), active[product_id])
+        await asyncio.sleep(0.02)
+        active[product_id] -= 1
+        return {"product_id": product_id}
+    
+    tool_manager.tools["update_inventory"]["handler"] = slow_update
+    calls = [
+        {"product_id": product_id, "quantity": 1, "warehouse_id": "W1"}
+        for product_id in ("P1", "P1", "P1", "P2", "P2")
+    ]
+    await asyncio.gather(*(tool_manager.execute_tool("update_inventory", args) for args in calls))
+    
+    assert max_active == {"P1": 1, "P2": 1}
+    assert tool_manager._entity_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_execute_tool_timeout(tool_manager):
+    """测试单个工具超时"""
+    import asyncio
+    
+    async def hang(product_id: str):
+        await asyncio.sleep(10)
+    
+    tool_manager.tools["get_price"]["handler"] = hang
+    tool_manager.tools["get_price"]["timeout"] = 0.01
+    
+    with pytest.raises(asyncio.TimeoutError):
+        await tool_manager.execute_tool("get_price", {"product_id": "P1"})
+
+
+def test_schemas_precomputed_once(tool_manager):
+    """测试 Schema 在注册时预计算，重复获取返回同一对象；payload 与 httpx 发送的请求体字节一致"""
+    import json
+    
+    tools = tool_manager.get_available_tools()
+    
+    assert tools is tool_manager.get_available_tools()
+    assert isinstance(tools, tuple)
+    assert len(tools) == len(tool_manager.tools)
+    body = json.dumps({"tools": list(tools)}, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    assert body.encode("utf-8") == b'{"tools":' + tool_manager.schema_set.payload + b"}"
+    assert len(tool_manager.schema_set.version) == 16
+
+
+def test_schema_version_stable_and_tracks_tool_set():
+    """测试 schema version 跨实例稳定、每个意图子集各自有版本，工具集变化时版本随之变化"""
+    from app.tools.tool_manager import ToolManager
+    
+    first, second = ToolManager(), ToolManager()
+    assert first.schema_set.version == second.schema_set.version
+    assert first.get_schema_set("查询订单").version == second.get_schema_set("订单状态").version
+    assert first.get_schema_set("查询订单").version != first.get_schema_set("库存").version
+    
+    second.tools["get_price"] = dict(second.tools["get_price"], description="查询商品价格（含促销）")
+    second._schema_sets.clear()
+    assert second.get_schema_set("价格").version != first.get_schema_set("价格").version
+    assert second.get_schema_set("库存").version == first.get_schema_set("库存").version
+
+
+def test_intent_based_tool_subset(tool_manager):
+    """测试按意图只返回相关工具分组"""
+    names = {tool["function"]["name"] for tool in tool_manager.get_available_tools("P100 还有库存吗")}
+    
+    assert names == {"check_inventory", "update_inventory", "reserve_inventory"}
+    
+    names = {tool["function"]["name"] for tool in tool_manager.get_available_tools("这个商品价格和库存")}
+    assert "get_price" in names and "check_inventory" in names
+    assert "create_order" not in names
+
+
+def test_intent_subset_falls_back_to_all_tools(tool_manager):
+    """测试无法识别意图时返回全部工具，且子集按分组缓存"""
+    assert tool_manager.get_available_tools("你好") == tool_manager.get_available_tools()
+    
+    first = tool_manager.get_schema_set("查询订单")
+    assert tool_manager.get_schema_set("订单状态") is first
+    assert first.version != tool_manager.schema_set.version
+
+
+@pytest.mark.asyncio
+async def test_execute_tool_records_latency_per_tool(tool_manager):
+    """测试按工具名和结果记录执行耗时"""
+    import asyncio
+    from prometheus_client import REGISTRY
+    
+    def count(status):
+        return REGISTRY.get_sample_value(
+            "rag_tool_seconds_count", {"tool": "get_price", "status": status}
+        ) or 0
+    
+    async def hang(product_id: str):
+        await asyncio.sleep(10)
+    
+    before_success, before_timeout = count("success"), count("timeout")
+    await tool_manager.execute_tool("get_price", {"product_id": "P1"})
+    tool_manager.tools["get_price"]["handler"] = hang
+    tool_manager.tools["get_price"]["timeout"] = 0.01
+    with pytest.raises(asyncio.TimeoutError):
+        await tool_manager.execute_tool("get_price", {"product_id": "P1"})
+    
+    assert count("success") == before_success + 1
+    assert count("timeout") == before_timeout + 1
@@ -0,0 +1,317 @@
+"""
+向量存储单元测试
+"""
+import struct
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.rag.pgvector_codec import decode_vector, encode_vector
+from app.rag.vector_store import VectorStore
+
+
+def make_pool(conn):
+    """构造返回指定连接的模拟连接池"""
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire = MagicMock(return_value=acquire)
+    return pool
+
+
+def test_encode_vector_binary_layout():
+    """测试编码符合 pgvector 二进制格式"""
+    data = encode_vector([1.0, -2.5, 0.25])
+    
+    assert len(data) == 4 + 3 * 4
+    assert struct.unpack(">HH", data[:4]) == (3, 0)
+    assert struct.unpack(">3f", data[4:]) == (1.0, -2.5, 0.25)
+
+
+def test_vector_codec_roundtrip():
+    """测试 1536 维向量编解码往返"""
+    embedding = [i / 1536 for i in range(1536)]
+    decoded = decode_vector(encode_vector(embedding))
+    
+    assert len(decoded) == 1536
+    assert decoded == pytest.approx(embedding, rel=1e-6)
+
+
+def test_encode_vector_numpy():
+    """测试 numpy 数组输入与列表输入编码一致"""
+    np = pytest.importorskip("numpy")
+    embedding = np.linspace(-1, 1, 8, dtype=np.float32)
+    
+    assert encode_vector(embedding) == encode_vector(embedding.tolist())
+
+
+@pytest.mark.asyncio
+async def test_search_similar_passes_raw_embedding():
+    """测试检索直接传递向量（由编解码器处理），结果按行转换为字典"""
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        {"id": "1", "content": "文档", "metadata": {"source": "doc1"}, "distance": 0.1}
+    ])
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    embedding = [0.1, 0.2, 0.3]
+    
+    results = await store.search_similar(embedding, top_k=3)
+    
+    args = conn.fetch.call_args.args
+    assert args[1] is embedding
+    assert args[2] == 3
+    assert results == [{"id": "1", "content": "文档", "metadata": {"source": "doc1"}, "distance": 0.1}]
+
+
+def make_copy_conn(fail_on_call=None):
+    """构造记录 COPY 调用的模拟连接，可指定第几次调用失败"""
+    conn = MagicMock()
+    transaction = MagicMock()
+    transaction.__aenter__ = AsyncMock()
+    transaction.__aexit__ = AsyncMock(return_value=False)
+    conn.transaction = MagicMock(return_value=transaction)
+    calls = []
+    
+    async def copy_records_to_table(table, records, columns):
+        calls.append(records)
+        if fail_on_call is not None and len(calls) == fail_on_call:
+            raise RuntimeError("copy failed")
+    
+    conn.copy_records_to_table = copy_records_to_table
+    return conn, calls
+
+
+def make_documents(count):
+    return [{"content": f"文档{i}", "embedding": [0.1, 0.2]} for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_insert_many_batches_with_copy():
+    """测试批量写入按批次 COPY，每批一个事务"""
+    conn, calls = make_copy_conn()
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    stats = await store.insert_many(make_documents(5), batch_size=2)
+    
+    assert [len(records) for records in calls] == [2, 2, 1]
+    assert calls[0][0] == ("文档0", [0.1, 0.2], {})
+    assert conn.transaction.call_count == 3
+    assert stats["rows"] == 5
+    assert stats["next_batch"] == 3
+
+
+@pytest.mark.asyncio
+async def test_insert_many_failure_and_resume():
+    """测试失败时报告续传批次，续传时跳过已提交批次"""
+    from app.rag.vector_store import BulkInsertError
+    
+    conn, calls = make_copy_conn(fail_on_call=2)
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    with pytest.raises(BulkInsertError) as exc_info:
+        await store.insert_many(make_documents(5), batch_size=2)
+    assert exc_info.value.stats["rows"] == 2
+    assert exc_info.value.stats["next_batch"] == 1
+    
+    conn, calls = make_copy_conn()
+    store.connection_pool = make_pool(conn)
+    stats = await store.insert_many(make_documents(5), batch_size=2, start_batch=1)
+    
+    assert [records[0][0] for records in calls] == ["文档2", "文档4"]
+    assert stats["rows"] == 3
+    assert stats["next_batch"] == 3
+
+
+def test_plan_index_scales_with_row_count():
+    """测试索引参数随数据量推导"""
+    from app.rag.index_manager import index_ddl, plan_index
+    
+    assert plan_index("ivfflat", 50_000)["build"] == {"lists": 50}
+    assert plan_index("ivfflat", 4_000_000)["build"] == {"lists": 2000}
+    assert plan_index("ivfflat", 1_000)["build"] == {"lists": 10}
+    assert plan_index("hnsw", 10_000)["build"] == {"m": 16, "ef_construction": 64}
+    assert plan_index("hnsw", 5_000_000)["build"] == {"m": 24, "ef_construction": 128}
+    assert "USING hnsw" in index_ddl(plan_index("hnsw", 10))
+    
+    with pytest.raises(ValueError):
+        plan_index("flat", 10)
+
+
+@pytest.mark.asyncio
+async def test_search_similar_applies_query_params_in_transaction():
+    """测试查询参数通过事务内的 set_config 生效"""
+    conn, _ = make_copy_conn()
+    conn.execute = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[])
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    await store.search_similar([0.1, 0.2], top_k=5, ef_search=100, probes=10)
+    
+    conn.transaction.assert_called_once()
+    executed = [call.args[1:] for call in conn.execute.call_args_list]
+    assert executed == [("hnsw.ef_search", "100"), ("ivfflat.probes", "10")]
+
+
+def test_search_filter_to_sql():
+    """测试过滤条件生成参数化 WHERE 子句"""
+    from datetime import datetime
+    from app.rag.search_filter import SearchFilter
+    
+    where, params = SearchFilter(
+        contains={"category": "faq"},
+        equals={"year": 2024},
+        created_after=datetime(2024, 1, 1)
+    ).to_sql(first_param=3)
+    
+    assert where == "WHERE metadata @> $3::jsonb AND metadata->>$4 = $5 AND created_at >= $6"
+    assert params == [{"category": "faq"}, "year", "2024", datetime(2024, 1, 1)]
+    assert SearchFilter().to_sql(first_param=3) == ("", [])
+
+
+@pytest.mark.asyncio
+async def test_filtered_search_overfetches_and_falls_back_to_exact_scan():
+    """测试过滤检索放大候选集，结果不足 top_k 时回退精确检索"""
+    conn, _ = make_copy_conn()
+    conn.execute = AsyncMock()
+    conn.fetch = AsyncMock(side_effect=[
+        [{"id": "1", "distance": 0.1}],
+        [{"id": "1", "distance": 0.1}, {"id": "2", "distance": 0.2}]
+    ])
+    conn.fetchval = AsyncMock(return_value=2)
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    results = await store.search_similar([0.1, 0.2], top_k=2, filters={"contains": {"category": "faq"}})
+    
+    assert [doc["id"] for doc in results] == ["1", "2"]
+    count_sql, *count_args = conn.fetchval.call_args.args
+    assert "WHERE metadata @> $2::jsonb" in count_sql
+    assert count_args == [2, {"category": "faq"}]
+    sql, *args = conn.fetch.call_args_list[0].args
+    assert "WHERE metadata @> $3::jsonb" in sql
+    assert args[2] == {"category": "faq"}
+    executed = [call.args[1:] for call in conn.execute.call_args_list]
+    assert ("hnsw.ef_search", "40") in executed
+    assert ("ivfflat.probes", "10") in executed
+    assert executed[-1] == ("enable_indexscan", "off")
+
+
+@pytest.mark.asyncio
+async def test_filtered_search_skips_exact_scan_when_not_truncated():
+    """测试过滤条件命中的行数不多于 ANN 结果时不做精确检索"""
+    conn, _ = make_copy_conn()
+    conn.execute = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[{"id": "1", "distance": 0.1}])
+    conn.fetchval = AsyncMock(return_value=1)
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    results = await store.search_similar([0.1, 0.2], top_k=5, filters={"contains": {"category": "faq"}})
+    
+    assert [doc["id"] for doc in results] == ["1"]
+    conn.fetch.assert_awaited_once()
+    assert ("enable_indexscan", "off") not in [call.args[1:] for call in conn.execute.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_filtered_search_with_iterative_scan_depends_on_pgvector_version():
+    """测试启用迭代扫描时不做精确检索回退；pgvector < 0.8 时改为放大候选集"""
+    from unittest.mock import patch
+    
+    conn, _ = make_copy_conn()
+    conn.execute = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[{"id": "2", "distance": 0.2}, {"id": "1", "distance": 0.1}])
+    conn.fetchval = AsyncMock(return_value=100)
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    filters = {"contains": {"category": "faq"}}
+    
+    with patch("app.rag.vector_store.settings.VECTOR_ITERATIVE_SCAN", "relaxed_order"):
+        store.pgvector_version = "0.8.0"
+        results = await store.search_similar([0.1, 0.2], top_k=5, filters=filters)
+        executed = [call.args[1:] for call in conn.execute.call_args_list]
+        assert ("hnsw.iterative_scan", "relaxed_order") in executed
+        assert ("enable_indexscan", "off") not in executed
+        conn.fetch.assert_awaited_once()
+        conn.fetchval.assert_not_awaited()
+        assert [doc["id"] for doc in results] == ["1", "2"]
+        
+        conn.execute.reset_mock()
+        store.pgvector_version = "0.7.4"
+        await store.search_similar([0.1, 0.2], top_k=5, filters=filters)
+        executed = [call.args[1:] for call in conn.execute.call_args_list]
+        assert not any(name.endswith("iterative_scan") for name, _ in executed)
+        assert ("hnsw.ef_search", "50") in executed
+        assert executed[-1] == ("enable_indexscan", "off")
+
+
+def test_overfetch_search_params_clamped():
+    """测试过滤检索放大后的 ef_search 不超过 pgvector 上限 1000，probes 不超过 FILTER_MAX_PROBES"""
+    from unittest.mock import patch
+    from app.rag.vector_store import _search_params
+    
+    with patch("app.rag.vector_store.settings.FILTER_OVERFETCH_FACTOR", 10), \
+         patch("app.rag.vector_store.settings.FILTER_MAX_PROBES", 8):
+        assert _search_params(None, None, top_k=200, filtered=True) == {"hnsw.ef_search": 1000, "ivfflat.probes": 8}
+        assert _search_params(None, 20, top_k=5, filtered=True) == {"hnsw.ef_search": 50, "ivfflat.probes": 20}
+        assert _search_params(5000, None, top_k=5) == {"hnsw.ef_search": 1000}
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_in_single_query():
+    """测试混合检索以单条语句完成向量 / 全文检索与 RRF 融合"""
+    conn, _ = make_copy_conn()
+    conn.execute = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[{"id": "7", "distance": 0.3, "score": 0.03}])
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    results = await store.hybrid_search([0.1, 0.2], "SKU-1234", top_k=3, text_weight=2.0)
+    
+    assert results == [{"id": "7", "distance": 0.3, "score": 0.03}]
+    conn.fetch.assert_called_once()
+    sql, *args = conn.fetch.call_args.args
+    assert "websearch_to_tsquery" in sql and "vector_hits" in sql
+    assert args[1:] == [3, 50, "SKU-1234", 1.0, 2.0, 60]
+
+
+@pytest.mark.asyncio
+async def test_search_many_single_query_grouped_by_input_order():
+    """测试批量检索以单条 unnest + LATERAL 语句完成，结果按输入顺序分组"""
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        {"ord": 1, "id": "1", "distance": 0.1},
+        {"ord": 1, "id": "2", "distance": 0.2},
+        {"ord": 3, "id": "5", "distance": 0.3}
+    ])
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    
+    results = await store.search_many([[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], top_k=2)
+    
+    conn.fetch.assert_called_once()
+    sql, embeddings, top_k = conn.fetch.call_args.args
+    assert "unnest($1::vector[])" in sql and "LATERAL" in sql
+    assert embeddings == [(0.1, 0.2), (0.3, 0.4), (0.5, 0.6)]
+    assert top_k == 2
+    assert [[doc["id"] for doc in docs] for docs in results] == [["1", "2"], [], ["5"]]
+    assert "ord" not in results[0][0]
+
+
+@pytest.mark.asyncio
+async def test_warmup_touches_every_min_connection():
+    """测试预热让连接池中的最小连接数都完成一次往返"""
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value=1)
+    store = VectorStore()
+    store.connection_pool = make_pool(conn)
+    store.connection_pool.get_min_size = MagicMock(return_value=5)
+    store.connection_pool.get_size = MagicMock(return_value=5)
+    
+    await store.warmup()
+    
+    assert conn.fetchval.await_count == 5